@@ -22,6 +22,14 @@ def create_app():
 
     database.init_app(app)
 
+    from .utils import import_jobs, offline_routing, ors_requests, photo_pipeline, routing
+
+    import_jobs.init_app(app)
+    photo_pipeline.init_app(app)
+    ors_requests.init_app(app)
+    offline_routing.init_app(app)
+    routing.init_app(app)
+
     from .routes import admin, api, main
 
     app.register_blueprint(main.bp)
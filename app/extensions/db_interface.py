@@ -1,8 +1,8 @@
 import abc
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from app.models.photo import Photo
-from app.models.walk import Walk
+from app.models.walk import Walk, WalkQuery, WalkSummary
 
 
 class DBInterface(abc.ABC):
@@ -19,8 +19,49 @@ class DBInterface(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def get_walks(self) -> List[Walk]:
-        """Retrieves all walks from the database, ordered by date descending."""
+    def get_walks(self, query: Optional[WalkQuery] = None) -> List[Walk]:
+        """Retrieves walks matching the query (all walks by default), ordered by date descending."""
+        pass
+
+    @abc.abstractmethod
+    def get_walk_summaries(self, query: Optional[WalkQuery] = None) -> List[WalkSummary]:
+        """Retrieves one page of walks without their geometry, filtered and ordered as the query asks.
+        A missing distance is reported and sorted as 0 so that keyset cursors stay valid."""
+        pass
+
+    @abc.abstractmethod
+    def get_walk_stats(self, query: Optional[WalkQuery] = None) -> Dict[str, float]:
+        """Returns the number and total distance of walks matching the query filters."""
+        pass
+
+    @abc.abstractmethod
+    def get_walk_geometries(
+        self,
+        walk_ids: Optional[List[int]] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        lod: Optional[str] = None,
+    ) -> Dict[int, Any]:
+        """Retrieves path_geojson (or its simplified `lod` level) by walk ID, optionally limited to IDs and/or walks intersecting a (min_lon, min_lat, max_lon, max_lat) box."""
+        pass
+
+    @abc.abstractmethod
+    def get_cell_visits(self) -> Dict[Tuple[int, int], int]:
+        """Returns accumulated visit counts per route-recommendation grid cell (x, y)."""
+        pass
+
+    @abc.abstractmethod
+    def get_heatmap_tile(self, zoom: int, x: int, y: int) -> Optional[bytes]:
+        """Returns the encoded walk-count grid of heatmap tile z/x/y (see app.utils.heatmap), or None if it is empty."""
+        pass
+
+    @abc.abstractmethod
+    def get_heatmap_tiles(self, zoom: int, tiles: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], bytes]:
+        """Returns encoded grids of the given (x, y) heatmap tiles of one zoom level; empty tiles are omitted."""
+        pass
+
+    @abc.abstractmethod
+    def get_heatmap_max_count(self, zoom: int) -> int:
+        """Returns the largest per-cell walk count among heatmap tiles of the given zoom level."""
         pass
 
     @abc.abstractmethod
@@ -33,6 +74,24 @@ class DBInterface(abc.ABC):
         """Adds a new walk to the database and returns its ID."""
         pass
 
+    @abc.abstractmethod
+    def add_walks_bulk(self, walks: List[Walk]) -> List[Optional[int]]:
+        """
+        Adds many walks in a single transaction and returns their IDs in input order.
+        A walk whose fingerprint is already stored (or repeated earlier in the input) is skipped and gets None.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_existing_fingerprints(self, fingerprints: Iterable[str]) -> Set[str]:
+        """Returns the subset of the given walk fingerprints that are already stored."""
+        pass
+
+    @abc.abstractmethod
+    def get_latest_imported_walk_date(self) -> Optional[int]:
+        """Returns the date of the newest walk that has an import fingerprint, or None."""
+        pass
+
     @abc.abstractmethod
     def update_walk(self, walk: Walk) -> None:
         """Updates an existing walk in the database."""
@@ -44,8 +103,52 @@ class DBInterface(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def add_photo(self, walk_id: int, url: str, description: Optional[str], latitude: float, longitude: float, thumbnail_url: str) -> int:
-        """Adds a new photo to the database and returns its ID."""
+    def get_walk_timed_path(self, walk_id: int) -> Optional[Tuple[List[List[float]], List[int]]]:
+        """
+        Returns the path coordinates of a walk together with the unix time of every point,
+        or None if the walk does not exist or has no point times.
+        """
+        pass
+
+    @abc.abstractmethod
+    def add_photo(self, walk_id: int, url: str, description: Optional[str], latitude: float, longitude: float,
+                  thumbnail_url: Optional[str], status: str = "ready", variants: Optional[Dict[str, str]] = None,
+                  content_hash: Optional[str] = None) -> int:
+        """
+        Adds a new photo to the database and returns its ID.
+        A content_hash takes a reference on the shared files of that content.
+        """
+        pass
+
+    @abc.abstractmethod
+    def add_photos_bulk(self, photos: List[Photo]) -> List[int]:
+        """Adds many photos in a single transaction and returns their IDs in input order."""
+        pass
+
+    @abc.abstractmethod
+    def update_photo(self, photo_id: int, url: Optional[str] = None, thumbnail_url: Optional[str] = None,
+                     status: Optional[str] = None, variants: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Updates the given fields of a photo; variants are merged into the stored ones.
+        Returns False if the photo no longer exists.
+        """
+        pass
+
+    @abc.abstractmethod
+    def update_photos_by_content(self, content_hash: str, url: Optional[str] = None,
+                                 thumbnail_url: Optional[str] = None, status: Optional[str] = None,
+                                 variants: Optional[Dict[str, str]] = None) -> int:
+        """Applies update_photo to every photo sharing the content; returns the number of photos updated."""
+        pass
+
+    @abc.abstractmethod
+    def get_photos_by_content_hashes(self, content_hashes: Iterable[str]) -> Dict[str, Photo]:
+        """Returns one stored photo per known content hash, preferring already processed ones."""
+        pass
+
+    @abc.abstractmethod
+    def get_photos_by_status(self, status: str) -> List[Photo]:
+        """Retrieves all photos with the given processing status."""
         pass
 
     @abc.abstractmethod
@@ -55,5 +158,5 @@ class DBInterface(abc.ABC):
 
     @abc.abstractmethod
     def delete_photo(self, photo_id: int) -> bool:
-        """Deletes a photo from the database by its ID."""
+        """Deletes a photo by its ID; shared files are removed only with their last reference."""
         pass
@@ -1,21 +1,54 @@
 import logging
 import os
-from typing import Any, Dict, List, Optional
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from flask import current_app
-from sqlalchemy import Column, Float, ForeignKey, Integer, JSON, String, create_engine
+from sqlalchemy import (
+    Column, Float, ForeignKey, Index, Integer, JSON, LargeBinary, String, bindparam, create_engine, delete, func, insert,
+    literal_column, text, tuple_, update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.orm import Query, declarative_base, relationship, sessionmaker
 from sqlalchemy.orm.session import Session as OrmSession
 
 from app.extensions.db_interface import DBInterface
-from app.models.walk import Walk
+from app.models.walk import Walk, WalkQuery, WalkSummary
 from app.models.photo import Photo
+from app.utils.geometry import geojson_coordinates, path_bounds, same_path, simplify_path_lods
+from app.utils.photo_storage import photo_path
+from app.utils.heatmap import EMPTY_TILE, TileKey, decode_tile, encode_tile, tile_count_deltas
+from app.utils.visit_grid import Cell, mkad_cells, walk_cell_counts
 
 logger = logging.getLogger(__name__)
 Base = declarative_base()
 
+# create_all не меняет уже существующие таблицы, поэтому новые колонки и индексы докатываем сами
+SCHEMA_UPGRADES = [
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_walks_fingerprint ON walks (fingerprint)",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS min_lon DOUBLE PRECISION",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS min_lat DOUBLE PRECISION",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS max_lon DOUBLE PRECISION",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS max_lat DOUBLE PRECISION",
+    "CREATE INDEX IF NOT EXISTS ix_walks_date_id ON walks (date, id)",
+    "DROP INDEX IF EXISTS ix_walks_distance_id",
+    "CREATE INDEX IF NOT EXISTS ix_walks_distance_key_id ON walks ((coalesce(distance, 0)), id)",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS path_lods JSON",
+    "ALTER TABLE walks ADD COLUMN IF NOT EXISTS path_times JSON",
+    "ALTER TABLE photos ADD COLUMN IF NOT EXISTS status VARCHAR(16) NOT NULL DEFAULT 'ready'",
+    "ALTER TABLE photos ADD COLUMN IF NOT EXISTS variants JSON",
+    "ALTER TABLE photos ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_photos_content_hash ON photos (content_hash)",
+]
+# Триграммный индекс для поиска по названию: требует расширения pg_trgm, поэтому не обязателен
+OPTIONAL_SCHEMA_UPGRADES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_walks_name_trgm ON walks USING gin (name gin_trgm_ops)",
+]
+
 
 def create_postgres_engine(db_config: Dict[str, Any]) -> Engine:
     db_config = {k: v for k, v in db_config.items() if v is not None}
@@ -25,6 +58,27 @@ def create_postgres_engine(db_config: Dict[str, Any]) -> Engine:
     return create_engine(connection_string)
 
 
+def _walk_values(walk: Walk) -> Dict[str, Any]:
+    bounds = path_bounds(walk.path_geojson) or (None, None, None, None)
+    return {
+        "name": walk.name,
+        "date": walk.date,
+        "description": walk.description,
+        "path_geojson": walk.path_geojson,
+        "distance": walk.distance,
+        "co2_saved": walk.co2_saved,
+        "min_lon": bounds[0],
+        "min_lat": bounds[1],
+        "max_lon": bounds[2],
+        "max_lat": bounds[3],
+        "path_lods": simplify_path_lods(walk.path_geojson),
+    }
+
+
+def _walk_row(walk: Walk) -> Dict[str, Any]:
+    return {**_walk_values(walk), "fingerprint": walk.fingerprint, "path_times": walk.path_times}
+
+
 class WalkModel(Base):
     __tablename__ = 'walks'
 
@@ -35,9 +89,194 @@ class WalkModel(Base):
     path_geojson = Column(JSON)
     distance = Column(Float)
     co2_saved = Column(Float)
+    fingerprint = Column(String(64), index=True, unique=True)
+    # Габариты пути: выборка геометрии по окну карты без чтения JSON
+    min_lon = Column(Float)
+    min_lat = Column(Float)
+    max_lon = Column(Float)
+    max_lat = Column(Float)
+    # Упрощённые копии path_geojson по уровням детализации (см. app.utils.geometry.PATH_LODS)
+    path_lods = Column(JSON)
+    # Время каждой точки path_geojson (unix) для привязки фото по времени съёмки
+    path_times = Column(JSON)
 
     photos = relationship("PhotoModel", back_populates="walk", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_walks_date_id", "date", "id"),
+        Index("ix_walks_distance_key_id", func.coalesce(distance, literal_column("0")), id),
+    )
+
+
+# Ключ сортировки по дистанции: NULL считается нулём и в ORDER BY, и в keyset-условии, и в ответе,
+# иначе курсор строки без дистанции превращался бы в "None:<id>"
+_DISTANCE_KEY = func.coalesce(WalkModel.distance, literal_column("0"))
+
+
+def _apply_walk_query(query: Query, walk_query: Optional[WalkQuery], paginate: bool = True) -> Query:
+    """Фильтры WalkQuery, а при paginate — ещё сортировка и keyset-условие по (ключ, id) с LIMIT."""
+    walk_query = walk_query or WalkQuery()
+
+    if walk_query.date_from is not None:
+        query = query.filter(WalkModel.date >= walk_query.date_from)
+    if walk_query.date_to is not None:
+        query = query.filter(WalkModel.date <= walk_query.date_to)
+    if walk_query.distance_min is not None:
+        query = query.filter(WalkModel.distance >= walk_query.distance_min)
+    if walk_query.distance_max is not None:
+        query = query.filter(WalkModel.distance <= walk_query.distance_max)
+    if walk_query.name:
+        pattern = walk_query.name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(WalkModel.name.ilike(f"%{pattern}%", escape="\\"))
+    if walk_query.ids is not None:
+        query = query.filter(WalkModel.id.in_(walk_query.ids))
+
+    if not paginate:
+        return query
+
+    sort_field, _, direction = walk_query.sort.partition("_")
+    if sort_field not in ("date", "distance") or direction not in ("asc", "desc"):
+        raise ValueError(f"Unknown walk sort: {walk_query.sort}")
+    sort_column = WalkModel.date if sort_field == "date" else _DISTANCE_KEY
+    descending = direction == "desc"
+
+    if walk_query.after is not None:
+        key = tuple_(sort_column, WalkModel.id)
+        bound = tuple_(*walk_query.after)
+        query = query.filter(key < bound if descending else key > bound)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), WalkModel.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), WalkModel.id.asc())
+
+    if walk_query.limit is not None:
+        query = query.limit(walk_query.limit)
+    return query
+
+
+class WalkCellModel(Base):
+    """Вклад одной прогулки в сетку посещений: число точек пути в клетке (x, y)."""
+    __tablename__ = 'walk_cells'
+
+    walk_id = Column(Integer, ForeignKey('walks.id', ondelete='CASCADE'), primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    visits = Column(Integer, nullable=False)
+
+
+class CellVisitModel(Base):
+    """Накопленные посещения клеток сетки внутри МКАДа; поддерживаются инкрементально при изменении прогулок."""
+    __tablename__ = 'cell_visits'
+
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+def _add_walk_cells(session: OrmSession, walk_id: int, path_geojson: Any, deltas: Dict[Cell, int]) -> None:
+    """Сохраняет вклад прогулки в сетку и прибавляет его к deltas; сами счётчики меняет _apply_cell_deltas."""
+    counts = walk_cell_counts(path_geojson)
+    if not counts:
+        return
+    session.execute(
+        insert(WalkCellModel),
+        [{"walk_id": walk_id, "x": x, "y": y, "visits": visits} for (x, y), visits in counts.items()],
+    )
+    for cell, visits in counts.items():
+        deltas[cell] = deltas.get(cell, 0) + visits
+
+
+def _remove_walk_cells(session: OrmSession, walk_id: int, deltas: Dict[Cell, int]) -> None:
+    """Удаляет вклад прогулки в сетку и вычитает его из deltas."""
+    rows = session.query(WalkCellModel.x, WalkCellModel.y, WalkCellModel.visits).filter_by(walk_id=walk_id).all()
+    if not rows:
+        return
+    for row in rows:
+        deltas[(row.x, row.y)] = deltas.get((row.x, row.y), 0) - row.visits
+    session.execute(delete(WalkCellModel).where(WalkCellModel.walk_id == walk_id))
+
+
+def _apply_cell_deltas(session: OrmSession, deltas: Dict[Cell, int]) -> None:
+    """
+    Прибавляет изменения к счётчикам cell_visits одним upsert на транзакцию. Клетки идут в порядке ключа,
+    поэтому параллельные записи прогулок блокируют строки в одном порядке и не ждут друг друга по кругу,
+    а ON CONFLICT не даёт упасть на дубликате, если ту же клетку одновременно создаёт другая транзакция.
+    """
+    rows = [{"x": x, "y": y, "visits": delta} for (x, y), delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    stmt = pg_insert(CellVisitModel)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[CellVisitModel.x, CellVisitModel.y],
+            set_={"visits": CellVisitModel.visits + stmt.excluded.visits},
+        ),
+        rows,
+    )
+
+
+class HeatmapTileModel(Base):
+    """Тайл тепловой карты: сжатая сетка числа прогулок по ячейкам (см. app.utils.heatmap)."""
+    __tablename__ = 'heatmap_tiles'
+
+    z = Column(Integer, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    counts = Column(LargeBinary, nullable=False)
+    max_count = Column(Integer, nullable=False)
+
+
+_update_heatmap_tile = (
+    update(HeatmapTileModel.__table__)
+    .where(
+        HeatmapTileModel.z == bindparam("tile_z"),
+        HeatmapTileModel.x == bindparam("tile_x"),
+        HeatmapTileModel.y == bindparam("tile_y"),
+    )
+    .values(counts=bindparam("counts"), max_count=bindparam("max_count"))
+)
+
+
+def _apply_heatmap_deltas(session: OrmSession, deltas: Dict[TileKey, Any]) -> None:
+    """
+    Прибавляет изменения счётчиков к тайлам; строки тайлов блокируются до конца транзакции.
+    Каждая пачка тайлов сначала одним upsert в порядке ключа создаёт недостающие пустыми и блокирует
+    существующие: параллельные записи прогулок берут блокировки в одном порядке, а тайл, одновременно
+    создаваемый другой транзакцией, не приводит к ошибке первичного ключа.
+    """
+    keys = sorted(key for key, delta in deltas.items() if delta.any())
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        stmt = pg_insert(HeatmapTileModel).values([
+            {"z": z, "x": x, "y": y, "counts": EMPTY_TILE, "max_count": 0} for z, x, y in chunk
+        ])
+        # SET без изменений: существующая строка только блокируется
+        locked = session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[HeatmapTileModel.z, HeatmapTileModel.x, HeatmapTileModel.y],
+                set_={"max_count": HeatmapTileModel.max_count},
+            ).returning(HeatmapTileModel.z, HeatmapTileModel.x, HeatmapTileModel.y, HeatmapTileModel.counts)
+        )
+        current = {(row.z, row.x, row.y): row.counts for row in locked}
+
+        updates, emptied = [], []
+        for key in chunk:
+            counts = (decode_tile(current[key]) + deltas[key]).clip(min=0)
+            max_count = int(counts.max())
+            if max_count:
+                updates.append({"tile_z": key[0], "tile_x": key[1], "tile_y": key[2],
+                                "counts": encode_tile(counts), "max_count": max_count})
+            else:
+                emptied.append(key)
+        if updates:
+            session.execute(_update_heatmap_tile, updates)
+        if emptied:
+            session.execute(
+                delete(HeatmapTileModel)
+                .where(tuple_(HeatmapTileModel.z, HeatmapTileModel.x, HeatmapTileModel.y).in_(emptied))
+            )
+
 
 class PhotoModel(Base):
     __tablename__ = 'photos'
@@ -49,10 +288,82 @@ class PhotoModel(Base):
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     thumbnail_url = Column(String(255))
+    # Пока фоновая обработка не закончена, url указывает на исходную загрузку
+    status = Column(String(16), nullable=False, default="ready", server_default="ready")
+    variants = Column(JSON)
+    # Файлы фото с одинаковым содержимым общие (см. app.utils.photo_storage и PhotoFileModel)
+    content_hash = Column(String(64), index=True)
 
     walk = relationship("WalkModel", back_populates="photos")
 
 
+class PhotoFileModel(Base):
+    """Счётчик ссылок на файлы одного содержимого: файлы удаляются вместе с последним ссылающимся фото."""
+    __tablename__ = 'photo_files'
+
+    content_hash = Column(String(64), primary_key=True)
+    refcount = Column(Integer, nullable=False)
+
+
+def _acquire_photo_files(session: OrmSession, content_hashes: Iterable[Optional[str]]) -> None:
+    """
+    Увеличивает счётчики ссылок одним upsert. SELECT ... FOR UPDATE не блокирует ещё не созданную строку,
+    и две одновременные первые загрузки одного содержимого падали на первичном ключе; ON CONFLICT
+    прибавляет счётчик к строке, вставленной соседней транзакцией. Хеши идут по порядку, как в _apply_cell_deltas.
+    """
+    counts = Counter(content_hash for content_hash in content_hashes if content_hash)
+    if not counts:
+        return
+    stmt = pg_insert(PhotoFileModel)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PhotoFileModel.content_hash],
+            set_={"refcount": PhotoFileModel.refcount + stmt.excluded.refcount},
+        ),
+        [{"content_hash": content_hash, "refcount": count} for content_hash, count in sorted(counts.items())],
+    )
+
+
+def _release_photo_files(session: OrmSession, content_hashes: Iterable[Optional[str]]) -> Set[str]:
+    """Уменьшает счётчики ссылок и возвращает хеши, на которые больше не ссылается ни одно фото."""
+    counts = Counter(content_hash for content_hash in content_hashes if content_hash)
+    if not counts:
+        return set()
+    released = set()
+    for photo_file in (
+        session.query(PhotoFileModel)
+        .filter(PhotoFileModel.content_hash.in_(list(counts)))
+        .order_by(PhotoFileModel.content_hash)
+        .with_for_update()
+    ):
+        photo_file.refcount -= counts.pop(photo_file.content_hash)
+        if photo_file.refcount <= 0:
+            session.delete(photo_file)
+            released.add(photo_file.content_hash)
+    # Счётчика нет (не должно случаться) — файлы считаем ничьими, иначе они не удалятся никогда
+    return released | set(counts)
+
+
+def _apply_photo_fields(photo: PhotoModel, url: Optional[str], thumbnail_url: Optional[str], status: Optional[str],
+                        variants: Optional[Dict[str, str]]) -> None:
+    if url is not None:
+        photo.url = url
+    if thumbnail_url is not None:
+        photo.thumbnail_url = thumbnail_url
+    if status is not None:
+        photo.status = status
+    if variants:
+        # Новый словарь, а не изменение старого: иначе SQLAlchemy не заметит правку JSON
+        photo.variants = {**(photo.variants or {}), **variants}
+
+
+def _photo_from_model(p: PhotoModel) -> Photo:
+    return Photo.from_postgres_row(
+        (p.id, p.walk_id, p.url, p.description, p.latitude, p.longitude, p.thumbnail_url, p.status, p.variants,
+         p.content_hash)
+    )
+
+
 class PostgresDB(DBInterface):
     @classmethod
     def open(cls, **kwargs) -> "PostgresDB":
@@ -69,20 +380,158 @@ class PostgresDB(DBInterface):
         self.upload_folder = current_app.config.get("UPLOAD_FOLDER", "app/static/uploads/photos")
 
     def _get_full_path_from_url(self, file_url: str) -> str:
-        filename = os.path.basename(file_url)
-        return os.path.join(current_app.root_path, self.upload_folder, filename)
+        return photo_path(os.path.join(current_app.root_path, self.upload_folder), file_url)
+
+    def _remove_photo_files(self, photo: PhotoModel) -> None:
+        urls = {photo.url, photo.thumbnail_url, *(photo.variants or {}).values()}
+        for url in urls:
+            if not url:
+                continue
+            path = self._get_full_path_from_url(url)
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning("Failed to delete file %s: %s", path, e)
 
     def init_db(self):
         try:
             Base.metadata.create_all(self.engine)
+            with self.engine.begin() as conn:
+                for statement in SCHEMA_UPGRADES:
+                    conn.execute(text(statement))
+            for statement in OPTIONAL_SCHEMA_UPGRADES:
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(text(statement))
+                except SQLAlchemyError as e:
+                    logger.warning("Optional schema upgrade skipped (%s): %s", statement, e)
+            self._backfill_derived_columns()
+            self._init_cell_visits()
+            self._init_heatmap()
         except SQLAlchemyError:
             logger.exception("Failed to init DB schema")
             raise
 
-    def get_walks(self) -> List[Walk]:
+    def _backfill_derived_columns(self) -> None:
+        session = self.Session()
+        try:
+            walks = (
+                session.query(WalkModel)
+                .filter((WalkModel.min_lon.is_(None)) | (WalkModel.path_lods.is_(None)))
+                .all()
+            )
+            for walk in walks:
+                bounds = path_bounds(walk.path_geojson)
+                if bounds:
+                    walk.min_lon, walk.min_lat, walk.max_lon, walk.max_lat = bounds
+                walk.path_lods = simplify_path_lods(walk.path_geojson)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _init_cell_visits(self) -> None:
+        """Заполняет сетку посещений при первом запуске: клетки МКАДа и вклад всех существующих прогулок."""
+        session = self.Session()
+        try:
+            if session.query(CellVisitModel.x).first() is not None:
+                return
+            session.execute(delete(WalkCellModel))
+            session.execute(insert(CellVisitModel), [{"x": x, "y": y, "visits": 0} for x, y in mkad_cells()])
+            walk_ids = [row.id for row in session.query(WalkModel.id).all()]
+            deltas: Dict[Cell, int] = {}
+            for start in range(0, len(walk_ids), 500):
+                chunk = walk_ids[start:start + 500]
+                for walk_id, path_geojson in session.query(WalkModel.id, WalkModel.path_geojson).filter(WalkModel.id.in_(chunk)).all():
+                    _add_walk_cells(session, walk_id, path_geojson, deltas)
+            _apply_cell_deltas(session, deltas)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _init_heatmap(self) -> None:
+        """Строит тепловую карту по существующим прогулкам, если таблица тайлов ещё пуста."""
+        session = self.Session()
+        try:
+            if session.query(HeatmapTileModel.z).first() is not None:
+                return
+            walk_ids = [row.id for row in session.query(WalkModel.id).all()]
+            for start in range(0, len(walk_ids), 500):
+                chunk = walk_ids[start:start + 500]
+                paths = [row.path_geojson for row in session.query(WalkModel.path_geojson).filter(WalkModel.id.in_(chunk))]
+                _apply_heatmap_deltas(session, tile_count_deltas(added=paths))
+                session.flush()
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_cell_visits(self) -> Dict[Cell, int]:
+        session = self.Session()
+        try:
+            rows = session.query(CellVisitModel.x, CellVisitModel.y, CellVisitModel.visits).all()
+            return {(row.x, row.y): row.visits for row in rows}
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get cell visits")
+            raise
+        finally:
+            session.close()
+
+    def get_heatmap_tile(self, zoom: int, x: int, y: int) -> Optional[bytes]:
+        session = self.Session()
+        try:
+            return session.query(HeatmapTileModel.counts).filter_by(z=zoom, x=x, y=y).scalar()
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get heatmap tile %s/%s/%s", zoom, x, y)
+            raise
+        finally:
+            session.close()
+
+    def get_heatmap_tiles(self, zoom: int, tiles: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], bytes]:
+        tiles = list(set(tiles))
+        if not tiles:
+            return {}
+
+        session = self.Session()
+        try:
+            rows = (
+                session.query(HeatmapTileModel.x, HeatmapTileModel.y, HeatmapTileModel.counts)
+                .filter(HeatmapTileModel.z == zoom, tuple_(HeatmapTileModel.x, HeatmapTileModel.y).in_(tiles))
+                .all()
+            )
+            return {(row.x, row.y): row.counts for row in rows}
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get %s heatmap tiles for zoom %s", len(tiles), zoom)
+            raise
+        finally:
+            session.close()
+
+    def get_heatmap_max_count(self, zoom: int) -> int:
+        session = self.Session()
+        try:
+            return session.query(func.max(HeatmapTileModel.max_count)).filter_by(z=zoom).scalar() or 0
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get heatmap max count for zoom %s", zoom)
+            raise
+        finally:
+            session.close()
+
+    def get_walks(self, query: Optional[WalkQuery] = None) -> List[Walk]:
         session = self.Session()
         try:
-            walks = session.query(WalkModel).order_by(WalkModel.date.desc()).all()
+            walks = _apply_walk_query(session.query(WalkModel), query).all()
             return [
                 Walk.from_postgres_row((w.id, w.name, w.date, w.description, w.path_geojson, w.distance, w.co2_saved))
                 for w in walks
@@ -94,6 +543,75 @@ class PostgresDB(DBInterface):
         finally:
             session.close()
 
+    def get_walk_summaries(self, query: Optional[WalkQuery] = None) -> List[WalkSummary]:
+        session = self.Session()
+        try:
+            rows = _apply_walk_query(
+                session.query(
+                    WalkModel.id,
+                    WalkModel.name,
+                    WalkModel.date,
+                    WalkModel.description,
+                    _DISTANCE_KEY,
+                    WalkModel.co2_saved,
+                ),
+                query,
+            ).all()
+            return [WalkSummary.from_postgres_row(tuple(row)) for row in rows]
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get walk summaries")
+            raise
+        finally:
+            session.close()
+
+    def get_walk_stats(self, query: Optional[WalkQuery] = None) -> Dict[str, float]:
+        session = self.Session()
+        try:
+            count, total_distance = _apply_walk_query(
+                session.query(func.count(WalkModel.id), func.coalesce(func.sum(WalkModel.distance), 0.0)),
+                query,
+                paginate=False,
+            ).one()
+            return {"count": int(count), "total_distance": float(total_distance)}
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get walk stats")
+            raise
+        finally:
+            session.close()
+
+    def get_walk_geometries(
+        self,
+        walk_ids: Optional[List[int]] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        lod: Optional[str] = None,
+    ) -> Dict[int, Any]:
+        session = self.Session()
+        try:
+            path = WalkModel.path_geojson
+            if lod is not None:
+                # Извлекаем только нужный уровень на стороне БД; для коротких путей уровня нет — отдаём исходный
+                path = func.coalesce(WalkModel.path_lods[lod], WalkModel.path_geojson, type_=JSON)
+            query = session.query(WalkModel.id, path.label("path"))
+            if walk_ids is not None:
+                query = query.filter(WalkModel.id.in_(walk_ids))
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                query = query.filter(
+                    WalkModel.max_lon >= min_lon,
+                    WalkModel.min_lon <= max_lon,
+                    WalkModel.max_lat >= min_lat,
+                    WalkModel.min_lat <= max_lat,
+                )
+            return {row.id: row.path for row in query.all()}
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get walk geometries")
+            raise
+        finally:
+            session.close()
+
     def get_walk_by_id(self, walk_id: int) -> Optional[Walk]:
         session = self.Session()
         try:
@@ -113,15 +631,13 @@ class PostgresDB(DBInterface):
     def add_walk(self, walk: Walk) -> int:
         session = self.Session()
         try:
-            new_walk: Walk = WalkModel(
-                name=walk.name,
-                date=walk.date,
-                description=walk.description,
-                path_geojson=walk.path_geojson,
-                distance=walk.distance,
-                co2_saved=walk.co2_saved,
-            )
+            new_walk: Walk = WalkModel(**_walk_row(walk))
             session.add(new_walk)
+            session.flush()
+            cell_deltas: Dict[Cell, int] = {}
+            _add_walk_cells(session, new_walk.id, walk.path_geojson, cell_deltas)
+            _apply_cell_deltas(session, cell_deltas)
+            _apply_heatmap_deltas(session, tile_count_deltas(added=[walk.path_geojson]))
             session.commit()
             return new_walk.id
         except SQLAlchemyError:
@@ -131,6 +647,79 @@ class PostgresDB(DBInterface):
         finally:
             session.close()
 
+    def add_walks_bulk(self, walks: List[Walk]) -> List[Optional[int]]:
+        if not walks:
+            return []
+
+        session = self.Session()
+        try:
+            walk_ids: List[Optional[int]] = [None] * len(walks)
+            fingerprinted = [i for i, walk in enumerate(walks) if walk.fingerprint]
+            plain = [i for i, walk in enumerate(walks) if not walk.fingerprint]
+            # executemany с RETURNING (insertmanyvalues): несколько многострочных INSERT, один COMMIT
+            if fingerprinted:
+                # Тот же файл может импортироваться параллельно (другой воркер, повторная отправка):
+                # уже сохранённые кем-то прогулки пропускаются, а не роняют всю пачку на уникальном индексе
+                inserted = session.execute(
+                    pg_insert(WalkModel)
+                    .on_conflict_do_nothing(index_elements=[WalkModel.fingerprint])
+                    .returning(WalkModel.id, WalkModel.fingerprint),
+                    [_walk_row(walks[i]) for i in fingerprinted],
+                ).all()
+                ids_by_fingerprint = {row.fingerprint: row.id for row in inserted}
+                for i in fingerprinted:
+                    # pop: из повторов одного отпечатка во входных данных вставлен только первый
+                    walk_ids[i] = ids_by_fingerprint.pop(walks[i].fingerprint, None)
+            if plain:
+                plain_ids = session.scalars(
+                    insert(WalkModel).returning(WalkModel.id, sort_by_parameter_order=True),
+                    [_walk_row(walks[i]) for i in plain],
+                ).all()
+                for i, walk_id in zip(plain, plain_ids):
+                    walk_ids[i] = walk_id
+
+            added = [(walk_id, walk) for walk_id, walk in zip(walk_ids, walks) if walk_id is not None]
+            cell_deltas: Dict[Cell, int] = {}
+            for walk_id, walk in added:
+                _add_walk_cells(session, walk_id, walk.path_geojson, cell_deltas)
+            _apply_cell_deltas(session, cell_deltas)
+            _apply_heatmap_deltas(session, tile_count_deltas(added=[walk.path_geojson for _, walk in added]))
+            session.commit()
+            return walk_ids
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to bulk add %s walks", len(walks))
+            raise
+        finally:
+            session.close()
+
+    def get_existing_fingerprints(self, fingerprints: Iterable[str]) -> Set[str]:
+        fingerprints = list(set(fingerprints))
+        if not fingerprints:
+            return set()
+
+        session = self.Session()
+        try:
+            rows = session.query(WalkModel.fingerprint).filter(WalkModel.fingerprint.in_(fingerprints)).all()
+            return {row.fingerprint for row in rows}
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to look up walk fingerprints")
+            raise
+        finally:
+            session.close()
+
+    def get_latest_imported_walk_date(self) -> Optional[int]:
+        session = self.Session()
+        try:
+            return session.query(func.max(WalkModel.date)).filter(WalkModel.fingerprint.isnot(None)).scalar()
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get latest imported walk date")
+            raise
+        finally:
+            session.close()
+
     def update_walk(self, walk: Walk) -> None:
         if walk.id is None:
             raise ValueError("Для обновления прогулки требуется ID.")
@@ -139,12 +728,17 @@ class PostgresDB(DBInterface):
         try:
             db_walk = session.query(WalkModel).filter_by(id=walk.id).first()
             if db_walk:
-                db_walk.name = walk.name
-                db_walk.date = walk.date
-                db_walk.description = walk.description
-                db_walk.path_geojson = walk.path_geojson
-                db_walk.distance = walk.distance
-                db_walk.co2_saved = walk.co2_saved
+                heatmap_deltas = tile_count_deltas(added=[walk.path_geojson], removed=[db_walk.path_geojson])
+                # Времена точек остаются верными, только пока сам путь не изменился
+                if walk.path_times is not None or not same_path(db_walk.path_geojson, walk.path_geojson):
+                    db_walk.path_times = walk.path_times
+                for column, value in _walk_values(walk).items():
+                    setattr(db_walk, column, value)
+                cell_deltas: Dict[Cell, int] = {}
+                _remove_walk_cells(session, walk.id, cell_deltas)
+                _add_walk_cells(session, walk.id, walk.path_geojson, cell_deltas)
+                _apply_cell_deltas(session, cell_deltas)
+                _apply_heatmap_deltas(session, heatmap_deltas)
                 session.commit()
         except SQLAlchemyError:
             session.rollback()
@@ -159,25 +753,16 @@ class PostgresDB(DBInterface):
             walk = session.query(WalkModel).filter_by(id=walk_id).first()
             if walk:
                 photos_to_delete = session.query(PhotoModel).filter_by(walk_id=walk.id).all()
+                released = _release_photo_files(session, [photo.content_hash for photo in photos_to_delete])
                 for photo in photos_to_delete:
-                    if photo.url:
-                        photo_path = self._get_full_path_from_url(photo.url)
-                        if os.path.exists(photo_path):
-                            try:
-                                os.remove(photo_path)
-                            except OSError as e:
-                                logger.warning("Failed to delete file %s: %s", photo_path, e)
-
-                    if photo.thumbnail_url:
-                        thumb_path = self._get_full_path_from_url(photo.thumbnail_url)
-                        if os.path.exists(thumb_path):
-                            try:
-                                os.remove(thumb_path)
-                            except OSError as e:
-                                logger.warning("Failed to delete thumbnail %s: %s", thumb_path, e)
-
+                    if not photo.content_hash or photo.content_hash in released:
+                        self._remove_photo_files(photo)
                     session.delete(photo)
 
+                cell_deltas: Dict[Cell, int] = {}
+                _remove_walk_cells(session, walk.id, cell_deltas)
+                _apply_cell_deltas(session, cell_deltas)
+                _apply_heatmap_deltas(session, tile_count_deltas(removed=[walk.path_geojson]))
                 session.delete(walk)
                 session.commit()
                 return True
@@ -193,8 +778,28 @@ class PostgresDB(DBInterface):
         finally:
             session.close()
 
+    def get_walk_timed_path(self, walk_id: int) -> Optional[Tuple[List[List[float]], List[int]]]:
+        session = self.Session()
+        try:
+            row = session.query(WalkModel.path_geojson, WalkModel.path_times).filter_by(id=walk_id).first()
+            if row is None or not row.path_times:
+                return None
+            coordinates = geojson_coordinates(row.path_geojson)
+            if len(coordinates) != len(row.path_times):
+                logger.warning("Walk id=%s has %s points but %s point times", walk_id, len(coordinates), len(row.path_times))
+                return None
+            return coordinates, row.path_times
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get timed path for walk id=%s", walk_id)
+            raise
+        finally:
+            session.close()
+
     def add_photo(
-        self, walk_id: int, url: str, description: Optional[str], latitude: float, longitude: float, thumbnail_url: str
+        self, walk_id: int, url: str, description: Optional[str], latitude: float, longitude: float,
+        thumbnail_url: Optional[str], status: str = "ready", variants: Optional[Dict[str, str]] = None,
+        content_hash: Optional[str] = None
     ) -> int:
         session = self.Session()
         try:
@@ -205,7 +810,11 @@ class PostgresDB(DBInterface):
                 latitude=latitude,
                 longitude=longitude,
                 thumbnail_url=thumbnail_url,
+                status=status,
+                variants=variants,
+                content_hash=content_hash,
             )
+            _acquire_photo_files(session, [content_hash])
             session.add(new_photo)
             session.commit()
             return new_photo.id
@@ -216,14 +825,57 @@ class PostgresDB(DBInterface):
         finally:
             session.close()
 
+    def add_photos_bulk(self, photos: List[Photo]) -> List[int]:
+        if not photos:
+            return []
+
+        session = self.Session()
+        try:
+            rows = [
+                {
+                    "walk_id": photo.walk_id,
+                    "url": photo.url,
+                    "description": photo.description,
+                    "latitude": photo.latitude,
+                    "longitude": photo.longitude,
+                    "thumbnail_url": photo.thumbnail_url,
+                    "status": photo.status,
+                    "variants": photo.variants,
+                    "content_hash": photo.content_hash,
+                }
+                for photo in photos
+            ]
+            _acquire_photo_files(session, [photo.content_hash for photo in photos])
+            photo_ids = session.scalars(
+                insert(PhotoModel).returning(PhotoModel.id, sort_by_parameter_order=True),
+                rows,
+            ).all()
+            session.commit()
+            return list(photo_ids)
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to bulk add %s photos", len(photos))
+            raise
+        finally:
+            session.close()
+
+    def get_photos_by_status(self, status: str) -> List[Photo]:
+        session = self.Session()
+        try:
+            photos = session.query(PhotoModel).filter_by(status=status).order_by(PhotoModel.id).all()
+            return [_photo_from_model(p) for p in photos]
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get photos with status=%s", status)
+            raise
+        finally:
+            session.close()
+
     def get_photos_by_walk_id(self, walk_id: int) -> List[Photo]:
         session = self.Session()
         try:
             photos = session.query(PhotoModel).filter_by(walk_id=walk_id).order_by(PhotoModel.walk_id).all()
-            return [
-                Photo.from_postgres_row((p.id, p.walk_id, p.url, p.description, p.latitude, p.longitude, p.thumbnail_url))
-                for p in photos
-            ]
+            return [_photo_from_model(p) for p in photos]
         except SQLAlchemyError:
             session.rollback()
             logger.exception("Failed to get photos for walk_id=%s", walk_id)
@@ -231,27 +883,74 @@ class PostgresDB(DBInterface):
         finally:
             session.close()
 
+    def update_photo(self, photo_id: int, url: Optional[str] = None, thumbnail_url: Optional[str] = None,
+                     status: Optional[str] = None, variants: Optional[Dict[str, str]] = None) -> bool:
+        session = self.Session()
+        try:
+            photo = session.query(PhotoModel).filter_by(id=photo_id).with_for_update().first()
+            if not photo:
+                return False
+            _apply_photo_fields(photo, url, thumbnail_url, status, variants)
+            session.commit()
+            return True
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to update photo id=%s", photo_id)
+            raise
+        finally:
+            session.close()
+
+    def update_photos_by_content(self, content_hash: str, url: Optional[str] = None,
+                                 thumbnail_url: Optional[str] = None, status: Optional[str] = None,
+                                 variants: Optional[Dict[str, str]] = None) -> int:
+        session = self.Session()
+        try:
+            photos = session.query(PhotoModel).filter_by(content_hash=content_hash).with_for_update().all()
+            for photo in photos:
+                _apply_photo_fields(photo, url, thumbnail_url, status, variants)
+            session.commit()
+            return len(photos)
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to update photos with content_hash=%s", content_hash)
+            raise
+        finally:
+            session.close()
+
+    def get_photos_by_content_hashes(self, content_hashes: Iterable[str]) -> Dict[str, Photo]:
+        content_hashes = list(set(content_hashes))
+        if not content_hashes:
+            return {}
+
+        session = self.Session()
+        try:
+            photos = (
+                session.query(PhotoModel)
+                .filter(PhotoModel.content_hash.in_(content_hashes))
+                .order_by(PhotoModel.id)
+                .all()
+            )
+            result: Dict[str, Photo] = {}
+            for p in photos:
+                current = result.get(p.content_hash)
+                # Предпочитаем уже обработанное фото: его варианты можно сразу переиспользовать
+                if current is None or (current.status != "ready" and p.status == "ready"):
+                    result[p.content_hash] = _photo_from_model(p)
+            return result
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("Failed to get photos by content hash")
+            raise
+        finally:
+            session.close()
+
     def delete_photo(self, photo_id: int) -> bool:
         session = self.Session()
         try:
             photo = session.query(PhotoModel).filter_by(id=photo_id).first()
             if photo:
-                if photo.url:
-                    photo_path = self._get_full_path_from_url(photo.url)
-                    if os.path.exists(photo_path):
-                        try:
-                            os.remove(photo_path)
-                        except OSError as e:
-                            logger.warning("Failed to delete file %s: %s", photo_path, e)
-
-                if photo.thumbnail_url:
-                    thumb_path = self._get_full_path_from_url(photo.thumbnail_url)
-                    if os.path.exists(thumb_path):
-                        try:
-                            os.remove(thumb_path)
-                        except OSError as e:
-                            logger.warning("Failed to delete thumbnail %s: %s", thumb_path, e)
-
+                if not photo.content_hash or _release_photo_files(session, [photo.content_hash]):
+                    self._remove_photo_files(photo)
                 session.delete(photo)
                 session.commit()
                 return True
@@ -0,0 +1,22 @@
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+
+@dataclass
+class ImportJob:
+    id: str
+    status: str = "queued"  # queued | running | done | failed
+    incremental: bool = False
+    created_at: int = 0
+    finished_at: Optional[int] = None
+    parsed_segments: int = 0
+    walks_found: int = 0
+    walks_inserted: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
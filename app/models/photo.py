@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from decimal import Decimal
+from typing import Dict, Optional
 
 
 @dataclass
@@ -11,6 +12,9 @@ class Photo:
     latitude: float
     longitude: float
     thumbnail_url: str
+    status: str = "ready"                 # processing -> ready | failed
+    variants: Optional[Dict[str, str]] = None
+    content_hash: Optional[str] = None    # SHA-256 исходника; у фото до хранилища по хешу нет
 
     @classmethod
     def from_postgres_row(cls, row):
@@ -21,7 +25,10 @@ class Photo:
             description=row[3],                   # description
             latitude=float(Decimal(row[4])),      # latitude
             longitude=float(Decimal(row[5])),     # longitude
-            thumbnail_url=row[6]                  # thumbnail_url
+            thumbnail_url=row[6],                 # thumbnail_url
+            status=row[7] if len(row) > 7 else "ready",        # status
+            variants=row[8] if len(row) > 8 else None,         # variants
+            content_hash=row[9] if len(row) > 9 else None,     # content_hash
         )
 
     @classmethod
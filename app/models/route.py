@@ -1,5 +1,5 @@
 from dataclasses import asdict, dataclass
-from typing import List
+from typing import List, Optional
 
 
 @dataclass
@@ -8,6 +8,18 @@ class Route:
     distance: float
     path_geojson: List[List[float]]
     link: str
+    novelty: Optional[float] = None  # доля длины по ещё не пройденным местам, если маршрут оценивался
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class TimelineWalk:
+    start_time: int
+    end_time: int
+    path_geojson: List[List[float]]
+    point_times: Optional[List[int]] = None  # unix-время каждой точки path_geojson
 
     def to_dict(self):
         return asdict(self)
@@ -1,9 +1,14 @@
 import json
+from dataclasses import asdict, dataclass
 from decimal import Decimal
+from typing import List, Optional, Tuple, Union
+
+WALK_SORTS = ("date_desc", "date_asc", "distance_desc", "distance_asc")
 
 
 class Walk:
-    def __init__(self, id, name, date, description, path_geojson, distance, co2_saved):
+    def __init__(self, id, name, date, description, path_geojson, distance, co2_saved, fingerprint=None,
+                 path_times=None):
         self.id = id
         self.name = name
         self.date = date
@@ -11,6 +16,9 @@ class Walk:
         self.path_geojson = path_geojson
         self.distance = distance
         self.co2_saved = co2_saved
+        self.fingerprint = fingerprint
+        # unix-время каждой точки пути; есть только у импортированных из Timeline прогулок
+        self.path_times = path_times
 
     def to_dict(self):
         return {
@@ -50,3 +58,42 @@ class Walk:
     def __repr__(self):
         return (f"Walk(id={self.id}, descrioption={self.description}, name='{self.name}', date={self.date}, "
                 f"distance={self.distance}, co2_saved={self.co2_saved})")
+
+
+@dataclass
+class WalkSummary:
+    id: int
+    name: str
+    date: int
+    description: str
+    distance: float
+    co2_saved: float
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_postgres_row(cls, row):
+        return cls(
+            id=row[0],                            # id
+            name=row[1],                          # name
+            date=row[2],                          # date
+            description=row[3],                   # description
+            distance=float(Decimal(row[4])),      # distance
+            co2_saved=float(Decimal(row[5]))      # co2_saved
+        )
+
+
+@dataclass
+class WalkQuery:
+    """Фильтры и keyset-пагинация для выборки прогулок."""
+    date_from: Optional[int] = None
+    date_to: Optional[int] = None
+    distance_min: Optional[float] = None
+    distance_max: Optional[float] = None
+    name: Optional[str] = None
+    ids: Optional[List[int]] = None
+    sort: str = "date_desc"
+    # (значение ключа сортировки, id) последней строки предыдущей страницы
+    after: Optional[Tuple[Union[int, float], int]] = None
+    limit: Optional[int] = None
@@ -1,15 +1,20 @@
 import json
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, tzinfo
+from typing import Any, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
 
 from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, session, url_for
-from werkzeug.utils import secure_filename
 
 from app.utils import distance
 from ..extensions.database import get_db_interface
+from ..models.photo import Photo
 from ..models.walk import Walk
-from ..utils.image_utils import convert_image_to_webp, create_thumbnail
-from ..utils.walk_processing import import_walks_from_json
+from ..utils.import_jobs import get_import_jobs
+from ..utils.photo_location import PhotoMetadata, locate_photos, read_photo_metadata
+from ..utils.photo_pipeline import get_photo_pipeline
+from ..utils.photo_storage import StoredUpload, photo_filename, store_upload
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -80,10 +85,7 @@ def add_walk():
                 "type": "LineString",
                 "coordinates": coordinates
             }
-            for i in range(len(coordinates) - 1):
-                p1_lon, p1_lat = coordinates[i]
-                p2_lon, p2_lat = coordinates[i + 1]
-                walk_distance += distance.calculate_distance_km(p1_lat, p1_lon, p2_lat, p2_lon)
+            walk_distance = distance.polyline_length_km(coordinates)
             co2_saved = walk_distance * 0.15
 
         db_interface = get_db_interface()
@@ -134,6 +136,9 @@ def edit_walk_page(walk_id):
 
 @bp.route('/upload', methods=['POST'])
 def upload_file():
+    if not session.get('is_authenticated'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
     if 'file' not in request.files:
         return jsonify({'message': 'Файл не найден в запросе.'}), 400
 
@@ -147,13 +152,24 @@ def upload_file():
 
     if file:
         try:
-            len_walk_routes = import_walks_from_json(file)
-            return jsonify({'message': f'Successfully processed {len_walk_routes} potential walks.'}), 200
+            incremental = request.form.get('incremental', '').strip().lower() in {'1', 'true', 'yes', 'on'}
+            job = get_import_jobs().submit(file, incremental=incremental)
+            return jsonify({'message': 'Файл принят, импорт запущен.', 'job_id': job.id}), 202
         except Exception as e:
             current_app.logger.error(f"Error processing uploaded file: {e}", exc_info=True)
             return jsonify({'message': str(e)}), 500
 
 
+@bp.route('/import_jobs/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    if not session.get('is_authenticated'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = get_import_jobs().get(job_id)
+    if not job:
+        return jsonify({'message': 'Import job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
 @bp.route('/walks/<int:walk_id>', methods=['GET'])
 def get_walk_by_id_admin(walk_id):
     if not session.get('is_authenticated'):
@@ -218,12 +234,7 @@ def update_walk(walk_id):
                         coordinates = geometry.get("coordinates", [])
                         existing_walk.path_geojson = geometry
 
-                walk_distance = 0
-                if len(coordinates) > 1:
-                    for i in range(len(coordinates) - 1):
-                        p1_lon, p1_lat = coordinates[i]
-                        p2_lon, p2_lat = coordinates[i + 1]
-                        walk_distance += distance.calculate_distance_km(p1_lat, p1_lon, p2_lat, p2_lon)
+                walk_distance = distance.polyline_length_km(coordinates)
                 existing_walk.distance = walk_distance
                 existing_walk.co2_saved = walk_distance * 0.15
 
@@ -259,6 +270,42 @@ def delete_walk(walk_id):
         return jsonify({'error': f'An error occurred: {str(e)}'}), 500
 
 
+NO_LOCATION_ERROR = 'No coordinates: send latitude and longitude, or a photo with EXIF GPS or a capture time within the walk'
+
+
+def _parse_coordinates(latitude: Optional[str], longitude: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Координаты из формы или None, если клиент их не прислал; ValueError, если прислал некорректные."""
+    if not latitude and not longitude:
+        return None
+    if not latitude or not longitude:
+        raise ValueError('Both latitude and longitude are required')
+    return float(latitude), float(longitude)
+
+
+def _photo_files_fields(stored: StoredUpload, existing: Optional[Photo]) -> Dict[str, Any]:
+    """
+    Файловые поля нового фото. Если такое же содержимое уже обработано, его WebP и миниатюры
+    переиспользуются без перекодирования; иначе фото ссылается на исходник и ждёт конвейер.
+    """
+    if existing is not None and existing.status == 'ready':
+        if stored.created and photo_filename(existing.url) != stored.filename:
+            # Исходник уже удалялся после обработки и сохранён заново — он не нужен
+            _discard_stored_upload(stored)
+        return {'url': existing.url, 'thumbnail_url': existing.thumbnail_url, 'status': 'ready',
+                'variants': existing.variants}
+    return {'url': stored.url, 'thumbnail_url': None, 'status': 'processing', 'variants': None}
+
+
+def _discard_stored_upload(stored: StoredUpload) -> None:
+    # Файл удаляем, только если его создала эта загрузка: иначе он общий с уже сохранёнными фото
+    if not stored.created:
+        return
+    try:
+        os.remove(stored.path)
+    except OSError:
+        current_app.logger.warning("Failed to cleanup stored upload %s", stored.path, exc_info=True)
+
+
 @bp.route('/upload_photo', methods=['POST'])
 def upload_photo():
     if not session.get('is_authenticated'):
@@ -269,17 +316,14 @@ def upload_photo():
 
     photo = request.files['photo']
     walk_id = request.form.get('walk_id')
-    latitude = request.form.get('latitude')
-    longitude = request.form.get('longitude')
     description = request.form.get('description', '')
 
-    if not walk_id or not latitude or not longitude:
-        return jsonify({'error': 'Missing walk_id, latitude, or longitude'}), 400
+    if not walk_id:
+        return jsonify({'error': 'Missing walk_id'}), 400
 
     try:
         walk_id = int(walk_id)
-        latitude = float(latitude)
-        longitude = float(longitude)
+        coordinates = _parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
     except ValueError:
         return jsonify({'error': 'Invalid walk_id, latitude, or longitude format'}), 400
 
@@ -287,57 +331,193 @@ def upload_photo():
         return jsonify({'error': 'No selected photo file'}), 400
 
     upload_folder = current_app.config.get('UPLOAD_FOLDER', 'app/static/uploads/photos')
-    os.makedirs(upload_folder, exist_ok=True)
-
-    filename = secure_filename(photo.filename)
-    filepath = os.path.join(upload_folder, filename)
-
-    webp_path = None
-    webp_url = None
-    webp_filename = None
-    thumb_url = None
 
     try:
-        photo.save(filepath)
-
-        webp_path, webp_url, webp_filename = convert_image_to_webp(filepath, upload_folder, filename)
-        _, thumb_url = create_thumbnail(webp_path, upload_folder, webp_filename)
+        stored = store_upload(photo.stream, upload_folder)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    photo_id = None
 
+    try:
         db_interface = get_db_interface()
+        if coordinates is not None:
+            latitude, longitude, location_source = coordinates[0], coordinates[1], 'client'
+        else:
+            metadata = read_photo_metadata(stored.path, ZoneInfo(current_app.config['PHOTO_TIMEZONE']))
+            location = locate_photos(
+                [metadata],
+                lambda: db_interface.get_walk_timed_path(walk_id),
+                current_app.config['PHOTO_TIME_TOLERANCE_SECONDS'],
+            )[0]
+            if location is None:
+                _discard_stored_upload(stored)
+                return jsonify({'error': NO_LOCATION_ERROR}), 400
+            latitude, longitude, location_source = location
+
+        existing = db_interface.get_photos_by_content_hashes([stored.content_hash]).get(stored.content_hash)
+        fields = _photo_files_fields(stored, existing)
         photo_id = db_interface.add_photo(
             walk_id=walk_id,
-            url=webp_url,
             description=description,
             latitude=latitude,
             longitude=longitude,
-            thumbnail_url=thumb_url
+            content_hash=stored.content_hash,
+            **fields
         )
+        if fields['status'] == 'processing':
+            get_photo_pipeline().submit(stored.content_hash, stored.path)
 
         return jsonify({
-            'message': 'Photo uploaded successfully',
+            'message': 'Photo uploaded' if fields['status'] == 'ready' else 'Photo uploaded and queued for processing',
             'photo_id': photo_id,
-            'url': webp_url,
-            'thumbnail_url': thumb_url
-        }), 200
+            'status': fields['status'],
+            'url': fields['url'],
+            'thumbnail_url': fields['thumbnail_url'],
+            'latitude': latitude,
+            'longitude': longitude,
+            'location_source': location_source
+        }), 200 if fields['status'] == 'ready' else 202
 
     except Exception as e:
         current_app.logger.error(f"Error uploading photo: {e}", exc_info=True)
 
         try:
-            if webp_path and os.path.exists(webp_path):
-                os.remove(webp_path)
-        except Exception:
-            current_app.logger.warning("Failed to cleanup webp file after upload error", exc_info=True)
-
-        try:
-            if filepath and os.path.exists(filepath):
-                os.remove(filepath)
+            if photo_id is not None:
+                get_db_interface().delete_photo(photo_id)
+            else:
+                _discard_stored_upload(stored)
         except Exception:
-            current_app.logger.warning("Failed to cleanup original file after upload error", exc_info=True)
+            current_app.logger.warning("Failed to cleanup photo after upload error", exc_info=True)
 
         return jsonify({'error': f'An error occurred during photo upload: {str(e)}'}), 500
 
 
+def _store_photo_upload(photo, upload_folder: str, default_tz: tzinfo) -> Tuple[StoredUpload, PhotoMetadata]:
+    stored = store_upload(photo.stream, upload_folder)
+    return stored, read_photo_metadata(stored.path, default_tz)
+
+
+@bp.route('/upload_photos', methods=['POST'])
+def upload_photos():
+    """
+    Пакетная загрузка фото одной прогулки: файлы в полях photos, а latitude, longitude и description
+    повторяются по разу на файл в том же порядке. Координаты необязательны: без них берутся GPS из EXIF
+    или положение на пути прогулки в момент съёмки. Файлы сохраняются и проверяются, а EXIF читается
+    параллельно (PHOTO_BATCH_CONCURRENCY потоков), все строки фото вставляются одной транзакцией,
+    после чего фото уходят в фоновый конвейер. В ответе — результат по каждому файлу.
+    """
+    if not session.get('is_authenticated'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    photos = request.files.getlist('photos')
+    if not photos:
+        return jsonify({'error': 'No photo files provided'}), 400
+    max_batch_size = current_app.config['PHOTO_BATCH_MAX_SIZE']
+    if len(photos) > max_batch_size:
+        return jsonify({'error': f'Too many photos in one batch (max {max_batch_size})'}), 400
+
+    try:
+        walk_id = int(request.form.get('walk_id', ''))
+    except ValueError:
+        return jsonify({'error': 'Missing or invalid walk_id'}), 400
+
+    latitudes = request.form.getlist('latitude')
+    longitudes = request.form.getlist('longitude')
+    descriptions = request.form.getlist('description')
+    if len(latitudes) != len(longitudes) or (latitudes and len(latitudes) != len(photos)):
+        return jsonify({'error': 'latitude and longitude must be given once per photo or not at all'}), 400
+    if descriptions and len(descriptions) != len(photos):
+        return jsonify({'error': 'description must be given once per photo or not at all'}), 400
+
+    db_interface = get_db_interface()
+    if db_interface.get_walk_by_id(walk_id) is None:
+        return jsonify({'error': 'Walk not found'}), 404
+
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'app/static/uploads/photos')
+
+    results = [{'index': i, 'filename': photo.filename} for i, photo in enumerate(photos)]
+    coordinates = {}
+    for i, photo in enumerate(photos):
+        if photo.filename == '':
+            results[i]['error'] = 'No selected photo file'
+            continue
+        try:
+            coordinates[i] = _parse_coordinates(latitudes[i], longitudes[i]) if latitudes else None
+        except ValueError:
+            results[i]['error'] = 'Invalid latitude or longitude format'
+
+    stored: Dict[int, StoredUpload] = {}
+    metadata = {}
+    if coordinates:
+        default_tz = ZoneInfo(current_app.config['PHOTO_TIMEZONE'])
+        workers = min(current_app.config['PHOTO_BATCH_CONCURRENCY'], len(coordinates))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-upload") as executor:
+            futures = {i: executor.submit(_store_photo_upload, photos[i], upload_folder, default_tz) for i in coordinates}
+        for i, future in futures.items():
+            try:
+                stored[i], metadata[i] = future.result()
+            except Exception as e:
+                current_app.logger.warning(f"Failed to store photo {photos[i].filename}: {e}")
+                results[i]['error'] = str(e)
+
+    locations = {i: (*coordinates[i], 'client') for i in stored if coordinates[i] is not None}
+    to_locate = [i for i in stored if coordinates[i] is None]
+    if to_locate:
+        located = locate_photos(
+            [metadata[i] for i in to_locate],
+            lambda: db_interface.get_walk_timed_path(walk_id),
+            current_app.config['PHOTO_TIME_TOLERANCE_SECONDS'],
+        )
+        unlocated = [i for i, location in zip(to_locate, located) if location is None]
+        locations.update((i, location) for i, location in zip(to_locate, located) if location is not None)
+        for i in unlocated:
+            results[i]['error'] = NO_LOCATION_ERROR
+        discarded = [stored.pop(i) for i in unlocated]
+        # Одинаковые файлы в пачке сохраняются один раз: удаляем, только если он не нужен остальным
+        kept_hashes = {upload.content_hash for upload in stored.values()}
+        for upload in discarded:
+            if upload.content_hash not in kept_hashes:
+                _discard_stored_upload(upload)
+
+    existing = db_interface.get_photos_by_content_hashes(upload.content_hash for upload in stored.values())
+    new_photos = []
+    for i, upload in stored.items():
+        fields = _photo_files_fields(upload, existing.get(upload.content_hash))
+        new_photos.append(Photo(
+            id=None,
+            walk_id=walk_id,
+            description=descriptions[i] if descriptions else '',
+            latitude=locations[i][0],
+            longitude=locations[i][1],
+            content_hash=upload.content_hash,
+            **fields,
+        ))
+    try:
+        photo_ids = db_interface.add_photos_bulk(new_photos)
+    except Exception as e:
+        current_app.logger.error(f"Error saving uploaded photos: {e}", exc_info=True)
+        for i, upload in stored.items():
+            results[i]['error'] = 'Failed to save photo'
+            _discard_stored_upload(upload)
+        return jsonify({'error': 'An error occurred while saving photos', 'results': results}), 500
+
+    pipeline = get_photo_pipeline()
+    for (i, upload), new_photo, photo_id in zip(stored.items(), new_photos, photo_ids):
+        if new_photo.status == 'processing':
+            pipeline.submit(upload.content_hash, upload.path)
+        results[i].update(photo_id=photo_id, status=new_photo.status, url=new_photo.url,
+                          thumbnail_url=new_photo.thumbnail_url, latitude=new_photo.latitude,
+                          longitude=new_photo.longitude, location_source=locations[i][2])
+
+    uploaded = len(photo_ids)
+    return jsonify({
+        'message': f'{uploaded} of {len(photos)} photos uploaded',
+        'uploaded': uploaded,
+        'failed': len(photos) - uploaded,
+        'results': results,
+    }), 202 if uploaded else 400
+
+
 @bp.route('/photos/<int:photo_id>', methods=['DELETE'])
 def delete_photo(photo_id):
     if not session.get('is_authenticated'):
@@ -1,13 +1,17 @@
-from typing import Any, Dict, List, Optional
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Optional
 
-from flask import Blueprint, abort, current_app, jsonify, request
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
 
 from app.utils.auth import require_api_key
-from app.utils.recommended_route import get_recommended_route
-from app.utils.walk_processing import import_walks_from_json
+from app.utils.recommended_route import VisitGridProvider, get_recommended_route
+from app.utils.import_jobs import get_import_jobs
+from app.utils.novelty import NoveltyScorer
+from app.utils.ors_requests import get_ors_client
+from app.utils.routing import get_router
 from ..extensions.database import get_db_interface
 from ..models.route import Route
-from ..models.walk import Walk
 
 bp = Blueprint("api", __name__, url_prefix="/api")
 
@@ -54,59 +58,96 @@ def upload_location_history():
     if not file.filename.lower().endswith(".json"):
         abort(400, description="Only .json files are supported.")
 
+    incremental = request.form.get("incremental", "").strip().lower() in {"1", "true", "yes", "on"}
+
     try:
-        len_walk_routes = import_walks_from_json(file)
+        job = get_import_jobs().submit(file, incremental=incremental)
     except Exception:
-        current_app.logger.exception("Failed to import walks from uploaded location history.")
+        current_app.logger.exception("Failed to queue uploaded location history.")
         abort(500, description="Failed to process uploaded file.")
 
-    return jsonify({"message": f"Successfully processed {len_walk_routes} potential walks."}), 200
+    return jsonify({"message": "Import queued.", "job_id": job.id}), 202
 
 
-@bp.route('/generate_route', methods=['POST'])
-def api_recommend_route():
-    data = _get_json_object()
+@bp.route("/import_jobs/<job_id>", methods=["GET"])
+@require_api_key
+def get_import_job(job_id):
+    job = get_import_jobs().get(job_id)
+    if not job:
+        abort(404, description="Import job not found.")
+    return jsonify(job.to_dict())
+
 
+def _parse_route_spec(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Параметры одного маршрута из JSON-объекта; ValueError с описанием, если они некорректны."""
     time_minutes = data.get('time_minutes', 60)
     angle = data.get('angle', 60)
     segments = data.get('segments', 1)
     start_point = data.get('start_point')
 
     if not isinstance(time_minutes, int) or time_minutes <= 0:
-        abort(400, description="time_minutes must be a positive integer.")
+        raise ValueError("time_minutes must be a positive integer.")
     if not isinstance(angle, int) or not (0 <= angle <= 180):
-        abort(400, description="angle must be an integer between 0 and 180.")
+        raise ValueError("angle must be an integer between 0 and 180.")
     if not isinstance(segments, int) or segments <= 0:
-        abort(400, description="segments must be a positive integer.")
+        raise ValueError("segments must be a positive integer.")
 
     if start_point is not None:
         if not isinstance(start_point, list) or len(start_point) != 2:
-            abort(400, description="start_point must be a list of two numbers [lon, lat].")
+            raise ValueError("start_point must be a list of two numbers [lon, lat].")
         try:
             start_point = [float(start_point[0]), float(start_point[1])]
         except (ValueError, TypeError):
-            abort(400, description="start_point coordinates must be valid numbers.")
+            raise ValueError("start_point coordinates must be valid numbers.")
+
+    return {"time_minutes": time_minutes, "angle": angle, "segments": segments, "start_point": start_point}
+
+
+def _route_generator(max_concurrency: Optional[int] = None) -> Callable[[Dict[str, Any]], Optional[Route]]:
+    """
+    Готовит всё, что не зависит от параметров маршрута: ленивую сетку посещений, маршрутизатор и оценку новизны.
+    Возвращает функцию, строящую маршрут по разобранным параметрам; её можно вызывать из разных потоков.
+    max_concurrency — сколько кандидатов одного маршрута строить одновременно (по умолчанию
+    ROUTE_CANDIDATE_CONCURRENCY).
+    """
+    db_interface = get_db_interface()
+    visit_grid = VisitGridProvider(db_interface.get_cell_visits)
+
+    router = get_router()
+    if router is None:
+        abort(500, description="No routing backend is configured (ORS_API_KEY or OFFLINE_ROUTING_GRAPH).")
+
+    novelty_candidates = current_app.config["ROUTE_NOVELTY_CANDIDATES"]
+    novelty_scorer = NoveltyScorer.from_db(db_interface) if novelty_candidates > 1 else None
+    if max_concurrency is None:
+        max_concurrency = current_app.config["ROUTE_CANDIDATE_CONCURRENCY"]
+
+    def generate(spec: Dict[str, Any]) -> Optional[Route]:
+        return get_recommended_route(
+            router,
+            spec["time_minutes"],
+            visit_grid,
+            spec["angle"],
+            spec["segments"],
+            spec["start_point"],
+            max_concurrency=max_concurrency,
+            novelty_scorer=novelty_scorer,
+            novelty_candidates=novelty_candidates,
+        )
 
-    try:
-        db_interface = get_db_interface()
-        walks: List[Walk] = db_interface.get_walks()
-    except Exception:
-        current_app.logger.exception("Failed to load walks from DB.")
-        abort(500, description="Failed to load walks data.")
+    return generate
 
-    ors_api_key = current_app.config.get("ORS_API_KEY")
-    if not ors_api_key:
-        abort(500, description="ORS_API_KEY is not configured.")
 
+@bp.route('/generate_route', methods=['POST'])
+def api_recommend_route():
     try:
-        recommended_route: Optional[Route] = get_recommended_route(
-            ors_api_key,
-            time_minutes,
-            walks,
-            angle,
-            segments,
-            start_point
-        )
+        spec = _parse_route_spec(_get_json_object())
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    generate = _route_generator()
+    try:
+        recommended_route: Optional[Route] = generate(spec)
     except Exception:
         current_app.logger.exception("Failed to generate recommended route.")
         abort(500, description="Failed to generate route.")
@@ -115,3 +156,69 @@ def api_recommend_route():
         abort(404, description="Failed to generate a recommended route. Try different parameters or location.")
 
     return jsonify(recommended_route.to_dict())
+
+
+@bp.route('/generate_routes', methods=['POST'])
+@require_api_key
+def api_recommend_routes():
+    """
+    Пакетная генерация: {"routes": [{time_minutes, angle, segments, start_point}, ...]}.
+    Сетка посещений загружается не больше одного раза на весь пакет, маршруты строятся параллельно
+    (ROUTE_BATCH_CONCURRENCY одновременно, это же и предел одновременных запросов к ORS на пакет)
+    и отдаются в NDJSON по мере готовности — по строке на маршрут:
+    {"index": i, "route": {...}} или {"index": i, "error": "..."}.
+    """
+    specs = _get_json_object().get('routes')
+    max_batch_size = current_app.config["ROUTE_BATCH_MAX_SIZE"]
+    if not isinstance(specs, list) or not specs:
+        abort(400, description="routes must be a non-empty list of route parameter objects.")
+    if len(specs) > max_batch_size:
+        abort(400, description=f"At most {max_batch_size} routes can be requested at once.")
+
+    parsed = []
+    for index, spec in enumerate(specs):
+        try:
+            if not isinstance(spec, dict):
+                raise ValueError("route parameters must be an object.")
+            parsed.append(_parse_route_spec(spec))
+        except ValueError as e:
+            abort(400, description=f"routes[{index}]: {e}")
+
+    # Кандидаты каждого маршрута строятся по очереди: иначе пулы маршрутов и кандидатов перемножаются,
+    # и к ORS одновременно уходило бы до ROUTE_BATCH_CONCURRENCY × ROUTE_CANDIDATE_CONCURRENCY запросов
+    generate = _route_generator(max_concurrency=1)
+    executor = ThreadPoolExecutor(
+        max_workers=current_app.config["ROUTE_BATCH_CONCURRENCY"], thread_name_prefix="route-batch"
+    )
+    futures = {executor.submit(generate, spec): index for index, spec in enumerate(parsed)}
+
+    def stream():
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    route = future.result()
+                except Exception:
+                    current_app.logger.exception("Failed to generate route %s of a batch.", index)
+                    line = {"index": index, "error": "Failed to generate route."}
+                else:
+                    if route:
+                        line = {"index": index, "route": route.to_dict()}
+                    else:
+                        line = {"index": index, "error": "Failed to generate a recommended route."}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент мог закрыть соединение: ещё не начатые маршруты не строим
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+
+@bp.route("/ors_cache/stats", methods=["GET"])
+@require_api_key
+def get_ors_cache_stats():
+    """Попадания, промахи и размер кэша ответов OpenRouteService в этом процессе."""
+    ors_client = get_ors_client()
+    if ors_client is None or ors_client.cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **ors_client.cache.stats()})
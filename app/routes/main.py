@@ -1,10 +1,58 @@
-from typing import List
-from flask import Blueprint, render_template, jsonify, abort
+from typing import List, Optional
+from flask import Blueprint, Response, render_template, jsonify, abort, request
 from ..extensions.database import get_db_interface
-from ..models.walk import Walk
+from ..models.walk import WALK_SORTS, WalkQuery, WalkSummary
+from ..utils import heatmap
+from ..utils.geometry import lod_for_zoom
 
 bp = Blueprint('main', __name__)
 
+MAX_PAGE_SIZE = 500
+
+
+def _optional_arg(name: str, cast):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    return cast(value)
+
+
+def _walk_query_from_args() -> WalkQuery:
+    """
+    Собирает WalkQuery из параметров запроса: date_from/date_to (unix time), distance_min/distance_max (км),
+    name (подстрока), sort, limit и cursor — непрозрачный курсор из заголовка X-Next-Cursor предыдущей страницы.
+    """
+    try:
+        walk_query = WalkQuery(
+            date_from=_optional_arg('date_from', int),
+            date_to=_optional_arg('date_to', int),
+            distance_min=_optional_arg('distance_min', float),
+            distance_max=_optional_arg('distance_max', float),
+            name=_optional_arg('name', str),
+            sort=request.args.get('sort', 'date_desc'),
+            limit=_optional_arg('limit', int),
+        )
+        cursor = request.args.get('cursor')
+        if cursor:
+            value, walk_id = cursor.rsplit(':', 1)
+            walk_query.after = (int(value) if walk_query.sort.startswith('date') else float(value), int(walk_id))
+    except ValueError:
+        abort(400, description="Invalid walk filter or cursor.")
+
+    if walk_query.sort not in WALK_SORTS:
+        abort(400, description=f"sort must be one of: {', '.join(WALK_SORTS)}.")
+    if walk_query.limit is not None and not (0 < walk_query.limit <= MAX_PAGE_SIZE):
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return walk_query
+
+
+def _next_cursor(walks: List[WalkSummary], walk_query: WalkQuery) -> Optional[str]:
+    if walk_query.limit is None or len(walks) < walk_query.limit:
+        return None
+    last = walks[-1]
+    value = last.date if walk_query.sort.startswith('date') else last.distance
+    return f"{value!r}:{last.id}"
+
 
 @bp.route('/')
 def index():
@@ -13,9 +61,113 @@ def index():
 
 @bp.route('/walks', methods=['GET'])
 def get_walks():
+    """Список прогулок без геометрии: геометрия запрашивается отдельно по id или по окну карты."""
+    walk_query = _walk_query_from_args()
+    db_interface = get_db_interface()
+    walks: List[WalkSummary] = db_interface.get_walk_summaries(walk_query)
+
+    response = jsonify([walk.to_dict() for walk in walks])
+    next_cursor = _next_cursor(walks, walk_query)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@bp.route('/walks/stats', methods=['GET'])
+def get_walks_stats():
+    """Количество и суммарная дистанция прогулок с учётом тех же фильтров, что и у /walks."""
+    db_interface = get_db_interface()
+    return jsonify(db_interface.get_walk_stats(_walk_query_from_args()))
+
+
+@bp.route('/walks/geometry', methods=['GET'])
+def get_walks_geometry():
+    """
+    Геометрия прогулок: ?bbox=min_lon,min_lat,max_lon,max_lat — пересекающие окно карты,
+    ?ids=1,2,3 — конкретные прогулки, ?zoom=N — упрощённый под зум карты уровень детализации.
+    Параметры можно комбинировать.
+    """
+    bbox = None
+    walk_ids = None
+    try:
+        lod = lod_for_zoom(_optional_arg('zoom', float))
+        if request.args.get('bbox'):
+            bbox = tuple(float(v) for v in request.args['bbox'].split(','))
+            if len(bbox) != 4:
+                raise ValueError
+        if request.args.get('ids'):
+            walk_ids = [int(v) for v in request.args['ids'].split(',')]
+    except ValueError:
+        abort(400, description="bbox must be min_lon,min_lat,max_lon,max_lat, ids a comma-separated list of integers and zoom a number.")
+
     db_interface = get_db_interface()
-    walks: List[Walk] = db_interface.get_walks()  # Получаем список объектов Walk
-    return jsonify([walk.to_dict() for walk in walks])
+    geometries = db_interface.get_walk_geometries(walk_ids=walk_ids, bbox=bbox, lod=lod)
+    if not geometries:
+        return jsonify([])
+
+    summaries = db_interface.get_walk_summaries(WalkQuery(ids=list(geometries)))
+    return jsonify([dict(walk.to_dict(), path_geojson=geometries[walk.id], lod=lod) for walk in summaries])
+
+
+@bp.route('/walks/<int:walk_id>/geometry', methods=['GET'])
+def get_walk_geometry(walk_id):
+    try:
+        lod = lod_for_zoom(_optional_arg('zoom', float))
+    except ValueError:
+        abort(400, description="zoom must be a number.")
+
+    db_interface = get_db_interface()
+    geometries = db_interface.get_walk_geometries(walk_ids=[walk_id], lod=lod)
+    if walk_id not in geometries:
+        abort(404, description="Прогулка не найдена")
+    return jsonify({'id': walk_id, 'path_geojson': geometries[walk_id], 'lod': lod})
+
+
+def _heatmap_tile_response(body: bytes, mimetype: str, **headers) -> Response:
+    # Тайлы меняются только при изменении прогулок: клиент перепроверяет их по ETag и получает 304
+    response = Response(body, mimetype=mimetype, headers=headers)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _heatmap_tile_counts(z: int, x: int, y: int):
+    if not heatmap.is_valid_tile(z, x, y):
+        abort(404)
+    db_interface = get_db_interface()
+
+    def load_tile(zoom, tile_x, tile_y):
+        blob = db_interface.get_heatmap_tile(zoom, tile_x, tile_y)
+        return heatmap.decode_tile(blob) if blob is not None else None
+
+    return heatmap.tile_counts(z, x, y, load_tile)
+
+
+@bp.route('/heatmap/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_heatmap_tile_png(z, x, y):
+    """Тайл тепловой карты всех прогулок для L.tileLayer; пустые тайлы — прозрачные."""
+    counts = _heatmap_tile_counts(z, x, y)
+    max_count = get_db_interface().get_heatmap_max_count(min(z, heatmap.HEATMAP_MAX_ZOOM)) if counts is not None else 0
+    return _heatmap_tile_response(heatmap.render_tile_png(counts, max_count), 'image/png')
+
+
+@bp.route('/heatmap/<int:z>/<int:x>/<int:y>.bin', methods=['GET'])
+def get_heatmap_tile_binary(z, x, y):
+    """
+    Сырые счётчики тайла для отрисовки на клиенте: TILE_BINS × TILE_BINS uint16 little-endian построчно,
+    размер сетки и максимум по уровню — в заголовках X-Heatmap-Bins и X-Heatmap-Max. Пустой тайл — 204.
+    """
+    counts = _heatmap_tile_counts(z, x, y)
+    if counts is None:
+        return '', 204
+    return _heatmap_tile_response(
+        heatmap.tile_to_binary(counts),
+        'application/octet-stream',
+        **{
+            'X-Heatmap-Bins': str(heatmap.TILE_BINS),
+            'X-Heatmap-Max': str(get_db_interface().get_heatmap_max_count(min(z, heatmap.HEATMAP_MAX_ZOOM))),
+        },
+    )
 
 
 @bp.route('/all_walks')
@@ -71,7 +223,9 @@ def get_walk_photos(walk_id):
                 'description': p.description,
                 'latitude': p.latitude,
                 'longitude': p.longitude,
-                'thumbnail_url': p.thumbnail_url
+                'thumbnail_url': p.thumbnail_url,
+                'status': p.status,
+                'variants': p.variants or {}
             } for p in photos
         ]
         return jsonify(photos_data), 200
@@ -272,8 +272,8 @@ async function uploadPhoto() {
         showToast('Выберите файл фотографии.', 'error');
         return;
     }
-    if (!latitude || !longitude) {
-        showToast('Укажите координаты для фотографии, кликнув на карту.', 'error');
+    if (!latitude !== !longitude) {
+        showToast('Укажите обе координаты или ни одной: тогда место возьмётся из EXIF снимка.', 'error');
         return;
     }
 
@@ -281,8 +281,10 @@ async function uploadPhoto() {
     formData.append('photo', photoFile);
     formData.append('walk_id', walkId);
     formData.append('description', description);
-    formData.append('latitude', latitude);
-    formData.append('longitude', longitude);
+    if (latitude && longitude) {
+        formData.append('latitude', latitude);
+        formData.append('longitude', longitude);
+    }
 
     try {
         const response = await fetch('/admin/upload_photo', {
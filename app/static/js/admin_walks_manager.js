@@ -50,9 +50,21 @@
     });
   }
 
-  async function fetchWalks() {
+  const PAGE_SIZE = 50;
+  const SEARCH_DEBOUNCE_MS = 300;
+
+  let nextCursor = null;
+
+  async function fetchWalks({ append = false } = {}) {
+    if (!append) nextCursor = null;
+
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    const search = qs('#walkSearch')?.value.trim();
+    if (search) params.set('name', search);
+    if (append && nextCursor) params.set('cursor', nextCursor);
+
     try {
-      const response = await fetch('/walks', {
+      const response = await fetch(`/walks?${params}`, {
         headers: { Accept: 'application/json' },
       });
 
@@ -61,7 +73,11 @@
       }
 
       const walks = await response.json();
-      renderWalksTable(Array.isArray(walks) ? walks : []);
+      nextCursor = response.headers.get('X-Next-Cursor');
+      renderWalksTable(Array.isArray(walks) ? walks : [], append);
+
+      const loadMoreBtn = qs('#loadMoreWalksBtn');
+      if (loadMoreBtn) loadMoreBtn.hidden = !nextCursor;
     } catch (error) {
       console.error('Error fetching walks:', error);
       showToast('Не удалось загрузить список прогулок.', 'error');
@@ -95,13 +111,13 @@
     }
   }
 
-  function renderWalksTable(walks) {
+  function renderWalksTable(walks, append = false) {
     const tableBody = qs('#walksTable tbody');
     if (!tableBody) return;
 
-    tableBody.innerHTML = '';
+    if (!append) tableBody.innerHTML = '';
 
-    if (walks.length === 0) {
+    if (!append && walks.length === 0) {
       tableBody.innerHTML = '<tr><td colspan="5">Прогулок пока нет.</td></tr>';
       return;
     }
@@ -152,7 +168,21 @@
 
     const refreshWalksBtn = qs('#refreshWalksBtn');
     if (refreshWalksBtn) {
-      refreshWalksBtn.addEventListener('click', fetchWalks);
+      refreshWalksBtn.addEventListener('click', () => fetchWalks());
+    }
+
+    const loadMoreBtn = qs('#loadMoreWalksBtn');
+    if (loadMoreBtn) {
+      loadMoreBtn.addEventListener('click', () => fetchWalks({ append: true }));
+    }
+
+    const walkSearch = qs('#walkSearch');
+    if (walkSearch) {
+      let searchTimeoutId;
+      walkSearch.addEventListener('input', () => {
+        clearTimeout(searchTimeoutId);
+        searchTimeoutId = setTimeout(() => fetchWalks(), SEARCH_DEBOUNCE_MS);
+      });
     }
 
     fetchWalks();
@@ -1,14 +1,23 @@
 import { applySavedTheme } from '../common/theme.js';
 
-let allWalks = [];
+const PAGE_SIZE = 30;
+
 let currentSort = 'date_desc';
+let nextCursor = null;
 
 function initAllWalksPage() {
   applySavedTheme();
   setupSortButtons();
+  setupLoadMoreButton();
   fetchAllWalksAndDisplay();
 }
 
+function setupLoadMoreButton() {
+  const loadMoreBtn = document.getElementById('load-more-walks-btn');
+  if (!loadMoreBtn) return;
+  loadMoreBtn.addEventListener('click', () => fetchWalksPage());
+}
+
 function setupSortButtons() {
   const dropdownBtn = document.getElementById('sort-dropdown-btn');
   const dropdownContent = document.getElementById('sort-dropdown-content');
@@ -29,7 +38,7 @@ function setupSortButtons() {
       selectedText.textContent = option.textContent;
       dropdownContent.classList.remove('show');
       if (sortArrow) sortArrow.textContent = '↓';
-      sortAndDisplayWalks();
+      fetchAllWalksAndDisplay();
     });
   });
 
@@ -39,35 +48,10 @@ function setupSortButtons() {
   });
 }
 
-function sortAndDisplayWalks() {
-  if (allWalks.length === 0) return;
-
-  const sortedWalks = [...allWalks];
-
-  switch (currentSort) {
-    case 'date_asc':
-      sortedWalks.sort((a, b) => a.date - b.date);
-      break;
-    case 'distance_asc':
-      sortedWalks.sort((a, b) => a.distance - b.distance);
-      break;
-    case 'distance_desc':
-      sortedWalks.sort((a, b) => b.distance - a.distance);
-      break;
-    case 'date_desc':
-    default:
-      sortedWalks.sort((a, b) => b.date - a.date);
-  }
-
-  displayWalks(sortedWalks);
-}
-
 function displayWalks(walks) {
   const allWalksContainer = document.getElementById('all-walks-grid');
   if (!allWalksContainer) return;
 
-  allWalksContainer.innerHTML = '';
-
   walks.forEach((walk) => {
     const walkCard = document.createElement('div');
     walkCard.classList.add('all-walk-card');
@@ -99,11 +83,26 @@ function displayWalks(walks) {
 
 async function fetchAllWalksAndDisplay() {
   const allWalksContainer = document.getElementById('all-walks-grid');
+  if (allWalksContainer) allWalksContainer.innerHTML = '';
+
+  nextCursor = null;
+  await fetchWalksPage();
+}
+
+async function fetchWalksPage() {
+  const allWalksContainer = document.getElementById('all-walks-grid');
+  const loadMoreBtn = document.getElementById('load-more-walks-btn');
+
+  const params = new URLSearchParams({ sort: currentSort, limit: PAGE_SIZE });
+  if (nextCursor) params.set('cursor', nextCursor);
 
   try {
-    const response = await fetch('/walks');
-    allWalks = await response.json();
-    sortAndDisplayWalks();
+    const response = await fetch(`/walks?${params}`);
+    const walks = await response.json();
+    nextCursor = response.headers.get('X-Next-Cursor');
+
+    displayWalks(walks);
+    if (loadMoreBtn) loadMoreBtn.hidden = !nextCursor;
   } catch (error) {
     console.error('Error fetching all walks:', error);
     if (allWalksContainer) {
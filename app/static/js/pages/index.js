@@ -3,7 +3,8 @@ import { setupSecretClick } from '../common/secret_admin_click.js';
 import { initPublicHeader } from '../common/public_header.js';
 
 let map;
-let geoJsonLayers = [];
+let heatmapLayer;
+let drawnWalks = new Map();
 
 const creatureContainer = document.querySelector('.dolboeb');
 const randomWalkSection = document.querySelector('.random-walk-section');
@@ -119,8 +120,12 @@ function initMap() {
     attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
   }).addTo(map);
 
+  // Тепловая карта всей истории считается на сервере и приходит готовыми тайлами
+  heatmapLayer = L.tileLayer('/heatmap/{z}/{x}/{y}.png', { opacity: 0.8, maxZoom: 19 });
+  L.control.layers(null, { 'Тепловая карта': heatmapLayer }).addTo(map);
+
+  map.on('moveend', fetchVisibleWalkGeometries);
   fetchWalksAndDisplay();
-  fetchRecentWalks();
 }
 
 function animateCounter(elementId, endValue, duration, isDistance = false) {
@@ -151,106 +156,116 @@ function animateCounter(elementId, endValue, duration, isDistance = false) {
 }
 
 async function fetchWalksAndDisplay() {
-  geoJsonLayers.forEach((layer) => map.removeLayer(layer));
-  geoJsonLayers = [];
-
-  let totalDistanceKm = 0;
+  drawnWalks.forEach(({ layer }) => map.removeLayer(layer));
+  drawnWalks = new Map();
+  heatmapLayer.redraw();
 
   try {
-    const response = await fetch('/walks');
-    const walks = await response.json();
+    const [statsResponse, recentResponse] = await Promise.all([fetch('/walks/stats'), fetch('/walks?limit=3')]);
+    const stats = await statsResponse.json();
+    const recentWalks = await recentResponse.json();
 
-    walks.forEach((walk) => {
-      if (walk.path_geojson) {
-        const geojsonData = walk.path_geojson;
-
-        const geoJsonLayer = L.geoJSON(geojsonData, {
-          style() {
-            return {
-              color: '#FF0000',
-              weight: 4,
-              opacity: 0.8,
-            };
-          },
-          onEachFeature(feature, layer) {
-            layer.walkId = walk.id;
-
-            layer.on('mouseover', function () {
-              layer.setStyle({
-                color: '#00FF00',
-                weight: 5,
-                opacity: 1.0,
-              });
-            });
-
-            layer.on('mouseout', function () {
-              layer.setStyle({
-                color: '#FF0000',
-                weight: 4,
-                opacity: 0.8,
-              });
-            });
-
-            layer.on('click', (e) => {
-              window.location.href = `/walk/${e.target.walkId}`;
-            });
-
-            const walkDate = new Date(walk.date * 1000).toLocaleDateString('ru-RU');
-            const tooltipContent = `<b style="font-weight: 650;">${walk.name || 'Без названия'}</b><br>${walkDate} — ${walk.distance.toFixed(2)} км`;
-
-            layer.bindTooltip(tooltipContent, {
-              permanent: false,
-              direction: 'auto',
-              className: 'walk-tooltip',
-            });
-          },
-        }).addTo(map);
-
-        geoJsonLayers.push(geoJsonLayer);
-
-        if (typeof walk.distance === 'number') {
-          totalDistanceKm += walk.distance;
-        }
-      }
-    });
+    animateCounter('totalWalks', stats.count, 750);
+    animateCounter('totalDistance', stats.total_distance, 750, true);
+    displayRecentWalks(recentWalks);
 
-    animateCounter('totalWalks', walks.length, 750);
-    animateCounter('totalDistance', totalDistanceKm, 750, true);
+    await fetchVisibleWalkGeometries();
   } catch (error) {
     console.error('Error fetching walks:', error);
   }
 }
 
-async function fetchRecentWalks() {
+async function fetchVisibleWalkGeometries() {
+  const bounds = map.getBounds();
+  const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(',');
+
   try {
-    const response = await fetch('/walks');
+    const response = await fetch(`/walks/geometry?bbox=${bbox}&zoom=${map.getZoom()}`);
     const walks = await response.json();
-    const recentWalksContainer = document.getElementById('recent-walks-list');
-    if (!recentWalksContainer) return;
 
-    recentWalksContainer.innerHTML = '';
+    walks.forEach((walk) => {
+      if (!walk.path_geojson) return;
 
-    walks.slice(0, 3).forEach((walk) => {
-      const walkCard = document.createElement('div');
-      walkCard.classList.add('recent-walk-card');
-      walkCard.dataset.walkId = walk.id;
+      // Уже нарисованную прогулку перерисовываем, только если сменился уровень детализации
+      const drawn = drawnWalks.get(walk.id);
+      if (drawn && drawn.lod === walk.lod) return;
+      if (drawn) map.removeLayer(drawn.layer);
 
-      const walkDate = new Date(walk.date * 1000).toLocaleDateString('ru-RU');
+      drawnWalks.set(walk.id, { layer: addWalkLayer(walk, walk.path_geojson), lod: walk.lod });
+    });
+  } catch (error) {
+    console.error('Error fetching walk geometries:', error);
+  }
+}
 
-      walkCard.innerHTML = `
-        <h4>${walk.name || 'Без названия'}</h4>
-        <p>${walkDate} — ${walk.distance.toFixed(2)} км</p>
-      `;
+function addWalkLayer(walk, geojsonData) {
+  return L.geoJSON(geojsonData, {
+    style() {
+      return {
+        color: '#FF0000',
+        weight: 4,
+        opacity: 0.8,
+      };
+    },
+    onEachFeature(feature, layer) {
+      layer.walkId = walk.id;
+
+      layer.on('mouseover', function () {
+        layer.setStyle({
+          color: '#00FF00',
+          weight: 5,
+          opacity: 1.0,
+        });
+      });
+
+      layer.on('mouseout', function () {
+        layer.setStyle({
+          color: '#FF0000',
+          weight: 4,
+          opacity: 0.8,
+        });
+      });
+
+      layer.on('click', (e) => {
+        window.location.href = `/walk/${e.target.walkId}`;
+      });
+
+      const walkDate = new Date(walk.date * 1000).toLocaleDateString('ru-RU');
+      const tooltipContent = `<b style="font-weight: 650;">${walk.name || 'Без названия'}</b><br>${walkDate} — ${walk.distance.toFixed(2)} км`;
 
-      walkCard.addEventListener('click', () => {
-        window.location.href = `/walk/${walk.id}`;
+      layer.bindTooltip(tooltipContent, {
+        permanent: false,
+        direction: 'auto',
+        className: 'walk-tooltip',
       });
+    },
+  }).addTo(map);
+}
+
+function displayRecentWalks(walks) {
+  const recentWalksContainer = document.getElementById('recent-walks-list');
+  if (!recentWalksContainer) return;
+
+  recentWalksContainer.innerHTML = '';
+
+  walks.slice(0, 3).forEach((walk) => {
+    const walkCard = document.createElement('div');
+    walkCard.classList.add('recent-walk-card');
+    walkCard.dataset.walkId = walk.id;
 
-      recentWalksContainer.appendChild(walkCard);
+    const walkDate = new Date(walk.date * 1000).toLocaleDateString('ru-RU');
+
+    walkCard.innerHTML = `
+      <h4>${walk.name || 'Без названия'}</h4>
+      <p>${walkDate} — ${walk.distance.toFixed(2)} км</p>
+    `;
+
+    walkCard.addEventListener('click', () => {
+      window.location.href = `/walk/${walk.id}`;
     });
-  } catch (error) {
-    console.error('Error fetching recent walks:', error);
-  }
+
+    recentWalksContainer.appendChild(walkCard);
+  });
 }
 
 async function uploadFile() {
@@ -276,10 +291,7 @@ async function uploadFile() {
 
     if (response.ok) {
       uploadStatus.textContent = result.message;
-      uploadStatus.style.color = 'green';
-
-      fetchWalksAndDisplay();
-      fetchRecentWalks();
+      pollImportJob(result.job_id, uploadStatus);
     } else {
       uploadStatus.textContent = `Ошибка: ${result.message}`;
       uploadStatus.style.color = 'red';
@@ -291,6 +303,41 @@ async function uploadFile() {
   }
 }
 
+const IMPORT_POLL_INTERVAL_MS = 2000;
+
+async function pollImportJob(jobId, uploadStatus) {
+  try {
+    const response = await fetch(`/admin/import_jobs/${jobId}`);
+    const job = await response.json();
+
+    if (!response.ok) {
+      uploadStatus.textContent = `Ошибка: ${job.message}`;
+      uploadStatus.style.color = 'red';
+      return;
+    }
+
+    if (job.status === 'done') {
+      uploadStatus.textContent = `Импорт завершён: найдено ${job.walks_found}, добавлено ${job.walks_inserted} прогулок.`;
+      uploadStatus.style.color = 'green';
+      fetchWalksAndDisplay();
+      return;
+    }
+
+    if (job.status === 'failed') {
+      uploadStatus.textContent = `Ошибка импорта: ${job.errors.join('; ')}`;
+      uploadStatus.style.color = 'red';
+      return;
+    }
+
+    uploadStatus.textContent = `Импорт... сегментов: ${job.parsed_segments}, прогулок: ${job.walks_found}, добавлено: ${job.walks_inserted}`;
+    setTimeout(() => pollImportJob(jobId, uploadStatus), IMPORT_POLL_INTERVAL_MS);
+  } catch (error) {
+    console.error('Error polling import job:', error);
+    uploadStatus.textContent = 'Не удалось получить статус импорта.';
+    uploadStatus.style.color = 'red';
+  }
+}
+
 function setupSecretAdminClick() {
   setupSecretClick({
     onTrigger: () => {
@@ -1,8 +1,13 @@
 import math
+from typing import List, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
 
 
 def calculate_distance_km(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth's radius in kilometers
+    R = EARTH_RADIUS_KM  # Earth's radius in kilometers
 
     # Converting degrees to radians
     lat1_rad = math.radians(lat1)
@@ -18,3 +23,55 @@ def calculate_distance_km(lat1, lon1, lat2, lon2):
 
     distance = R * c  # in km
     return distance
+
+
+def _as_lon_lat_array(coordinates) -> np.ndarray:
+    arr = np.asarray(coordinates, dtype=float)
+    if arr.size == 0:
+        return np.empty((0, 2))
+    if arr.ndim != 2 or arr.shape[1] < 2:
+        raise ValueError("Expected coordinates as [[lon, lat], ...]")
+    return arr[:, :2]
+
+
+def haversine_km(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Vectorized haversine distance between matching elements of coordinate arrays (degrees), in km."""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def _segment_distances_km(lon_lat: np.ndarray) -> np.ndarray:
+    """Haversine distance of every consecutive pair of [lon, lat] rows, in one vectorized pass."""
+    return haversine_km(lon_lat[:-1, 0], lon_lat[:-1, 1], lon_lat[1:, 0], lon_lat[1:, 1])
+
+
+def polyline_length_km(coordinates) -> float:
+    """Length of a GeoJSON-ordered polyline [[lon, lat], ...] in km."""
+    lon_lat = _as_lon_lat_array(coordinates)
+    if len(lon_lat) < 2:
+        return 0.0
+    return float(_segment_distances_km(lon_lat).sum())
+
+
+def polyline_lengths_km(paths: Sequence) -> List[float]:
+    """
+    Batch mode of polyline_length_km: all paths are concatenated and measured in a single pass,
+    segments that would join the end of one path to the start of the next are masked out.
+    """
+    if not paths:
+        return []
+    arrays = [_as_lon_lat_array(path) for path in paths]
+    counts = np.fromiter((len(arr) for arr in arrays), dtype=np.intp, count=len(arrays))
+    if counts.sum() < 2:
+        return [0.0] * len(arrays)
+
+    path_ids = np.repeat(np.arange(len(arrays)), counts)
+    segments = _segment_distances_km(np.concatenate(arrays))
+    same_path = path_ids[1:] == path_ids[:-1]
+    lengths = np.bincount(path_ids[1:][same_path], weights=segments[same_path], minlength=len(arrays))
+    return lengths.tolist()
@@ -0,0 +1,102 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+# Уровни детализации: ключ -> допуск Дугласа–Пекера в градусах и минимальный зум карты Leaflet, с которого он годится.
+# Допуск примерно равен размеру пикселя на широте Москвы при этом зуме (~88 км / 2^zoom).
+# Начиная с FULL_DETAIL_ZOOM отдаётся исходный путь.
+PATH_LODS: Dict[str, Dict[str, float]] = {
+    "1": {"tolerance": 0.00005, "min_zoom": 14},
+    "2": {"tolerance": 0.0002, "min_zoom": 12},
+    "3": {"tolerance": 0.0008, "min_zoom": 10},
+    "4": {"tolerance": 0.003, "min_zoom": 0},
+}
+FULL_DETAIL_ZOOM = 16
+LOD_COORDINATE_DECIMALS = 6
+# Leaflet (toGeoJSON) округляет координаты до 6 знаков, а импорт Timeline хранит 7
+SAME_PATH_TOLERANCE_DEG = 1e-6
+
+
+def geojson_coordinates(path_geojson: Any) -> List[List[float]]:
+    """Список [[lon, lat], ...] сохранённого пути (LineString, Point или Feature; dict или JSON-строка)."""
+    if isinstance(path_geojson, str):
+        try:
+            path_geojson = json.loads(path_geojson)
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(path_geojson, dict):
+        return []
+
+    if path_geojson.get("type") == "Feature":
+        path_geojson = path_geojson.get("geometry") or {}
+
+    coordinates = path_geojson.get("coordinates") or []
+    if path_geojson.get("type") == "Point":
+        return [coordinates] if coordinates else []
+    if path_geojson.get("type") == "LineString":
+        return coordinates
+    return []
+
+
+def path_bounds(path_geojson: Any) -> Optional[Tuple[float, float, float, float]]:
+    """Габариты пути (min_lon, min_lat, max_lon, max_lat) или None для пустого пути."""
+    coordinates = geojson_coordinates(path_geojson)
+    if not coordinates:
+        return None
+    lons = [point[0] for point in coordinates]
+    lats = [point[1] for point in coordinates]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def same_path(path_a: Any, path_b: Any, tolerance: float = SAME_PATH_TOLERANCE_DEG) -> bool:
+    """
+    Совпадают ли точки двух путей с точностью до tolerance градусов: форма GeoJSON (LineString
+    или Feature, dict или строка) и округление координат при пересохранении в редакторе не важны.
+    """
+    a, b = geojson_coordinates(path_a), geojson_coordinates(path_b)
+    if len(a) != len(b):
+        return False
+    if not a:
+        return True
+    a_xy = np.asarray(a, dtype=float)[:, :2]
+    b_xy = np.asarray(b, dtype=float)[:, :2]
+    return bool(np.all(np.abs(a_xy - b_xy) <= tolerance))
+
+
+def simplify_path_lods(path_geojson: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Упрощённые версии пути для всех уровней PATH_LODS (GeoJSON LineString на уровень).
+    Все допуски считаются одним векторизованным вызовом shapely.simplify.
+    Короткие пути (точка, отрезок) упрощать нечего — на всех уровнях хранится исходный путь.
+    """
+    coordinates = geojson_coordinates(path_geojson)
+    if not coordinates:
+        return {}
+    if len(coordinates) < 3:
+        if isinstance(path_geojson, str):
+            path_geojson = json.loads(path_geojson)
+        return {key: path_geojson for key in PATH_LODS}
+
+    line = shapely.linestrings(np.asarray(coordinates, dtype=float)[:, :2])
+    tolerances = [lod["tolerance"] for lod in PATH_LODS.values()]
+    simplified = shapely.simplify(line, tolerances, preserve_topology=False)
+
+    return {
+        key: {
+            "type": "LineString",
+            "coordinates": np.round(shapely.get_coordinates(geometry), LOD_COORDINATE_DECIMALS).tolist(),
+        }
+        for key, geometry in zip(PATH_LODS, simplified)
+    }
+
+
+def lod_for_zoom(zoom: Optional[float]) -> Optional[str]:
+    """Ключ уровня детализации для зума карты; None — нужен исходный путь."""
+    if zoom is None or zoom >= FULL_DETAIL_ZOOM:
+        return None
+    for key, lod in PATH_LODS.items():
+        if zoom >= lod["min_zoom"]:
+            return key
+    return None
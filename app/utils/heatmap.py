@@ -0,0 +1,168 @@
+import io
+import math
+import zlib
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.utils.geometry import geojson_coordinates
+
+# Тепловая карта хранится тайлами z/x/y в проекции Web Mercator (та же нарезка, что у подложки Leaflet).
+# Каждый тайл — сетка TILE_BINS × TILE_BINS; в ячейке число прогулок, прошедших через неё:
+# прогулка учитывается в ячейке один раз, сколько бы точек трека в неё ни попало.
+HEATMAP_MAX_ZOOM = 14
+HEATMAP_ZOOMS = range(0, HEATMAP_MAX_ZOOM + 1)
+TILE_BINS = 64
+TILE_SIZE_PX = 256
+# Отрезки длиннее этого числа ячеек на HEATMAP_MAX_ZOOM (~6 км) считаем скачком GPS и не прорисовываем
+MAX_SEGMENT_BINS = 256
+# Уровни за пределами HEATMAP_MAX_ZOOM отдаются увеличением хранимого тайла
+MAX_SERVED_ZOOM = HEATMAP_MAX_ZOOM + int(math.log2(TILE_BINS))
+
+MAX_MERCATOR_LAT = 85.0511287798
+
+TileKey = Tuple[int, int, int]
+
+_TILE_SHIFT = int(math.log2(TILE_BINS))
+# Палитра: доля от максимума уровня -> RGB; прозрачность растёт вместе с долей
+_PALETTE_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+_PALETTE_RGB = np.array([
+    [0, 0, 255],
+    [0, 200, 255],
+    [0, 255, 100],
+    [255, 220, 0],
+    [255, 0, 0],
+], dtype=float)
+
+
+def _mercator_fractions(lon_lat: np.ndarray) -> np.ndarray:
+    """[lon, lat] -> доли мира по x и y в Web Mercator, обе в [0, 1)."""
+    lon = lon_lat[:, 0]
+    lat = np.radians(np.clip(lon_lat[:, 1], -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return np.column_stack([x, y])
+
+
+def lon_lat_to_bins(lon_lat: np.ndarray) -> np.ndarray:
+    """Дробные координаты точек [lon, lat] в ячейках мировой сетки уровня HEATMAP_MAX_ZOOM."""
+    return _mercator_fractions(lon_lat) * (TILE_BINS << HEATMAP_MAX_ZOOM)
+
+
+def _densify(points: np.ndarray) -> np.ndarray:
+    """Добавляет точки вдоль отрезков с шагом не больше ячейки, чтобы редкие точки трека не давали разрывов."""
+    if len(points) < 2:
+        return points
+    segments = np.diff(points, axis=0)
+    steps = np.ceil(np.abs(segments).max(axis=1)).astype(np.int64)
+    steps = np.where(steps > MAX_SEGMENT_BINS, 1, np.maximum(steps, 1))
+
+    segment_ids = np.repeat(np.arange(len(segments)), steps)
+    offsets = np.arange(len(segment_ids)) - np.repeat(np.cumsum(steps) - steps, steps)
+    t = offsets / steps[segment_ids]
+    samples = points[:-1][segment_ids] + segments[segment_ids] * t[:, None]
+    return np.vstack([samples, points[-1:]])
+
+
+def walk_tile_bins(path_geojson: Any) -> Dict[TileKey, np.ndarray]:
+    """
+    Ячейки, через которые проходит прогулка, на всех уровнях HEATMAP_ZOOMS:
+    (z, x, y) тайла -> уникальные плоские индексы ячеек внутри него (строка * TILE_BINS + столбец).
+    """
+    coordinates = geojson_coordinates(path_geojson)
+    if not coordinates:
+        return {}
+
+    world_bins = TILE_BINS << HEATMAP_MAX_ZOOM
+    points = lon_lat_to_bins(np.asarray(coordinates, dtype=float)[:, :2])
+    bins = np.clip(np.floor(_densify(points)).astype(np.int64), 0, world_bins - 1)
+    bins = np.unique(bins, axis=0)
+
+    result: Dict[TileKey, np.ndarray] = {}
+    for zoom in reversed(HEATMAP_ZOOMS):
+        # Ячейка уровня z-1 — это ячейка уровня z, делённая пополам по каждой оси
+        if zoom != HEATMAP_MAX_ZOOM:
+            bins = np.unique(bins >> 1, axis=0)
+        tiles = bins >> _TILE_SHIFT
+        local = bins & (TILE_BINS - 1)
+        flat = local[:, 1] * TILE_BINS + local[:, 0]
+        tile_ids = tiles[:, 0] * (1 << zoom) + tiles[:, 1]
+        order = np.argsort(tile_ids, kind="stable")
+        tile_ids, flat, tiles = tile_ids[order], flat[order], tiles[order]
+        starts = np.flatnonzero(np.r_[True, tile_ids[1:] != tile_ids[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(tile_ids)]):
+            result[(zoom, int(tiles[start, 0]), int(tiles[start, 1]))] = flat[start:end]
+    return result
+
+
+def tile_count_deltas(added: Iterable[Any] = (), removed: Iterable[Any] = ()) -> Dict[TileKey, np.ndarray]:
+    """Суммарное изменение счётчиков тайлов при добавлении и удалении прогулок (по их path_geojson)."""
+    deltas: Dict[TileKey, np.ndarray] = {}
+    for paths, sign in ((added, 1), (removed, -1)):
+        for path_geojson in paths:
+            for key, flat in walk_tile_bins(path_geojson).items():
+                counts = deltas.get(key)
+                if counts is None:
+                    counts = deltas[key] = np.zeros(TILE_BINS * TILE_BINS, dtype=np.int32)
+                counts[flat] += sign
+    return deltas
+
+
+def encode_tile(counts: np.ndarray) -> bytes:
+    return zlib.compress(np.ascontiguousarray(counts, dtype="<u4").tobytes())
+
+
+EMPTY_TILE = encode_tile(np.zeros(TILE_BINS * TILE_BINS, dtype=np.int64))
+
+
+def decode_tile(blob: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype="<u4").astype(np.int64)
+
+
+def is_valid_tile(zoom: int, x: int, y: int) -> bool:
+    return 0 <= zoom <= MAX_SERVED_ZOOM and 0 <= x < (1 << zoom) and 0 <= y < (1 << zoom)
+
+
+def tile_counts(
+    zoom: int, x: int, y: int, load_tile: Callable[[int, int, int], Optional[np.ndarray]]
+) -> Optional[np.ndarray]:
+    """
+    Сетка TILE_BINS × TILE_BINS для тайла z/x/y или None, если в нём ничего нет.
+    Для зумов больше HEATMAP_MAX_ZOOM вырезается и увеличивается нужная часть хранимого тайла.
+    """
+    extra_zoom = max(zoom - HEATMAP_MAX_ZOOM, 0)
+    stored = load_tile(zoom - extra_zoom, x >> extra_zoom, y >> extra_zoom)
+    if stored is None:
+        return None
+    stored = stored.reshape(TILE_BINS, TILE_BINS)
+    if not extra_zoom:
+        return stored
+
+    offsets = np.arange(TILE_BINS)
+    columns = ((x * TILE_BINS + offsets) >> extra_zoom) & (TILE_BINS - 1)
+    rows = ((y * TILE_BINS + offsets) >> extra_zoom) & (TILE_BINS - 1)
+    counts = stored[np.ix_(rows, columns)]
+    return counts if counts.any() else None
+
+
+def tile_to_binary(counts: np.ndarray) -> bytes:
+    """Компактное представление для клиента: TILE_BINS × TILE_BINS uint16 little-endian построчно."""
+    return np.minimum(counts, np.iinfo(np.uint16).max).astype("<u2").tobytes()
+
+
+def render_tile_png(counts: Optional[np.ndarray], max_count: int) -> bytes:
+    """PNG TILE_SIZE_PX × TILE_SIZE_PX; яркость — логарифм числа прогулок относительно максимума уровня."""
+    rgba = np.zeros((TILE_BINS, TILE_BINS, 4), dtype=np.uint8)
+    if counts is not None and max_count > 0:
+        visited = counts > 0
+        share = np.minimum(np.log1p(counts[visited]) / math.log1p(max_count), 1.0)
+        for channel in range(3):
+            rgba[..., channel][visited] = np.interp(share, _PALETTE_STOPS, _PALETTE_RGB[:, channel])
+        rgba[..., 3][visited] = (110 + 145 * share).astype(np.uint8)
+
+    scale = TILE_SIZE_PX // TILE_BINS
+    rgba = np.repeat(np.repeat(rgba, scale, axis=0), scale, axis=1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, format="PNG")
+    return buffer.getvalue()
@@ -1,6 +1,10 @@
 from PIL import Image, ExifTags
+import math
 import os
-from flask import current_app
+import posixpath
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PHOTO_URL_PREFIX = "/static/uploads/photos/"
 
 
 def _apply_exif_orientation(img: Image.Image) -> Image.Image:
@@ -41,74 +45,107 @@ def _normalize_for_web(img: Image.Image) -> Image.Image:
     return img
 
 
-def convert_image_to_webp(source_path: str, upload_folder: str, filename: str, quality: int | None = None):
-    fmt = current_app.config.get('PHOTO_FORMAT', 'WEBP').upper()
-    if fmt != 'WEBP':
-        raise ValueError(f"PHOTO_FORMAT must be WEBP, got {fmt}")
-
-    if quality is None:
-        quality = int(current_app.config.get('PHOTO_QUALITY', 82))
-
-    name, _ext = os.path.splitext(filename)
-    webp_filename = f"{name}.webp"
-    webp_path = os.path.join(upload_folder, webp_filename)
-
-    img = Image.open(source_path)
-    img = _normalize_for_web(img)
-
-    img.save(webp_path, fmt, quality=quality, method=6)
+def _open_for_web(source_path: str) -> Image.Image:
+    return _normalize_for_web(Image.open(source_path))
 
-    if os.path.abspath(webp_path) != os.path.abspath(source_path) and os.path.exists(source_path):
-        os.remove(source_path)
 
-    webp_url = f"/static/uploads/photos/{webp_filename}"
-    return webp_path, webp_url, webp_filename
+def _thumbnail_filename(filename: str, config_photo: Dict[str, Any]) -> str:
+    fmt = str(config_photo.get('format', 'WEBP')).upper()
+    ext = ".webp" if fmt == "WEBP" else ".jpg"
+    # Миниатюра лежит в том же подкаталоге, что и снимок (ab/cd/<hash>.webp -> ab/cd/small_<hash>_150x150.webp)
+    directory, base = posixpath.split(filename)
+    name, _ext = os.path.splitext(base)
+    return posixpath.join(directory, f"{config_photo['prefix']}{name}{config_photo.get('suffix', '')}{ext}")
 
 
-def create_thumbnail(source_path, upload_folder, filename, profile=None):
+def _save_atomic(img: Image.Image, path: str, fmt: str, **save_kwargs) -> None:
+    # Один и тот же файл могут одновременно писать два процесса (одинаковые загрузки): читатели видят либо старый, либо готовый
+    tmp_path = f"{path}.{os.getpid()}.tmp"
     try:
-        if profile is None:
-            profile = current_app.config['DEFAULT_THUMBNAIL_PROFILE']
-
-        config_photo = current_app.config['THUMBNAIL_PROFILES'][profile]
-        fmt = str(config_photo.get('format', 'WEBP')).upper()
-
-        ext = ".webp" if fmt == "WEBP" else ".jpg"
-        name, _ext = os.path.splitext(filename)
-
-        thumb_filename = f"{config_photo['prefix']}{name}{config_photo.get('suffix', '')}{ext}"
-        thumb_path = os.path.join(upload_folder, thumb_filename)
-
-        img = Image.open(source_path)
-        img = _normalize_for_web(img)
-
-        img.thumbnail(config_photo['size'], Image.Resampling.LANCZOS)
-
-        save_kwargs = {"quality": config_photo['quality']}
-        if fmt == "WEBP":
-            save_kwargs["method"] = 6
-
-        img.save(thumb_path, fmt, **save_kwargs)
+        img.save(tmp_path, fmt, **save_kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _save_thumbnail(img: Image.Image, thumb_path: str, config_photo: Dict[str, Any]) -> None:
+    fmt = str(config_photo.get('format', 'WEBP')).upper()
+    save_kwargs = {"quality": config_photo['quality']}
+    if fmt == "WEBP":
+        save_kwargs["method"] = 6
+    _save_atomic(img, thumb_path, fmt, **save_kwargs)
+
+
+def _fitted_size(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """Размер, который дал бы Image.thumbnail(box): округление выбирается по наименьшему искажению пропорций."""
+    width, height = size
+    x, y = min(box[0], width), min(box[1], height)
+    aspect = width / height
+    if x / y >= aspect:
+        x = max(min(math.floor(y * aspect), math.ceil(y * aspect), key=lambda n: abs(aspect - n / y)), 1)
+    else:
+        y = max(min(math.floor(x / aspect), math.ceil(x / aspect), key=lambda n: abs(aspect - x / n) if n else math.inf), 1)
+    return x, y
+
+
+def write_thumbnails(
+    img: Image.Image,
+    upload_folder: str,
+    filename: str,
+    profiles: Dict[str, Dict[str, Any]],
+    on_ready: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Пишет миниатюры всех profiles из одного декодированного img и возвращает {профиль: url}.
+    Профили обрабатываются от большего к меньшему, и каждый уменьшается из наименьшей уже готовой
+    миниатюры, которая его вмещает (каскад): с полного разрешения уменьшается только первый.
+    on_ready(profile, url) вызывается после записи каждого файла.
+    """
+    ordered = sorted(profiles.items(), key=lambda item: max(item[1]['size']), reverse=True)
+    sources: List[Image.Image] = [img]
+    results = {}
+    for profile, config_photo in ordered:
+        target = _fitted_size(img.size, config_photo['size'])
+        source = min(
+            (candidate for candidate in sources if candidate.width >= target[0] and candidate.height >= target[1]),
+            key=lambda candidate: candidate.width,
+        )
+        # reducing_gap: сначала быстрое целочисленное уменьшение reduce(), затем LANCZOS до точного размера
+        thumb = source.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        sources.append(thumb)
+
+        thumb_filename = _thumbnail_filename(filename, config_photo)
+        _save_thumbnail(thumb, os.path.join(upload_folder, thumb_filename), config_photo)
+        results[profile] = f"{PHOTO_URL_PREFIX}{thumb_filename}"
+        if on_ready:
+            on_ready(profile, results[profile])
+    return results
 
-        thumb_url = f"/static/uploads/photos/{thumb_filename}"
-        return thumb_path, thumb_url
 
-    except KeyError:
-        raise ValueError(f"Unknown thumbnail profile: {profile}")
-    except Exception as e:
-        if 'thumb_path' in locals() and os.path.exists(thumb_path):
-            os.remove(thumb_path)
-        raise e
+def encode_photo_variants(
+    source_path: str,
+    upload_folder: str,
+    filename: str,
+    quality: int,
+    profiles: Dict[str, Dict[str, Any]],
+    on_ready: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Декодирует исходник один раз и пишет из него миниатюры всех profiles (write_thumbnails), а затем
+    полноразмерный WebP (вариант "full"). Миниатюры идут первыми: они нужны интерфейсу сразу,
+    а кодирование полного размера самое долгое. on_ready(variant, url) вызывается после записи каждого файла.
+    Не использует current_app, поэтому подходит для запуска в пуле процессов. Исходник не удаляется.
+    """
+    name, _ext = os.path.splitext(filename)
+    webp_filename = f"{name}.webp"
 
+    img = _open_for_web(source_path)
 
-def create_all_thumbnails(source_path, upload_folder, filename):
-    results = {}
-    for profile in current_app.config['THUMBNAIL_PROFILES'].keys():
-        try:
-            _, thumb_url = create_thumbnail(source_path, upload_folder, filename, profile)
-            results[profile] = thumb_url
-        except Exception as e:
-            current_app.logger.error(f"Failed to create {profile} thumbnail: {str(e)}")
-            results[profile] = None
+    variants = write_thumbnails(img, upload_folder, webp_filename, profiles, on_ready=on_ready)
 
-    return results
+    _save_atomic(img, os.path.join(upload_folder, webp_filename), "WEBP", quality=quality, method=6)
+    variants["full"] = f"{PHOTO_URL_PREFIX}{webp_filename}"
+    if on_ready:
+        on_ready("full", variants["full"])
+    return variants
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import Flask, current_app
+
+from app.models.import_job import ImportJob
+from app.utils.walk_processing import import_walks_from_json
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_JOB_FILE_RE = re.compile(r'^[0-9a-f]{32}\.(upload|status)\.json(\.tmp)?$')
+
+
+class ImportJobManager:
+    """
+    Фоновый импорт выгрузок Google Timeline.
+    Загруженный файл сохраняется на диск, а разбор выполняется в пуле потоков внутри процесса.
+    Статус задачи пишется в JSON-файл рядом с загрузкой, поэтому его видит любой воркер gunicorn.
+    Загрузка удаляется, как только задача завершится; файлы статуса, а также загрузки, брошенные
+    при перезапуске процесса, удаляются при постановке новых задач, когда не менялись дольше ttl секунд.
+    """
+
+    def __init__(self, app: Flask, folder: str, max_workers: int = 1, ttl: float = 7 * 24 * 3600):
+        self._app = app
+        self._folder = folder
+        self._ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="walk-import")
+        os.makedirs(folder, exist_ok=True)
+
+    def _upload_path(self, job_id: str) -> str:
+        return os.path.join(self._folder, f"{job_id}.upload.json")
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self._folder, f"{job_id}.status.json")
+
+    def save(self, job: ImportJob) -> None:
+        status_path = self._status_path(job.id)
+        tmp_path = f"{status_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, status_path)
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        if not _JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(self._status_path(job_id), encoding="utf-8") as f:
+                return ImportJob.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def submit(self, file, incremental: bool = False) -> ImportJob:
+        """Сохраняет загрузку, ставит задачу в очередь и сразу возвращает её описание."""
+        self._expire_jobs()
+        job = ImportJob(id=uuid.uuid4().hex, incremental=incremental, created_at=int(time.time()))
+        try:
+            file.save(self._upload_path(job.id))
+            self.save(job)
+            self._executor.submit(self._run, job)
+        except BaseException:
+            for path in (self._upload_path(job.id), self._status_path(job.id)):
+                self._remove(path)
+            raise
+        return job
+
+    def _expire_jobs(self) -> None:
+        # Статус обновляется при каждом сохранении прогресса, так что по времени изменения истекают
+        # только завершённые задачи и файлы задач, оборванных перезапуском
+        cutoff = time.time() - self._ttl
+        try:
+            entries = list(os.scandir(self._folder))
+        except OSError:
+            logger.warning("Failed to list import folder %s", self._folder, exc_info=True)
+            return
+        for entry in entries:
+            try:
+                if _JOB_FILE_RE.match(entry.name) and entry.is_file() and entry.stat().st_mtime < cutoff:
+                    self._remove(entry.path)
+            except OSError:
+                # Файл успел удалить соседний воркер
+                continue
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.warning("Failed to remove import file %s", path)
+
+    def _run(self, job: ImportJob) -> None:
+        upload_path = self._upload_path(job.id)
+        with self._app.app_context():
+            job.status = "running"
+            self.save(job)
+            try:
+                with open(upload_path, "rb") as f:
+                    import_walks_from_json(f, incremental=job.incremental, job=job, on_progress=self.save)
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Import job %s failed", job.id)
+                job.errors.append(str(e))
+                job.status = "failed"
+            finally:
+                job.finished_at = int(time.time())
+                try:
+                    self.save(job)
+                finally:
+                    self._remove(upload_path)
+
+
+def get_import_jobs() -> ImportJobManager:
+    return current_app.extensions["import_jobs"]
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["import_jobs"] = ImportJobManager(
+        app,
+        folder=app.config["IMPORT_FOLDER"],
+        max_workers=app.config["IMPORT_WORKERS"],
+        ttl=app.config["IMPORT_JOB_TTL_SECONDS"],
+    )
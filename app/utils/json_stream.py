@@ -0,0 +1,127 @@
+import codecs
+import json
+from typing import Any, BinaryIO, Iterator, Tuple, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+class _StreamReader:
+    """Буферизованный посимвольный доступ к JSON-потоку без чтения файла целиком."""
+
+    def __init__(self, fp: Union[BinaryIO, Any], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            tail = self._decoder.decode(b'', final=True)
+        elif isinstance(chunk, bytes):
+            tail = self._decoder.decode(chunk)
+        else:
+            tail = chunk
+        self._buf = self._buf[self._pos:] + tail
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Возвращает следующий значимый символ (без пробелов) или '' в конце потока."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Ожидался символ {char!r}, получен {found!r} в JSON-потоке")
+        self._pos += 1
+
+    def decode_value(self) -> Any:
+        """Декодирует одно JSON-значение, подгружая данные до тех пор, пока оно не станет полным."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе буфера может быть обрезано: дочитываем и пробуем ещё раз
+            if end == len(self._buf) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_array(reader: _StreamReader) -> Iterator[Any]:
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.expect(']')
+        return
+    while True:
+        yield reader.decode_value()
+        sep = reader.peek()
+        if sep == ']':
+            reader.expect(']')
+            return
+        reader.expect(',')
+
+
+def _iter_members(reader: _StreamReader) -> Iterator[Tuple[str, _StreamReader]]:
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        key = reader.decode_value()
+        if not isinstance(key, str):
+            raise ValueError("Ключ JSON-объекта должен быть строкой")
+        reader.expect(':')
+        yield key, reader
+        sep = reader.peek()
+        if sep == '}':
+            reader.expect('}')
+            return
+        reader.expect(',')
+
+
+def _skip_value(reader: _StreamReader) -> None:
+    # Большие массивы (например, rawSignals) пропускаем поэлементно, чтобы не держать их в памяти
+    if reader.peek() == '[':
+        for _ in _iter_array(reader):
+            pass
+    else:
+        reader.decode_value()
+
+
+def iter_array_items(fp, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Потоково отдаёт элементы массива `key` из JSON-объекта верхнего уровня.
+    Пиковая память определяется размером самого большого элемента, а не файла.
+    """
+    reader = _StreamReader(fp, chunk_size)
+    for name, _ in _iter_members(reader):
+        if name != key:
+            _skip_value(reader)
+            continue
+        if reader.peek() != '[':
+            value = reader.decode_value()
+            if isinstance(value, list):
+                yield from value
+            return
+        yield from _iter_array(reader)
+        return
@@ -0,0 +1,174 @@
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+MIN_LON = 37.3687
+MAX_LON = 37.8426
+MIN_LAT = 55.5698
+MAX_LAT = 55.9112
+mkad_coords = [
+    [
+        37.5955903429074,
+        55.90768082203752
+    ],
+    [
+        37.57636318537541,
+        55.91165122503094
+    ],
+    [
+        37.543980604269365,
+        55.90824804735425
+    ],
+    [
+        37.515645845801714,
+        55.9008734710836
+    ],
+    [
+        37.48326326469564,
+        55.88839022437051
+    ],
+    [
+        37.458976328866385,
+        55.88157948779576
+    ],
+    [
+        37.430641570398734,
+        55.87760600621101
+    ],
+    [
+        37.4144502798452,
+        55.87022560424279
+    ],
+    [
+        37.398258989292685,
+        55.86114010676263
+    ],
+    [
+        37.39421116665429,
+        55.85375657515252
+    ],
+    [
+        37.393199210994425,
+        55.844099070422004
+    ],
+    [
+        37.39421116665429,
+        55.83443916585631
+    ],
+    [
+        37.39421116665429,
+        55.823639961590715
+    ],
+    [
+        37.38611552137755,
+        55.80715118428
+    ],
+    [
+        37.37903183176067,
+        55.792362202250644
+    ],
+    [
+        37.3668883638465,
+        55.78382754201948
+    ],
+    [
+        37.36891227516517,
+        55.76390606243129
+    ],
+    [
+        37.37296009780357,
+        55.747961546705
+    ],
+    [
+        37.37498400912227,
+        55.728591584927585
+    ],
+    [
+        37.396235077973984,
+        55.70693142610082
+    ],
+    [
+        37.41951005814343,
+        55.68126570079505
+    ],
+    [
+        37.434689393037104,
+        55.65615402939915
+    ],
+    [
+        37.461000240185086,
+        55.63445370603338
+    ],
+    [
+        37.48225131038075,
+        55.61331288052685
+    ],
+    [
+        37.52953684582522,
+        55.58671792609297
+    ],
+    [
+        37.576374080221996,
+        55.57570978514883
+    ],
+    [
+        37.63000773017882,
+        55.567127715139634
+    ],
+    [
+        37.67756964617848,
+        55.56941645051347
+    ],
+    [
+        37.71501200558177,
+        55.57742597411203
+    ],
+    [
+        37.7859648602703,
+        55.61118796497544
+    ],
+    [
+        37.84425874025703,
+        55.650316328171726
+    ],
+    [
+        37.853350338471785,
+        55.674248372855914
+    ],
+    [
+        37.85702858677104,
+        55.76296472562572
+    ],
+    [
+        37.85278584093675,
+        55.81442269744397
+    ],
+    [
+        37.717958795269396,
+        55.88696239618622
+    ],
+    [
+        37.660984779787384,
+        55.89715869139434
+    ],
+    [
+        37.592442144561005,
+        55.90882106557132
+    ]
+]
+mkad_polygon = Polygon(mkad_coords)
+# Подготовленная геометрия: индекс рёбер строится один раз, дальше проверки идут без пересборки
+shapely.prepare(mkad_polygon)
+
+
+def is_inside_mkad(point: list) -> bool:
+    """Проверяет, находится ли точка внутри полигона МКАДа"""
+    return bool(shapely.contains_xy(mkad_polygon, point[0], point[1]))
+
+
+def points_inside_mkad(coordinates) -> np.ndarray:
+    """Векторная проверка: для массива N×2 [[lon, lat], ...] возвращает булеву маску точек внутри МКАДа."""
+    arr = np.asarray(coordinates, dtype=float)
+    if arr.size == 0:
+        return np.zeros(0, dtype=bool)
+    return shapely.contains_xy(mkad_polygon, arr[:, 0], arr[:, 1])
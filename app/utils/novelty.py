@@ -0,0 +1,96 @@
+import math
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+import numpy as np
+
+from app.extensions.db_interface import DBInterface
+from app.models.route import Route
+from app.utils.distance import haversine_km
+from app.utils.heatmap import HEATMAP_MAX_ZOOM, TILE_BINS, decode_tile, lon_lat_to_bins
+
+SAMPLE_SPACING_M = 10.0
+# Ячейка сетки ~20 м в Москве; соседние ячейки тоже считаются пройденными — поправка на шум GPS
+BUFFER_BINS = 1
+
+_TILE_SHIFT = int(math.log2(TILE_BINS))
+_OFFSETS = np.array([
+    (dx, dy) for dx in range(-BUFFER_BINS, BUFFER_BINS + 1) for dy in range(-BUFFER_BINS, BUFFER_BINS + 1)
+])
+
+
+def sample_path(coordinates: Any, spacing_m: float = SAMPLE_SPACING_M) -> np.ndarray:
+    """
+    Точки [lon, lat] через равные промежутки длины пути (середины отрезков по ~spacing_m),
+    поэтому доля точек с каким-то свойством равна доле длины пути.
+    """
+    lon_lat = np.asarray(coordinates, dtype=float)
+    if lon_lat.size == 0:
+        return np.empty((0, 2))
+    lon_lat = lon_lat[:, :2]
+    if len(lon_lat) < 2:
+        return lon_lat
+
+    lengths = haversine_km(lon_lat[:-1, 0], lon_lat[:-1, 1], lon_lat[1:, 0], lon_lat[1:, 1]) * 1000
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    total = cumulative[-1]
+    if total == 0:
+        return lon_lat[:1]
+
+    count = max(1, math.ceil(total / spacing_m))
+    positions = (np.arange(count) + 0.5) * (total / count)
+    return np.column_stack([
+        np.interp(positions, cumulative, lon_lat[:, 0]),
+        np.interp(positions, cumulative, lon_lat[:, 1]),
+    ])
+
+
+class NoveltyScorer:
+    """
+    Новизна маршрута — доля его длины, не проходящая по местам, где уже были прогулки.
+    Пройденные места берутся из тайлов тепловой карты уровня HEATMAP_MAX_ZOOM: это сетка-индекс
+    по всей истории, которую БД обновляет инкрементально при каждом изменении прогулок.
+    Загруженные тайлы кэшируются в объекте, поэтому оценка следующих кандидатов занимает доли миллисекунды.
+    """
+
+    def __init__(self, load_tiles: Callable[[Iterable[Tuple[int, int]]], Dict[Tuple[int, int], bytes]]):
+        self._load_tiles = load_tiles
+        self._tiles: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @classmethod
+    def from_db(cls, db_interface: DBInterface) -> "NoveltyScorer":
+        return cls(lambda tiles: db_interface.get_heatmap_tiles(HEATMAP_MAX_ZOOM, tiles))
+
+    def _visited(self, bins: np.ndarray) -> np.ndarray:
+        tiles = bins >> _TILE_SHIFT
+        tile_keys, tile_index = np.unique(tiles[:, 0] * (1 << 32) + tiles[:, 1], return_inverse=True)
+        unique_tiles = [(int(key >> 32), int(key & 0xFFFFFFFF)) for key in tile_keys.tolist()]
+        missing = [tile for tile in unique_tiles if tile not in self._tiles]
+        if missing:
+            loaded = self._load_tiles(missing)
+            for tile in missing:
+                blob = loaded.get(tile)
+                self._tiles[tile] = (
+                    decode_tile(blob).reshape(TILE_BINS, TILE_BINS) if blob is not None
+                    else np.zeros((TILE_BINS, TILE_BINS), dtype=np.int64)
+                )
+
+        # Все нужные тайлы одним массивом: индекс тайла, строка, столбец
+        grids = np.stack([self._tiles[tile] for tile in unique_tiles])
+        local = bins & (TILE_BINS - 1)
+        return grids[tile_index.ravel(), local[:, 1], local[:, 0]] > 0
+
+    def overlap(self, coordinates: Any) -> float:
+        """Доля длины пути [[lon, lat], ...], проходящая по уже пройденным ячейкам (с буфером BUFFER_BINS)."""
+        samples = sample_path(coordinates)
+        if not len(samples):
+            return 0.0
+        bins = np.floor(lon_lat_to_bins(samples)).astype(np.int64)
+        neighbourhood = (bins[:, None, :] + _OFFSETS[None, :, :]).reshape(-1, 2)
+        visited = self._visited(neighbourhood).reshape(len(bins), len(_OFFSETS)).any(axis=1)
+        return float(visited.mean())
+
+    def novelty(self, coordinates: Any) -> float:
+        return 1.0 - self.overlap(coordinates)
+
+    def __call__(self, route: Route) -> float:
+        return self.novelty(route.path_geojson)
@@ -0,0 +1,306 @@
+import bz2
+import gzip
+import heapq
+import logging
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+from typing import IO, List, Optional, Tuple
+
+import click
+import numpy as np
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+
+from app.models.route import Route
+from app.utils.distance import EARTH_RADIUS_KM, haversine_km
+from app.utils.ors_requests import generate_yandex_link
+from app.utils.routing import Router
+
+logger = logging.getLogger(__name__)
+
+# Дороги OSM, по которым можно идти пешком, если foot/access не запрещают этого явно
+PEDESTRIAN_HIGHWAYS = frozenset({
+    "footway", "pedestrian", "path", "steps", "living_street", "residential", "service", "unclassified",
+    "track", "corridor", "tertiary", "tertiary_link", "secondary", "secondary_link", "primary", "primary_link",
+})
+FOOT_ALLOWED = frozenset({"yes", "designated", "permissive"})
+FOOT_DENIED = frozenset({"no", "private"})
+
+WALKING_SPEED_MPS = 5 / 3.6  # скорость пешехода в профиле foot-walking ORS
+# Как и у ORS (радиус 350 м): точку дальше от графа считаем непроходимой
+MAX_SNAP_DISTANCE_M = 350
+SNAP_CELL_M = 200
+# Эвристика A* — расстояние по прямой в равнопромежуточной проекции; с запасом, чтобы не переоценить
+HEURISTIC_SCALE = 0.99
+
+
+class PedestrianGraph:
+    """
+    Пешеходный граф в массивах CSR: соседи узла i — indices[indptr[i]:indptr[i + 1]],
+    длины рёбер в метрах — lengths в тех же позициях. Рёбра хранятся в обе стороны.
+    """
+
+    def __init__(self, lon: np.ndarray, lat: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 lengths: np.ndarray):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+
+        # Метры в равнопромежуточной проекции вокруг центра графа: для эвристики и поиска ближайшего узла
+        lat0 = math.radians(float(self.lat.mean())) if len(self.lat) else 0.0
+        self._x_scale = math.cos(lat0) * EARTH_RADIUS_KM * 1000
+        self._y_scale = EARTH_RADIUS_KM * 1000
+        self._x = np.radians(self.lon) * self._x_scale
+        self._y = np.radians(self.lat) * self._y_scale
+        self._build_snap_index()
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lon)
+
+    @classmethod
+    def from_edges(cls, lon: np.ndarray, lat: np.ndarray, u: np.ndarray, v: np.ndarray) -> "PedestrianGraph":
+        """Граф из координат узлов и неориентированных рёбер (u[k], v[k]); длины считаются по гаверсинусу."""
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        keep = u != v
+        u, v = u[keep], v[keep]
+        meters = haversine_km(lon[u], lat[u], lon[v], lat[v]) * 1000
+
+        source = np.concatenate([u, v])
+        target = np.concatenate([v, u])
+        weight = np.concatenate([meters, meters])
+        order = np.argsort(source, kind="stable")
+        indptr = np.zeros(len(lon) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=len(lon)), out=indptr[1:])
+        return cls(lon, lat, indptr, target[order], weight[order])
+
+    @classmethod
+    def load(cls, path: str) -> "PedestrianGraph":
+        with np.load(path) as data:
+            return cls(data["lon"], data["lat"], data["indptr"], data["indices"], data["lengths"])
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, lon=self.lon, lat=self.lat, indptr=self.indptr, indices=self.indices, lengths=self.lengths)
+
+    def _build_snap_index(self) -> None:
+        cells = self._cell_keys(np.floor(self._x / SNAP_CELL_M), np.floor(self._y / SNAP_CELL_M))
+        self._snap_order = np.argsort(cells, kind="stable")
+        self._snap_keys = cells[self._snap_order]
+
+    @staticmethod
+    def _cell_keys(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        return cx.astype(np.int64) * (1 << 32) + cy.astype(np.int64)
+
+    def nearest_node(self, lon: float, lat: float) -> Optional[int]:
+        """Ближайший к точке узел не дальше MAX_SNAP_DISTANCE_M или None."""
+        if not self.node_count:
+            return None
+        x = math.radians(lon) * self._x_scale
+        y = math.radians(lat) * self._y_scale
+        cx, cy = math.floor(x / SNAP_CELL_M), math.floor(y / SNAP_CELL_M)
+        reach = math.ceil(MAX_SNAP_DISTANCE_M / SNAP_CELL_M)
+
+        offsets = np.arange(-reach, reach + 1)
+        keys = self._cell_keys(np.repeat(cx + offsets, len(offsets)), np.tile(cy + offsets, len(offsets)))
+        starts = np.searchsorted(self._snap_keys, keys, side="left")
+        ends = np.searchsorted(self._snap_keys, keys, side="right")
+        candidates = np.concatenate([self._snap_order[s:e] for s, e in zip(starts, ends)])
+        if not len(candidates):
+            return None
+
+        distances = np.hypot(self._x[candidates] - x, self._y[candidates] - y)
+        best = int(np.argmin(distances))
+        if distances[best] > MAX_SNAP_DISTANCE_M:
+            return None
+        return int(candidates[best])
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float]]:
+        """A* от source до target: (узлы пути, длина в метрах) или None, если target недостижим."""
+        if source == target:
+            return [source], 0.0
+
+        x, y = self._x, self._y
+        tx, ty = x[target], y[target]
+        indptr, indices, lengths = self.indptr, self.indices, self.lengths
+
+        best = {source: 0.0}
+        parent = {source: -1}
+        closed = set()
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in closed:
+                continue
+            closed.add(node)
+
+            start, end = indptr[node], indptr[node + 1]
+            neighbours = indices[start:end]
+            costs = (cost + lengths[start:end].astype(np.float64)).tolist()
+            estimates = (np.hypot(x[neighbours] - tx, y[neighbours] - ty) * HEURISTIC_SCALE).tolist()
+            for neighbour, neighbour_cost, estimate in zip(neighbours.tolist(), costs, estimates):
+                if neighbour_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = neighbour_cost
+                    parent[neighbour] = node
+                    heapq.heappush(heap, (neighbour_cost + estimate, neighbour_cost, neighbour))
+        else:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return path, best[target]
+
+
+class OfflineRouter(Router):
+    """
+    Маршруты по локальному пешеходному графу (см. build_graph_from_osm) без обращения к ORS.
+    Граф загружается при первом запросе: построение маршрута не зависит от сети и квоты.
+    """
+
+    def __init__(self, graph_path: str):
+        self.graph_path = graph_path
+        self._graph: Optional[PedestrianGraph] = None
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self) -> PedestrianGraph:
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = PedestrianGraph.load(self.graph_path)
+                    logger.info("Loaded pedestrian graph %s: %s nodes", self.graph_path, self._graph.node_count)
+        return self._graph
+
+    def zigzag_route(self, coords: List[List[float]]) -> Optional[Route]:
+        graph = self.graph
+        nodes = [graph.nearest_node(point[0], point[1]) for point in coords]
+        if len(nodes) < 2 or None in nodes:
+            logger.warning("Offline route: waypoint is farther than %s m from the pedestrian graph", MAX_SNAP_DISTANCE_M)
+            return None
+
+        path_nodes = [nodes[0]]
+        distance = 0.0
+        for source, target in zip(nodes, nodes[1:]):
+            leg = graph.shortest_path(source, target)
+            if leg is None:
+                logger.warning("Offline route: no path between graph nodes %s and %s", source, target)
+                return None
+            leg_nodes, leg_distance = leg
+            path_nodes.extend(leg_nodes[1:])
+            distance += leg_distance
+
+        path = np.column_stack([graph.lon[path_nodes], graph.lat[path_nodes]]).tolist()
+        return Route(distance / WALKING_SPEED_MPS, distance, path, generate_yandex_link(coords))
+
+
+def _iter_osm_elements(path: str):
+    """Потоково отдаёт node/way OSM XML; обработанные элементы сразу удаляются из дерева."""
+    with _open_osm(path) as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event == "end" and elem.tag in ("node", "way", "relation"):
+                yield elem
+                root.clear()
+
+
+def _open_osm(path: str) -> IO[bytes]:
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _is_walkable(tags: dict) -> bool:
+    foot = tags.get("foot")
+    if foot in FOOT_ALLOWED:
+        return "highway" in tags
+    if foot in FOOT_DENIED or tags.get("access") in FOOT_DENIED:
+        return False
+    return tags.get("highway") in PEDESTRIAN_HIGHWAYS and tags.get("area") != "yes"
+
+
+def _largest_component(node_count: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Маска узлов крупнейшей связной компоненты: распространение минимальной метки со сжатием путей."""
+    labels = np.arange(node_count)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, u, labels[v])
+        np.minimum.at(labels, v, labels[u])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    return labels == np.bincount(labels).argmax()
+
+
+def build_graph_from_osm(path: str) -> PedestrianGraph:
+    """
+    Пешеходный граф из выгрузки OSM XML (.osm, .osm.bz2, .osm.gz) в два потоковых прохода:
+    сначала пешеходные линии и их узлы, затем координаты только этих узлов.
+    В граф попадает крупнейшая связная компонента, чтобы точки не привязывались к изолированным дорожкам.
+    """
+    edge_from, edge_to = array("q"), array("q")
+    for elem in _iter_osm_elements(path):
+        if elem.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+            if _is_walkable(tags):
+                refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                edge_from.extend(refs[:-1])
+                edge_to.extend(refs[1:])
+    if not edge_from:
+        raise ValueError(f"No walkable ways found in {path}")
+
+    osm_ids, inverse = np.unique(np.concatenate([np.frombuffer(edge_from, np.int64), np.frombuffer(edge_to, np.int64)]),
+                                 return_inverse=True)
+    u, v = np.split(inverse, 2)
+    lon = np.full(len(osm_ids), np.nan)
+    lat = np.full(len(osm_ids), np.nan)
+
+    for elem in _iter_osm_elements(path):
+        if elem.tag == "node":
+            osm_id = int(elem.get("id"))
+            index = np.searchsorted(osm_ids, osm_id)
+            if index < len(osm_ids) and osm_ids[index] == osm_id:
+                lon[index] = float(elem.get("lon"))
+                lat[index] = float(elem.get("lat"))
+
+    # Узлы за границей выгрузки остаются без координат — выбрасываем их рёбра
+    known = ~np.isnan(lon)
+    edge_known = known[u] & known[v]
+    u, v = u[edge_known], v[edge_known]
+
+    keep = _largest_component(len(osm_ids), u, v) & known
+    new_index = np.cumsum(keep) - 1
+    edge_keep = keep[u] & keep[v]
+    return PedestrianGraph.from_edges(lon[keep], lat[keep], new_index[u[edge_keep]], new_index[v[edge_keep]])
+
+
+@click.command("build-routing-graph")
+@click.argument("osm_path", type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def build_routing_graph_command(osm_path):
+    """Строит пешеходный граф из выгрузки OSM и сохраняет его в OFFLINE_ROUTING_GRAPH."""
+    graph = build_graph_from_osm(osm_path)
+    graph_path = current_app.config["OFFLINE_ROUTING_GRAPH"]
+    os.makedirs(os.path.dirname(graph_path) or ".", exist_ok=True)
+    graph.save(graph_path)
+    click.echo(f"Saved pedestrian graph with {graph.node_count} nodes to {graph_path}.")
+
+
+def init_app(app: Flask) -> None:
+    app.cli.add_command(build_routing_graph_command)
+    graph_path = app.config.get("OFFLINE_ROUTING_GRAPH")
+    if graph_path and os.path.exists(graph_path):
+        app.extensions["offline_router"] = OfflineRouter(graph_path)
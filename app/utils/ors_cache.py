@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ors_responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ors_responses_accessed_at ON ors_responses (accessed_at);
+"""
+
+
+class ORSCache:
+    """
+    Дисковый кэш ответов ORS в SQLite: запись живёт ttl_seconds, а при превышении max_bytes
+    вытесняются давно не запрашивавшиеся записи (LRU). Ключ — маршрут и его точки, округлённые
+    до precision знаков (4 знака ≈ 10 м), поэтому почти совпадающие запросы попадают в кэш.
+    Файл общий для всех воркеров; счётчики попаданий ведутся в пределах процесса.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 64 * 1024 * 1024,
+                 precision: int = 4):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "errors": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3-соединение нельзя делить между потоками: у каждого потока своё
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def key(self, kind: str, waypoints: List[List[float]]) -> str:
+        quantized = [[round(float(value), self.precision) for value in point[:2]] for point in waypoints]
+        raw = json.dumps([kind, quantized], separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT body, created_at FROM ors_responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._count("misses")
+                    return None
+                body, created_at = row
+                if now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM ors_responses WHERE key = ?", (key,))
+                    self._count("expired")
+                    self._count("misses")
+                    return None
+                conn.execute("UPDATE ors_responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return json.loads(zlib.decompress(body))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            # Кэш — только ускорение: при любой его ошибке идём в ORS
+            logger.warning("ORS cache read failed: %s", e)
+            self._count("errors")
+            return None
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ors_responses (key, body, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(body), len(body), now, now),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning("ORS cache write failed: %s", e)
+            self._count("errors")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM ors_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ors_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM ors_responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM ors_responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ors_responses"
+            ).fetchone()
+            stats.update(entries=entries, size_bytes=size)
+        except sqlite3.Error as e:
+            logger.warning("ORS cache stats failed: %s", e)
+        stats.update(max_bytes=self.max_bytes, ttl_seconds=self.ttl_seconds, precision=self.precision)
+        return stats
@@ -1,73 +1,202 @@
 import logging
-from typing import List
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
 
 import requests
+from flask import Flask, current_app
+from requests.adapters import HTTPAdapter
 
 from app.models.route import Route
+from app.utils.ors_cache import ORSCache
+from app.utils.routing import Router
 
 logger = logging.getLogger(__name__)
 
+ORS_BASE_URL = "https://api.openrouteservice.org"
+# 429 — исчерпана квота, 5xx — сбой на стороне ORS; остальные 4xx повторять бессмысленно
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
 
-def get_route(api_key, start_coords, end_coords):
-    headers = {
-        "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
-        "Authorization": api_key,
-    }
 
-    params = {
-        "start": f"{start_coords[0]},{start_coords[1]}",
-        "end": f"{end_coords[0]},{end_coords[1]}",
-    }
+class CircuitOpenError(requests.exceptions.RequestException):
+    """ORS помечен недоступным после серии сбоев; запрос не отправлялся."""
 
-    try:
-        response = requests.get(
-            "https://api.openrouteservice.org/v2/directions/foot-walking",
-            headers=headers,
-            params=params,
-        )
-        response.raise_for_status()
-        route_data = response.json()
-        return Route(
-            route_data["features"][0]["properties"]["segments"][0]["duration"],
-            route_data["features"][0]["properties"]["segments"][0]["distance"],
-            route_data["features"][0]["geometry"]["coordinates"],
-        )
-    except requests.exceptions.RequestException as e:
-        logger.warning("ORS route request failed: %s", e)
-        return None
 
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold неудачных запросов подряд и reset_timeout секунд отклоняет новые.
+    Затем пропускает один пробный запрос: успех замыкает цепь, неудача снова размыкает её.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
 
-def get_zigzag_route(api_key, coords):
-    try:
-        body = {"coordinates": coords}
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("ORS circuit opened after %s consecutive failures", self._failures)
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
 
-        headers = {
+
+class ORSClient(Router):
+    """
+    Клиент OpenRouteService (пешеходные маршруты).
+    Держит пул keep-alive соединений, ограничивает время запроса, повторяет 429/5xx и сетевые ошибки
+    с экспоненциальной задержкой и через CircuitBreaker перестаёт ходить в ORS, пока тот лежит.
+    С ORSCache успешные ответы сохраняются на диск и повторно по сети не запрашиваются.
+    Один экземпляр на приложение; безопасен для использования из нескольких потоков.
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str = ORS_BASE_URL,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 15.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 pool_size: int = 10,
+                 breaker: Optional[CircuitBreaker] = None,
+                 cache: Optional[ORSCache] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self._sleep = sleep
+
+        self._session = requests.Session()
+        # Повторы делаем сами (нужны Retry-After и учёт в CircuitBreaker), поэтому у адаптера они выключены
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers.update({
             "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
             "Authorization": api_key,
-            "Content-Type": "application/json; charset=utf-8",
+        })
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        # "Full jitter": одновременные клиенты не повторяют запросы синхронно
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"ORS is unavailable, {method} {path} was not sent")
+
+        url = f"{self.base_url}{path}"
+        try:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = self._session.request(method, url, timeout=self.timeout, **kwargs)
+                    if response.status_code not in RETRY_STATUSES:
+                        break
+                    error: requests.exceptions.RequestException = requests.exceptions.HTTPError(
+                        f"{response.status_code} from ORS for {method} {path}", response=response
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = e
+
+                if attempt == self.max_retries:
+                    raise error
+                delay = self._backoff_delay(attempt, response)
+                logger.info("ORS %s %s failed (%s), retry %s in %.2fs", method, path, error, attempt + 1, delay)
+                self._sleep(delay)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        # Ответ получен: сервис жив, даже если запрос отклонён как некорректный
+        self.breaker.record_success()
+        response.raise_for_status()
+        return response.json()
+
+    def _cached_request(self, waypoints: List[List[float]], method: str, path: str, **kwargs) -> Dict[str, Any]:
+        if self.cache is None:
+            return self._request(method, path, **kwargs)
+        key = self.cache.key(f"{method} {path}", waypoints)
+        data = self.cache.get(key)
+        if data is None:
+            data = self._request(method, path, **kwargs)
+            self.cache.put(key, data)
+        return data
+
+    def route(self, start_coords: List[float], end_coords: List[float]) -> Optional[Route]:
+        params = {
+            "start": f"{start_coords[0]},{start_coords[1]}",
+            "end": f"{end_coords[0]},{end_coords[1]}",
         }
-        response = requests.post(
-            "https://api.openrouteservice.org/v2/directions/foot-walking/geojson",
-            json=body,
-            headers=headers,
+        try:
+            route_data = self._cached_request(
+                [start_coords, end_coords], "GET", "/v2/directions/foot-walking", params=params
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning("ORS route request failed: %s", e)
+            return None
+
+        segment = route_data["features"][0]["properties"]["segments"][0]
+        return Route(
+            segment["duration"],
+            segment["distance"],
+            route_data["features"][0]["geometry"]["coordinates"],
+            generate_yandex_link([start_coords, end_coords]),
         )
-        response.raise_for_status()
-        route_data = response.json()
-        time = 0
-        distance = 0
-        for segment in route_data["features"][0]["properties"]["segments"]:
-            time += segment["duration"]
-        for segment in route_data["features"][0]["properties"]["segments"]:
-            distance += segment["distance"]
+
+    def zigzag_route(self, coords: List[List[float]]) -> Optional[Route]:
+        try:
+            route_data = self._cached_request(
+                coords, "POST", "/v2/directions/foot-walking/geojson", json={"coordinates": coords}
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning("ORS zigzag route request failed: %s", e)
+            return None
+
+        segments = route_data["features"][0]["properties"]["segments"]
         return Route(
-            time,
-            distance,
+            sum(segment["duration"] for segment in segments),
+            sum(segment["distance"] for segment in segments),
             route_data["features"][0]["geometry"]["coordinates"],
             generate_yandex_link(coords),
         )
-    except requests.exceptions.RequestException as e:
-        logger.warning("ORS zigzag route request failed: %s", e)
-        return None
 
 
 def generate_yandex_link(coords: List[List[float]]) -> str:
@@ -78,3 +207,35 @@ def generate_yandex_link(coords: List[List[float]]) -> str:
         link += f'{point[1]}%2C{point[0]}~'
     link = link[:-1] + '&rtt=pd'
     return link
+
+
+def get_ors_client() -> Optional[ORSClient]:
+    """Общий клиент приложения или None, если ORS_API_KEY не задан."""
+    return current_app.extensions.get("ors_client")
+
+
+def init_app(app: Flask) -> None:
+    api_key = app.config.get("ORS_API_KEY")
+    if not api_key:
+        return
+    cache = None
+    if app.config.get("ORS_CACHE_PATH"):
+        cache = ORSCache(
+            app.config["ORS_CACHE_PATH"],
+            ttl_seconds=app.config["ORS_CACHE_TTL_SECONDS"],
+            max_bytes=app.config["ORS_CACHE_MAX_BYTES"],
+            precision=app.config["ORS_CACHE_PRECISION"],
+        )
+    app.extensions["ors_client"] = ORSClient(
+        api_key,
+        base_url=app.config["ORS_BASE_URL"],
+        connect_timeout=app.config["ORS_CONNECT_TIMEOUT"],
+        read_timeout=app.config["ORS_READ_TIMEOUT"],
+        max_retries=app.config["ORS_MAX_RETRIES"],
+        pool_size=app.config["ORS_POOL_SIZE"],
+        breaker=CircuitBreaker(
+            failure_threshold=app.config["ORS_CIRCUIT_FAILURES"],
+            reset_timeout=app.config["ORS_CIRCUIT_RESET_SECONDS"],
+        ),
+        cache=cache,
+    )
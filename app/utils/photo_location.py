@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from datetime import datetime, tzinfo
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import ExifTags, Image, UnidentifiedImageError
+
+EXIF_DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+@dataclass
+class PhotoMetadata:
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    taken_at: Optional[int] = None        # unix-время съёмки
+
+    @property
+    def has_location(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+
+def _dms_to_degrees(dms: Any, ref: Any) -> Optional[float]:
+    try:
+        degrees, minutes, seconds = (float(value) for value in dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    value = degrees + minutes / 60 + seconds / 3600
+    if isinstance(ref, bytes):
+        ref = ref.decode("ascii", "ignore")
+    return -value if str(ref).strip().upper() in ("S", "W") else value
+
+
+def _parse_exif_time(value: Any, offset: Any, default_tz: tzinfo) -> Optional[int]:
+    if not isinstance(value, str):
+        return None
+    try:
+        taken = datetime.strptime(value.strip("\x00 "), EXIF_DATETIME_FORMAT)
+    except ValueError:
+        return None
+    # OffsetTimeOriginal (+03:00) пишут не все камеры; без него время считается местным для default_tz
+    tz = default_tz
+    if isinstance(offset, str):
+        try:
+            tz = datetime.strptime(offset.strip("\x00 "), "%z").tzinfo
+        except ValueError:
+            pass
+    return int(taken.replace(tzinfo=tz).timestamp())
+
+
+def read_photo_metadata(path: str, default_tz: tzinfo) -> PhotoMetadata:
+    """
+    Координаты GPS и время съёмки из EXIF; читается только заголовок файла, без декодирования снимка.
+    Отсутствующие или некорректные поля остаются None.
+    """
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+            exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return PhotoMetadata()
+
+    metadata = PhotoMetadata()
+    latitude = _dms_to_degrees(gps.get(ExifTags.GPS.GPSLatitude), gps.get(ExifTags.GPS.GPSLatitudeRef))
+    longitude = _dms_to_degrees(gps.get(ExifTags.GPS.GPSLongitude), gps.get(ExifTags.GPS.GPSLongitudeRef))
+    # 0/0 пишут камеры, не получившие спутники
+    if (latitude is not None and longitude is not None and -90 <= latitude <= 90 and -180 <= longitude <= 180
+            and (latitude, longitude) != (0.0, 0.0)):
+        metadata.latitude, metadata.longitude = latitude, longitude
+
+    metadata.taken_at = _parse_exif_time(
+        exif_ifd.get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime),
+        exif_ifd.get(ExifTags.Base.OffsetTimeOriginal),
+        default_tz,
+    )
+    return metadata
+
+
+class WalkTimeIndex:
+    """
+    Индекс пути прогулки по времени: отсортированные метки точек и их координаты в массивах numpy.
+    Положение на момент времени — линейная интерполяция между соседними точками (бинарный поиск),
+    поэтому индекс строится один раз на прогулку и сразу отвечает на запросы для целой пачки фото.
+    Моменты дальше tolerance_seconds от начала или конца прогулки не определяются.
+    """
+
+    def __init__(self, times: Sequence[int], coordinates: Sequence[Sequence[float]], tolerance_seconds: float = 600):
+        order = np.argsort(np.asarray(times, dtype=np.int64), kind="stable")
+        lon_lat = np.asarray(coordinates, dtype=float)[:, :2]
+        self._times = np.asarray(times, dtype=np.int64)[order]
+        self._lons = lon_lat[order, 0]
+        self._lats = lon_lat[order, 1]
+        self.tolerance_seconds = tolerance_seconds
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def locate(self, timestamps: Sequence[int]) -> List[Optional[Tuple[float, float]]]:
+        """(latitude, longitude) на каждый момент timestamps или None, если он вне прогулки."""
+        ts = np.asarray(timestamps, dtype=np.int64)
+        if not len(self._times) or not len(ts):
+            return [None] * len(ts)
+        lats = np.interp(ts, self._times, self._lats)
+        lons = np.interp(ts, self._times, self._lons)
+        inside = (ts >= self._times[0] - self.tolerance_seconds) & (ts <= self._times[-1] + self.tolerance_seconds)
+        return [
+            (float(lat), float(lon)) if ok else None
+            for lat, lon, ok in zip(lats.tolist(), lons.tolist(), inside.tolist())
+        ]
+
+
+def locate_photos(
+    metadata: Sequence[PhotoMetadata],
+    load_timed_path: Callable[[], Optional[Tuple[List[List[float]], List[int]]]],
+    tolerance_seconds: float = 600,
+) -> List[Optional[Tuple[float, float, str]]]:
+    """
+    (latitude, longitude, источник) для каждого фото: "exif" — GPS из EXIF, "walk_path" — положение
+    на пути прогулки в момент съёмки; None, если не удалось ни то, ни другое.
+    Путь со временами загружается через load_timed_path один раз и только если без него не обойтись.
+    """
+    located: List[Optional[Tuple[float, float, str]]] = [None] * len(metadata)
+    by_time = []
+    for i, item in enumerate(metadata):
+        if item.has_location:
+            located[i] = (item.latitude, item.longitude, "exif")
+        elif item.taken_at is not None:
+            by_time.append(i)
+
+    if by_time:
+        timed_path = load_timed_path()
+        if timed_path:
+            coordinates, times = timed_path
+            index = WalkTimeIndex(times, coordinates, tolerance_seconds)
+            for i, position in zip(by_time, index.locate([metadata[i].taken_at for i in by_time])):
+                if position:
+                    located[i] = (position[0], position[1], "walk_path")
+    return located
@@ -0,0 +1,256 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from flask import Flask, current_app
+
+from app.extensions.database import get_db_interface
+from app.utils.image_utils import encode_photo_variants
+from app.utils.photo_storage import photo_path
+
+logger = logging.getLogger(__name__)
+
+# Очередь событий из процессов-обработчиков: (хеш содержимого, событие, данные)
+_progress: Optional[Any] = None
+
+
+def _init_worker(progress) -> None:
+    global _progress
+    _progress = progress
+
+
+def _process_photo(content_hash: str, source_path: str, upload_folder: str, filename: str, quality: int,
+                   profiles: Dict[str, Dict[str, Any]]) -> None:
+    """Выполняется в процессе пула: пишет варианты фото и сообщает о каждом готовом файле."""
+    try:
+        encode_photo_variants(
+            source_path, upload_folder, filename, quality, profiles,
+            on_ready=lambda variant, url: _progress.put((content_hash, "variant", (variant, url))),
+        )
+        _progress.put((content_hash, "done", None))
+    except Exception as e:
+        _progress.put((content_hash, "failed", f"{type(e).__name__}: {e}"))
+
+
+class PhotoPipeline:
+    """
+    Фоновая обработка загруженных фото в пуле процессов: кодирование WebP с method=6 занимает
+    секунды на снимок и в потоке веб-воркера блокировало бы его.
+    Запрос только сохраняет исходник и ставит его в очередь; процесс пула декодирует снимок один раз,
+    пишет миниатюры всех THUMBNAIL_PROFILES и полноразмерный WebP. Каждый готовый вариант сразу
+    записывается отдельным потоком-слушателем родительского процесса, в контексте приложения, во все фото
+    с этим содержимым: задачи идут по хешу, и одинаковые загрузки обрабатываются один раз.
+    Готовые варианты копятся по хешу и на событии done записываются заново во все фото с этим содержимым:
+    фото, загруженное во время обработки, пропустило часть событий variant. Исходник удаляется только тогда,
+    когда на него не ссылается ни одно фото.
+    Пул и слушатель запускаются при первой загрузке, поэтому CLI-команды процессов не порождают.
+    Пул, сломанный аварийным завершением процесса (например, по OOM), пересоздаётся при следующей загрузке.
+    Очередь живёт только в памяти, поэтому фото, оставшиеся в статусе processing после перезапуска,
+    снова ставятся в очередь при первом запросе к приложению.
+    """
+
+    def __init__(self, app: Flask, upload_folder: str, max_workers: int = 2):
+        self._app = app
+        self._upload_folder = upload_folder
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress = None
+        # хеш содержимого -> путь исходника, который удаляется после окончания обработки
+        self._sources: Dict[str, str] = {}
+        # хеш содержимого -> уже готовые варианты (профиль -> URL)
+        self._variants: Dict[str, Dict[str, str]] = {}
+        self._resume_started = False
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # fork из многопоточного веб-воркера может унаследовать чужие захваченные блокировки
+                context = multiprocessing.get_context("spawn")
+                # Очередь своя у каждого пула: процесс, убитый во время записи, мог оставить блокировку старой захваченной
+                self._progress = context.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self._progress,),
+                )
+                threading.Thread(target=self._listen, args=(self._progress,), name="photo-pipeline",
+                                 daemon=True).start()
+            return self._executor
+
+    def _restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is broken:
+                logger.warning("Photo processing pool is broken, starting a new one")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        return self._ensure_started()
+
+    def submit(self, content_hash: str, source_path: str) -> None:
+        """
+        Ставит в очередь обработку сохранённого исходника (путь внутри папки загрузок) для всех фото
+        с содержимым content_hash. Если это содержимое уже обрабатывается, повторно задача не ставится.
+        """
+        with self._lock:
+            if content_hash in self._sources:
+                return
+            self._sources[content_hash] = source_path
+            self._variants[content_hash] = {}
+        args = (
+            _process_photo,
+            content_hash,
+            source_path,
+            self._upload_folder,
+            os.path.relpath(source_path, self._upload_folder).replace(os.sep, "/"),
+            int(self._app.config["PHOTO_QUALITY"]),
+            self._app.config["THUMBNAIL_PROFILES"],
+        )
+        try:
+            executor = self._ensure_started()
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                future = self._restart(executor).submit(*args)
+        except BaseException:
+            # Иначе следующие загрузки этого содержимого сочтут его обрабатываемым и навсегда останутся в processing
+            with self._lock:
+                self._sources.pop(content_hash, None)
+                self._variants.pop(content_hash, None)
+            raise
+        future.add_done_callback(lambda f: self._on_done(content_hash, f))
+
+    def resume_pending(self) -> None:
+        """Ставит в очередь фото, оставшиеся в статусе processing, например после перезапуска приложения."""
+        db_interface = get_db_interface()
+        sources: Dict[str, str] = {}
+        for photo in db_interface.get_photos_by_status("processing"):
+            if not photo.content_hash:
+                logger.warning("Photo id=%s is stuck in processing without a content hash", photo.id)
+                continue
+            sources.setdefault(photo.content_hash, photo_path(self._upload_folder, photo.url))
+        for content_hash, source_path in sources.items():
+            if os.path.exists(source_path):
+                self.submit(content_hash, source_path)
+            else:
+                logger.error("Source of photo content %s is missing: %s", content_hash, source_path)
+                db_interface.update_photos_by_content(content_hash, status="failed")
+        if sources:
+            logger.info("Resumed processing of %s photo contents", len(sources))
+
+    def resume_pending_once(self) -> None:
+        # Вызывается перед каждым запросом; сама работа — один раз и в отдельном потоке, чтобы не задерживать ответ
+        if self._resume_started:
+            return
+        with self._lock:
+            if self._resume_started:
+                return
+            self._resume_started = True
+        threading.Thread(target=self._run_resume, name="photo-pipeline-resume", daemon=True).start()
+
+    def _run_resume(self) -> None:
+        try:
+            with self._app.app_context():
+                self.resume_pending()
+        except Exception:
+            logger.exception("Failed to resume pending photo processing")
+
+    def _on_done(self, content_hash: str, future: Future) -> None:
+        # Ошибки обработки процесс пула сообщает сам; сюда попадает только аварийное завершение процесса.
+        # Очередь сломанного пула может быть заблокирована, поэтому сбой записывается напрямую
+        error = future.exception()
+        if error is not None:
+            self._record(content_hash, "failed", f"{type(error).__name__}: {error}")
+
+    def _listen(self, progress) -> None:
+        while True:
+            content_hash, event, payload = progress.get()
+            self._record(content_hash, event, payload)
+
+    def _record(self, content_hash: str, event: str, payload: Any) -> None:
+        try:
+            with self._app.app_context():
+                self._apply(content_hash, event, payload)
+        except Exception:
+            logger.exception("Failed to record %s for photo content %s", event, content_hash)
+
+    def _variant_fields(self, variants: Dict[str, str]) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {"variants": dict(variants)}
+        if "full" in variants:
+            fields["url"] = variants["full"]
+        default_profile = self._app.config["DEFAULT_THUMBNAIL_PROFILE"]
+        if default_profile in variants:
+            fields["thumbnail_url"] = variants[default_profile]
+        return fields
+
+    def _source_in_use(self, db_interface, content_hash: str, source_path: str) -> bool:
+        # Фото, вставленное уже после записи done, всё ещё ссылается на исходник и ждёт повторной обработки
+        return any(
+            photo.content_hash == content_hash
+            and os.path.abspath(photo_path(self._upload_folder, photo.url)) == os.path.abspath(source_path)
+            for photo in db_interface.get_photos_by_status("processing")
+        )
+
+    def _apply(self, content_hash: str, event: str, payload: Any) -> None:
+        db_interface = get_db_interface()
+        if event == "variant":
+            variant, url = payload
+            with self._lock:
+                if content_hash in self._variants:
+                    self._variants[content_hash][variant] = url
+            if not db_interface.update_photos_by_content(content_hash, **self._variant_fields({variant: url})):
+                # Все фото с этим содержимым удалили, пока оно обрабатывалось: файл больше никому не нужен
+                self._remove_file(photo_path(self._upload_folder, url))
+        elif event == "done":
+            with self._lock:
+                source_path = self._sources.pop(content_hash, None)
+                variants = self._variants.pop(content_hash, {})
+            db_interface.update_photos_by_content(content_hash, status="ready", **self._variant_fields(variants))
+            full_url = variants.get("full")
+            if (source_path and full_url
+                    and os.path.abspath(source_path) != os.path.abspath(photo_path(self._upload_folder, full_url))
+                    and not self._source_in_use(db_interface, content_hash, source_path)):
+                self._remove_file(source_path)
+        elif event == "failed":
+            with self._lock:
+                self._sources.pop(content_hash, None)
+                self._variants.pop(content_hash, None)
+            logger.error("Processing of photo content %s failed: %s", content_hash, payload)
+            existing = db_interface.get_photos_by_content_hashes([content_hash]).get(content_hash)
+            if existing is None:
+                return
+            if existing.status == "ready":
+                # Содержимое уже обработала другая задача (повторная постановка после перезапуска или загрузка,
+                # чей исходник удалили на done): ждущие фото получают её готовые файлы
+                db_interface.update_photos_by_content(
+                    content_hash, url=existing.url, thumbnail_url=existing.thumbnail_url, status="ready",
+                    variants=existing.variants,
+                )
+                return
+            db_interface.update_photos_by_content(content_hash, status="failed")
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            logger.warning("Failed to remove photo file %s", path)
+
+
+def get_photo_pipeline() -> PhotoPipeline:
+    return current_app.extensions["photo_pipeline"]
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["photo_pipeline"] = PhotoPipeline(
+        app,
+        upload_folder=app.config["UPLOAD_FOLDER"],
+        max_workers=app.config["PHOTO_WORKERS"],
+    )
+    if app.config["PHOTO_RESUME_PENDING"]:
+        app.before_request(app.extensions["photo_pipeline"].resume_pending_once)
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from PIL import Image, UnidentifiedImageError
+
+from app.utils.image_utils import PHOTO_URL_PREFIX
+
+CHUNK_SIZE = 1024 * 1024
+# Расширение исходника берётся из распознанного формата, а не из имени файла
+_FORMAT_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "TIFF": "tif", "BMP": "bmp"}
+
+
+@dataclass
+class StoredUpload:
+    content_hash: str     # SHA-256 содержимого
+    filename: str         # путь относительно папки загрузок: ab/cd/<hash>.<ext>
+    path: str             # полный путь к файлу
+    created: bool         # False, если файл с таким содержимым уже лежал в хранилище
+
+    @property
+    def url(self) -> str:
+        return f"{PHOTO_URL_PREFIX}{self.filename}"
+
+
+def content_filename(content_hash: str, extension: str) -> str:
+    """Шардированное имя файла: два уровня каталогов по первым символам хеша, чтобы каталоги не разрастались."""
+    return posixpath.join(content_hash[:2], content_hash[2:4], f"{content_hash}.{extension}")
+
+
+def store_upload(stream: BinaryIO, upload_folder: str) -> StoredUpload:
+    """
+    Сохраняет загрузку в хранилище, адресуемое содержимым: файл потоково пишется во временный,
+    попутно считается SHA-256, затем файл переносится под имя из хеша. Одинаковые загрузки
+    (хоть с разными именами, хоть с разных телефонов) дают один файл; разные никогда не перезаписывают друг друга.
+    ValueError, если файл не распознаётся как изображение.
+    """
+    os.makedirs(upload_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        try:
+            with Image.open(tmp_path) as img:
+                image_format = img.format
+        except (UnidentifiedImageError, OSError):
+            raise ValueError('File is not a supported image')
+
+        content_hash = digest.hexdigest()
+        filename = content_filename(content_hash, _FORMAT_EXTENSIONS.get(image_format, image_format.lower()))
+        path = os.path.join(upload_folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return StoredUpload(content_hash, filename, path, created=False)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return StoredUpload(content_hash, filename, path, created=True)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def photo_filename(url: str) -> str:
+    """
+    Путь файла относительно папки загрузок по его URL. Для старых фото это просто имя файла,
+    для адресуемых содержимым — ab/cd/<имя>; выход за пределы папки загрузок не допускается.
+    """
+    if url.startswith(PHOTO_URL_PREFIX):
+        relative = posixpath.normpath(url[len(PHOTO_URL_PREFIX):])
+        if not relative.startswith(("..", "/")) and relative != ".":
+            return relative
+    return posixpath.basename(url)
+
+
+def photo_path(upload_folder: str, url: str) -> str:
+    return os.path.join(upload_folder, *photo_filename(url).split("/"))
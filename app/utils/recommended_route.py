@@ -1,208 +1,36 @@
 import math
 import random
-from typing import List, Optional
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
 
-from flask import Flask
-from shapely.geometry import Polygon, Point
+import numpy as np
 
-from app.extensions.postgres import PostgresDB
 from app.models.route import Route
-from app.utils.ors_requests import get_zigzag_route
-
-MIN_LON = 37.3687
-MAX_LON = 37.8426
-MIN_LAT = 55.5698
-MAX_LAT = 55.9112
-mkad_coords = [
-    [
-        37.5955903429074,
-        55.90768082203752
-    ],
-    [
-        37.57636318537541,
-        55.91165122503094
-    ],
-    [
-        37.543980604269365,
-        55.90824804735425
-    ],
-    [
-        37.515645845801714,
-        55.9008734710836
-    ],
-    [
-        37.48326326469564,
-        55.88839022437051
-    ],
-    [
-        37.458976328866385,
-        55.88157948779576
-    ],
-    [
-        37.430641570398734,
-        55.87760600621101
-    ],
-    [
-        37.4144502798452,
-        55.87022560424279
-    ],
-    [
-        37.398258989292685,
-        55.86114010676263
-    ],
-    [
-        37.39421116665429,
-        55.85375657515252
-    ],
-    [
-        37.393199210994425,
-        55.844099070422004
-    ],
-    [
-        37.39421116665429,
-        55.83443916585631
-    ],
-    [
-        37.39421116665429,
-        55.823639961590715
-    ],
-    [
-        37.38611552137755,
-        55.80715118428
-    ],
-    [
-        37.37903183176067,
-        55.792362202250644
-    ],
-    [
-        37.3668883638465,
-        55.78382754201948
-    ],
-    [
-        37.36891227516517,
-        55.76390606243129
-    ],
-    [
-        37.37296009780357,
-        55.747961546705
-    ],
-    [
-        37.37498400912227,
-        55.728591584927585
-    ],
-    [
-        37.396235077973984,
-        55.70693142610082
-    ],
-    [
-        37.41951005814343,
-        55.68126570079505
-    ],
-    [
-        37.434689393037104,
-        55.65615402939915
-    ],
-    [
-        37.461000240185086,
-        55.63445370603338
-    ],
-    [
-        37.48225131038075,
-        55.61331288052685
-    ],
-    [
-        37.52953684582522,
-        55.58671792609297
-    ],
-    [
-        37.576374080221996,
-        55.57570978514883
-    ],
-    [
-        37.63000773017882,
-        55.567127715139634
-    ],
-    [
-        37.67756964617848,
-        55.56941645051347
-    ],
-    [
-        37.71501200558177,
-        55.57742597411203
-    ],
-    [
-        37.7859648602703,
-        55.61118796497544
-    ],
-    [
-        37.84425874025703,
-        55.650316328171726
-    ],
-    [
-        37.853350338471785,
-        55.674248372855914
-    ],
-    [
-        37.85702858677104,
-        55.76296472562572
-    ],
-    [
-        37.85278584093675,
-        55.81442269744397
-    ],
-    [
-        37.717958795269396,
-        55.88696239618622
-    ],
-    [
-        37.660984779787384,
-        55.89715869139434
-    ],
-    [
-        37.592442144561005,
-        55.90882106557132
-    ]
-]
-mkad_polygon = Polygon(mkad_coords)
-
-
-def is_inside_mkad(point: list) -> bool:
-    """Проверяет, находится ли точка внутри полигона МКАДа"""
-    return mkad_polygon.contains(Point(point[0], point[1]))
-
-
-def create_grid(cell_size_km: float = 1.0) -> dict:
-    """Создает сетку квадратов 1x1 км внутри МКАД."""
-    cell_size_deg = cell_size_km / 111.32  # 1° ≈ 111.32 км
-
-    lon_steps = int((MAX_LON - MIN_LON) / cell_size_deg)
-    lat_steps = int((MAX_LAT - MIN_LAT) / cell_size_deg)
-    grid = {(x, y): 0
-            for x in range(lon_steps)
-            for y in range(lat_steps)
-            if is_inside_mkad([
-                MIN_LON + (x + 0.5) * cell_size_deg,
-                MIN_LAT + (y + 0.5) * cell_size_deg
-            ])}
+from app.utils.mkad import MAX_LAT, MAX_LON, MIN_LAT, MIN_LON, is_inside_mkad, points_inside_mkad
+from app.utils.routing import Router
+from app.utils.visit_grid import CELL_SIZE_KM, Cell, cell_size_deg, mkad_cells
+
+
+def create_grid(cell_size_km: float = CELL_SIZE_KM) -> dict:
+    """Создает сетку квадратов 1x1 км внутри МКАД (маска клеток считается один раз на процесс)."""
+    size = cell_size_deg(cell_size_km)
 
     return {
-        "cell_size_deg": cell_size_deg,
-        "lon_steps": lon_steps,
-        "lat_steps": lat_steps,
-        "grid": grid
+        "cell_size_km": cell_size_km,
+        "cell_size_deg": size,
+        "lon_steps": int((MAX_LON - MIN_LON) / size),
+        "lat_steps": int((MAX_LAT - MIN_LAT) / size),
+        "grid": dict.fromkeys(mkad_cells(cell_size_km), 0)
     }
 
 
-def update_grid_with_walks(grid_data: dict, walks: list) -> dict:
-    """Обновляет сетку на основе истории прогулок."""
-    cell_size = grid_data["cell_size_deg"]
+def update_grid_with_visits(grid_data: dict, cell_visits: Dict[Cell, int]) -> dict:
+    """Обновляет сетку готовыми счётчиками посещений по клеткам."""
     grid = grid_data["grid"]
-    for walk in walks:
-        for lon, lat in walk.path_geojson['coordinates']:
-            if is_inside_mkad([lon, lat]):
-                x = int((lon - MIN_LON) / cell_size)
-                y = int((lat - MIN_LAT) / cell_size)
-                grid[(x, y)] += 1
+    for cell, visits in cell_visits.items():
+        if cell in grid:
+            grid[cell] += visits
 
     return grid_data
 
@@ -215,52 +43,106 @@ def find_least_visited_cells(grid_data: dict, top_n: int = 10) -> list:
     random.shuffle(items)
     sorted_cells = sorted(items, key=lambda point: point[1])
 
-    least_visited = []
-    for (x, y), _ in sorted_cells:
-        center = [
-            MIN_LON + (x + 0.5) * cell_size,
-            MIN_LAT + (y + 0.5) * cell_size
-        ]
-
-        if is_inside_mkad(center):
-            least_visited.append(center)
-            if len(least_visited) == top_n:
-                break
+    centers = np.array([
+        [MIN_LON + (x + 0.5) * cell_size, MIN_LAT + (y + 0.5) * cell_size]
+        for (x, y), _ in sorted_cells
+    ]).reshape(-1, 2)
+    least_visited = centers[points_inside_mkad(centers)][:top_n].tolist()
 
     while len(least_visited) < top_n:
-        random_point = [
-            random.uniform(MIN_LON, MAX_LON),
-            random.uniform(MIN_LAT, MAX_LAT)
-        ]
-        if is_inside_mkad(random_point):
-            least_visited.append(random_point)
+        random_points = np.column_stack([
+            np.random.uniform(MIN_LON, MAX_LON, top_n),
+            np.random.uniform(MIN_LAT, MAX_LAT, top_n)
+        ])
+        least_visited.extend(random_points[points_inside_mkad(random_points)].tolist())
+
+    return least_visited[:top_n]
+
+
+def build_visit_grid(cell_visits: Dict[Cell, int]) -> dict:
+    """Сетка МКАДа с накопленными посещениями; только читается, поэтому её можно делить между запросами."""
+    return update_grid_with_visits(create_grid(), cell_visits)
+
+
+class VisitGridProvider:
+    """
+    Сетка посещений, которая строится при первом обращении из load_cell_visits (агрегат посещений клеток в БД).
+    Если маршрут от start_point построился, сетка не нужна и в БД за ней не ходим.
+    Загружается один раз, даже если к ней одновременно обращаются несколько потоков пакетной генерации.
+    """
+
+    def __init__(self, load_cell_visits: Callable[[], Dict[Cell, int]]):
+        self._load_cell_visits = load_cell_visits
+        self._grid_data: Optional[dict] = None
+        self._lock = threading.Lock()
 
-    return least_visited
+    def __call__(self) -> dict:
+        if self._grid_data is None:
+            with self._lock:
+                if self._grid_data is None:
+                    self._grid_data = build_visit_grid(self._load_cell_visits())
+        return self._grid_data
 
 
-def get_recommended_route(api_key: str,
+def get_recommended_route(router: Router,
                           time_minutes: int,
-                          walks: list,
+                          visit_grid: Callable[[], dict],
                           angle: int = 60,
                           segments: int = 10,
-                          start_point: Optional[List[float]] = None) -> Optional[Route]:
-    """Главная функция для получения рекомендации."""
+                          start_point: Optional[List[float]] = None,
+                          max_concurrency: int = 4,
+                          novelty_scorer: Optional[Callable[[Route], float]] = None,
+                          novelty_candidates: int = 3) -> Optional[Route]:
+    """
+    Главная функция для получения рекомендации. visit_grid возвращает сетку посещений (см. VisitGridProvider)
+    и вызывается, только если маршрут от start_point не построился или start_point не задан.
+    Кандидаты из наименее посещенных клеток строятся параллельно, не больше max_concurrency одновременно.
+    Без novelty_scorer возвращается первый построенный маршрут, остальные запросы отменяются;
+    с ним строится novelty_candidates маршрутов и выбирается самый новый — меньше всего идущий по пройденным улицам.
+    """
+    wanted = novelty_candidates if novelty_scorer else 1
     if start_point:
-        route_generated = generate_zigzag_route(api_key, start_point, time_minutes, angle, segments)
-        if route_generated:
-            return route_generated
-    grid_data = create_grid()
-    grid_data = update_grid_with_walks(grid_data, walks)
-
-    target_cells = find_least_visited_cells(grid_data)
-
-    for cell in target_cells:
-        # route = generate_route_from_cell(api_key, cell, time_minutes)
-        route_generated = generate_zigzag_route(api_key, cell, time_minutes, angle, segments)
-        if route_generated:
-            return route_generated
-
-    return None
+        candidates = [zigzag_points(start_point, time_minutes, angle, segments) for _ in range(wanted)]
+        routes = _build_routes(router, candidates, max_concurrency, wanted)
+        if routes:
+            return _most_novel(routes, novelty_scorer)
+    target_cells = find_least_visited_cells(visit_grid())
+    candidates = [zigzag_points(cell, time_minutes, angle, segments) for cell in target_cells]
+    routes = _build_routes(router, candidates, max_concurrency, wanted)
+    return _most_novel(routes, novelty_scorer) if routes else None
+
+
+def _most_novel(routes: List[Route], novelty_scorer: Optional[Callable[[Route], float]]) -> Route:
+    if novelty_scorer is None:
+        return routes[0]
+    for route in routes:
+        route.novelty = novelty_scorer(route)
+    return max(routes, key=lambda route: route.novelty)
+
+
+def _build_routes(router: Router, candidates: List[List[List[float]]],
+                  max_concurrency: int, wanted: int = 1) -> List[Route]:
+    """Строит маршруты по кандидатам, пока не наберётся wanted штук или кандидаты не кончатся."""
+    routes: List[Route] = []
+    if max_concurrency <= 1:
+        for points in candidates:
+            route_generated = router.zigzag_route(points)
+            if route_generated:
+                routes.append(route_generated)
+                if len(routes) >= wanted:
+                    break
+        return routes
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="route-candidate")
+    try:
+        pending = {executor.submit(router.zigzag_route, points) for points in candidates}
+        while pending and len(routes) < wanted:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            routes.extend(route for route in (future.result() for future in done) if route)
+        return routes
+    finally:
+        # Ещё не начатые запросы отменяются; уже отправленные дорабатывают в фоне, не задерживая ответ
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def meters_to_degrees(lat, meters):
@@ -272,23 +154,21 @@ def meters_to_degrees(lat, meters):
     return lon_deg, lat_deg
 
 
-def generate_zigzag_route(api_key: str,
-                          start_point: List[float],
-                          time_minutes: int,
-                          angle: int = 60,
-                          segments: int = 5) -> Route:
+def zigzag_points(start_point: List[float],
+                  time_minutes: int,
+                  angle: int = 60,
+                  segments: int = 5) -> List[List[float]]:
     """
-    Генерирует извилистый маршрут с случайными поворотами.
+    Опорные точки извилистого маршрута с случайными поворотами.
 
     Параметры:
-        api_key: API ключ OpenRouteService
         start_point: Начальная точка [lon, lat]
         time_minutes: Желаемое время прогулки
         angle: Максимальный угол поворота (градусы)
         segments: Количество сегментов маршрута
 
     Возвращает:
-        Route объект или None при ошибке
+        Список точек [lon, lat], начиная со start_point
     """
     WALKING_SPEED = 1.11
     total_distance = WALKING_SPEED * time_minutes * 60
@@ -307,7 +187,7 @@ def generate_zigzag_route(api_key: str,
             current_point[1] + lat_deg * math.sin(rad_angle)
         ]
 
-        if not mkad_polygon.contains(Point(next_point)):
+        if not is_inside_mkad(next_point):
             current_angle = (current_angle + 180 + random.uniform(-30, 30)) % 360
             rad_angle = math.radians(current_angle)
             next_point = [
@@ -319,17 +199,5 @@ def generate_zigzag_route(api_key: str,
         current_point = next_point
         current_angle += random.uniform(-angle, angle)
 
-    return get_zigzag_route(api_key, all_points)
-
+    return all_points
 
-if __name__ == '__main__':
-    app = Flask(__name__)
-    with app.app_context():
-        db = PostgresDB()
-        db.init_db()
-        walks_data = db.get_walks()
-        route = get_recommended_route(
-            'api=',
-            30,
-            walks_data)
-        print(route.path_geojson, route.duration / 60, sep='\n')
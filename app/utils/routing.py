@@ -0,0 +1,56 @@
+import abc
+import logging
+from typing import List, Optional
+
+from flask import Flask, current_app
+
+from app.models.route import Route
+
+logger = logging.getLogger(__name__)
+
+
+class Router(abc.ABC):
+    """Построитель пешеходных маршрутов через заданные точки (ORS или локальный граф)."""
+
+    @abc.abstractmethod
+    def zigzag_route(self, coords: List[List[float]]) -> Optional[Route]:
+        """Builds a walking route through the waypoints [[lon, lat], ...]; None if it cannot be built."""
+        pass
+
+
+class FallbackRouter(Router):
+    """Пробует маршрутизаторы по порядку и возвращает первый построенный маршрут."""
+
+    def __init__(self, routers: List[Router]):
+        self.routers = routers
+
+    def zigzag_route(self, coords: List[List[float]]) -> Optional[Route]:
+        for router in self.routers:
+            route = router.zigzag_route(coords)
+            if route:
+                return route
+        return None
+
+
+def get_router() -> Optional[Router]:
+    """Маршрутизатор приложения или None, если ни один бэкенд не настроен."""
+    return current_app.extensions.get("router")
+
+
+def init_app(app: Flask) -> None:
+    """Собирает маршрутизатор из уже инициализированных бэкендов в порядке ROUTING_BACKENDS."""
+    backends = {
+        "ors": app.extensions.get("ors_client"),
+        "offline": app.extensions.get("offline_router"),
+    }
+    routers = []
+    for name in app.config["ROUTING_BACKENDS"]:
+        if name not in backends:
+            logger.warning("Unknown routing backend %r in ROUTING_BACKENDS", name)
+        elif backends[name] is not None:
+            routers.append(backends[name])
+
+    if len(routers) == 1:
+        app.extensions["router"] = routers[0]
+    elif routers:
+        app.extensions["router"] = FallbackRouter(routers)
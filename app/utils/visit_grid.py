@@ -0,0 +1,51 @@
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Tuple
+
+import numpy as np
+
+from app.utils.geometry import geojson_coordinates
+from app.utils.mkad import MAX_LAT, MAX_LON, MIN_LAT, MIN_LON, points_inside_mkad
+
+CELL_SIZE_KM = 1.0
+
+Cell = Tuple[int, int]
+
+
+def cell_size_deg(cell_size_km: float = CELL_SIZE_KM) -> float:
+    return cell_size_km / 111.32  # 1° ≈ 111.32 км
+
+
+@lru_cache(maxsize=None)
+def mkad_cells(cell_size_km: float = CELL_SIZE_KM) -> FrozenSet[Cell]:
+    """Клетки сетки, центр которых лежит внутри МКАДа. Считается один раз на процесс."""
+    size = cell_size_deg(cell_size_km)
+    lon_steps = int((MAX_LON - MIN_LON) / size)
+    lat_steps = int((MAX_LAT - MIN_LAT) / size)
+    xs, ys = np.meshgrid(np.arange(lon_steps), np.arange(lat_steps), indexing="ij")
+    xs, ys = xs.ravel(), ys.ravel()
+    centers = np.column_stack([MIN_LON + (xs + 0.5) * size, MIN_LAT + (ys + 0.5) * size])
+    inside = points_inside_mkad(centers)
+    return frozenset(zip(xs[inside].tolist(), ys[inside].tolist()))
+
+
+def walk_cell_counts(path_geojson: Any, cell_size_km: float = CELL_SIZE_KM) -> Dict[Cell, int]:
+    """
+    Вклад одной прогулки в сетку посещений: сколько точек пути попало в каждую клетку МКАДа.
+    Хранится вместе с прогулкой, чтобы при её изменении или удалении вычесть ровно то, что было добавлено.
+    """
+    coordinates = geojson_coordinates(path_geojson)
+    if not coordinates:
+        return {}
+
+    size = cell_size_deg(cell_size_km)
+    cells = mkad_cells(cell_size_km)
+    lon_lat = np.asarray(coordinates, dtype=float)[:, :2]
+    lon_lat = lon_lat[points_inside_mkad(lon_lat)]
+    # astype усекает к нулю — так же, как int() в поточечной версии
+    cell_ids = ((lon_lat - (MIN_LON, MIN_LAT)) / size).astype(np.int64)
+    unique_cells, counts = np.unique(cell_ids, axis=0, return_counts=True)
+    return {
+        cell: count
+        for cell, count in zip(map(tuple, unique_cells.tolist()), counts.tolist())
+        if cell in cells
+    }
@@ -1,14 +1,23 @@
-import json
-from datetime import datetime, timedelta
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+import hashlib
+import logging
+from operator import itemgetter
 import re
-from typing import List, Optional, Dict, Any
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from app.extensions.database import get_db_interface
-from app.models.route import Route
+from app.models.import_job import ImportJob
+from app.models.route import TimelineWalk
 from app.models.walk import Walk
 from app.utils import distance
+from app.utils.json_stream import iter_array_items
 from app.utils.time_conversion import unix_time_to_readable
 
+logger = logging.getLogger(__name__)
+
 
 def parse_coordinates(coord_str: str) -> Optional[List[float]]:
     numbers = re.findall(r'[-+]?\d*\.\d+|\d+', coord_str)
@@ -18,7 +27,42 @@ def parse_coordinates(coord_str: str) -> Optional[List[float]]:
     return [float(numbers[1]), float(numbers[0])]
 
 
+# Фиксированные форматы Timeline: 2025-06-22T18:42:24[.000](Z|+03:00|+0300)
+_TIMELINE_TIME_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?$'
+)
+
+
+@lru_cache(maxsize=None)
+def _offset_to_tzinfo(offset: str) -> tzinfo:
+    if offset == 'Z':
+        return timezone.utc
+    sign = -1 if offset[0] == '-' else 1
+    hours, minutes = int(offset[1:3]), int(offset[-2:])
+    if not hours and not minutes:
+        return timezone.utc
+    return timezone(sign * timedelta(hours=hours, minutes=minutes))
+
+
 def parse_time(time_str: str) -> datetime:
+    """
+    Быстрый разбор времени точек Timeline одним регулярным выражением.
+    Объекты tzinfo кешируются по строке смещения, доли секунды отбрасываются (как и раньше).
+    Всё, что не подходит под фиксированный формат, разбирается прежним снисходительным парсером.
+    """
+    if isinstance(time_str, str):
+        match = _TIMELINE_TIME_RE.match(time_str)
+        if match:
+            year, month, day, hour, minute, second, offset = match.groups()
+            try:
+                return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                tzinfo=_offset_to_tzinfo(offset) if offset else None)
+            except ValueError:
+                pass
+    return _parse_time_lenient(time_str)
+
+
+def _parse_time_lenient(time_str: str) -> datetime:
     """
     Парсит строку времени ISO 8601 с учетом смещения UTC.
     Обрабатывает различные форматы миллисекунд и смещений (+HH:MM, +HHMM, Z).
@@ -65,92 +109,275 @@ def parse_time(time_str: str) -> datetime:
     return dt_object
 
 
-def process_google_location_history(segments: List[Dict[str, Any]]) -> List[Route]:
-    walk_routes: List[Route] = []
+def _is_walking_segment(segment: Dict[str, Any]) -> bool:
+    return 'activity' in segment and segment['activity'].get('topCandidate', {}).get('type') == 'WALKING'
+
+
+def _parse_timeline_points(segment: Dict[str, Any]) -> List[Tuple[datetime, List[float]]]:
+    points: List[Tuple[datetime, List[float]]] = []
+    for location in segment.get('timelinePath', []):
+        coords = parse_coordinates(location.get('point', ''))
+        try:
+            point_time_dt = parse_time(location.get('time', ''))
+            if coords:
+                points.append((point_time_dt, coords))
+        except (ValueError, TypeError) as e:
+            print(f"Ошибка парсинга времени для точки маршрута: {e}. Пропускаем точку: {location.get('time')}")
+    return points
+
+
+def match_points_to_intervals(point_times: List[datetime],
+                              intervals: Iterable[Tuple[datetime, datetime]]) -> List[Tuple[int, int]]:
+    """
+    Для каждого интервала [start, end] возвращает срез (lo, hi) отсортированного списка point_times,
+    в который попадают точки с start <= time <= end. Границы включительные, интервалы могут
+    перекрываться или касаться друг друга: каждый ищется бинарным поиском независимо.
+    """
+    return [(bisect_left(point_times, start_dt), bisect_right(point_times, end_dt)) for start_dt, end_dt in intervals]
+
+
+def process_google_location_history(segments: List[Dict[str, Any]]) -> List[TimelineWalk]:
+    walk_routes: List[TimelineWalk] = []
 
     # Соберем все точки из ВСЕХ сегментов timelinePath в один массив
     print("Собираем все точки из всех сегментов timelinePath...")
-    all_global_timeline_points: List[Dict[str, Any]] = []
+    all_global_timeline_points: List[Tuple[datetime, List[float]]] = []
     for segment in segments:
         if 'timelinePath' in segment:
-            for location in segment['timelinePath']:
-                coords = parse_coordinates(location.get('point', ''))
-                try:
-                    point_time_dt = parse_time(location.get('time', ''))
-                    if coords:
-                        all_global_timeline_points.append({
-                            'coords': coords,
-                            'time_dt': point_time_dt
-                        })
-                except (ValueError, TypeError) as e:
-                    print(f"Ошибка парсинга времени для точки маршрута: {e}. Пропускаем точку: {location.get('time')}")
-
-    # Отсортируем все точки по времени
-    all_global_timeline_points.sort(key=lambda x: x['time_dt'])
+            all_global_timeline_points.extend(_parse_timeline_points(segment))
+
+    # Отсортируем все точки по времени (сортировка стабильна, порядок равных по времени точек сохраняется)
+    all_global_timeline_points.sort(key=itemgetter(0))
+    point_times = [point_time_dt for point_time_dt, _ in all_global_timeline_points]
 
     print("Обрабатываем сегменты 'WALKING'...")
+    walking_intervals: List[Tuple[datetime, datetime]] = []
     for segment in segments:
-        if 'activity' in segment and segment['activity'].get('topCandidate', {}).get('type') == 'WALKING':
+        if _is_walking_segment(segment):
             try:
+                walking_intervals.append((parse_time(segment.get('startTime')), parse_time(segment.get('endTime'))))
+            except (ValueError, TypeError) as e:
+                print(
+                    f"Ошибка парсинга времени для сегмента активности: {e}. Пропускаем сегмент: {segment.get('startTime')} - {segment.get('endTime')}")
+
+    # Вместо полного прохода по всем точкам для каждой прогулки ищем границы интервала бинарным поиском
+    for (activity_start_dt, activity_end_dt), (lo, hi) in zip(
+            walking_intervals, match_points_to_intervals(point_times, walking_intervals)):
+        # Добавляем маршрут, если в нем больше одной точки
+        if hi - lo > 1:
+            window = all_global_timeline_points[lo:hi]
+            walk_routes.append(TimelineWalk(int(activity_start_dt.timestamp()), int(activity_end_dt.timestamp()),
+                                            [coords for _, coords in window],
+                                            [int(point_time_dt.timestamp()) for point_time_dt, _ in window]))
 
-                activity_start_dt = parse_time(segment.get('startTime'))
-                activity_end_dt = parse_time(segment.get('endTime'))
+    return walk_routes
 
-                current_walk_path_geojson: List[List[float]] = []
 
-                # Для каждого интервала WALKING активности, выбрать точки из all_global_timeline_points
-                # Проходим по глобальному списку точек, ищем те, что входят в текущий интервал прогулки.
-                # Используем оптимизацию для отсортированного списка (two-pointer approach)
-                # (Хотя полный проход для каждого интервала тоже сработает, если интервалы могут сильно перекрываться)
+def _build_timeline_walk(start_dt: datetime, end_dt: datetime,
+                         points: List[Tuple[datetime, List[float]]]) -> Optional[TimelineWalk]:
+    # Стабильная сортировка отфильтрованных точек даёт тот же порядок, что и сортировка глобального списка
+    window = sorted((p for p in points if start_dt <= p[0] <= end_dt), key=itemgetter(0))
+    if len(window) > 1:
+        return TimelineWalk(int(start_dt.timestamp()), int(end_dt.timestamp()), [coords for _, coords in window],
+                            [int(point_time_dt.timestamp()) for point_time_dt, _ in window])
+    return None
 
-                # Для упрощения и надежности, пройдемся по всем точкам для каждого интервала WALKING.
-                # Это гарантирует, что мы не пропустим точки, даже если интервалы walking очень плотно расположены.
-                for point_data in all_global_timeline_points:
-                    if activity_start_dt <= point_data['time_dt'] <= activity_end_dt:
-                        current_walk_path_geojson.append(point_data['coords'])
 
-                # Добавляем маршрут, если в нем больше одной точки
-                if len(current_walk_path_geojson) > 1:
-                    walk_routes.append(Route(int(activity_start_dt.timestamp()), int(activity_end_dt.timestamp()), current_walk_path_geojson))
+class TimelineOrderError(ValueError):
+    """Сегменты выгрузки идут не по возрастанию startTime, и потоковый разбор потерял бы точки."""
 
-            except (ValueError, TypeError) as e:
+
+def iter_google_location_history(segments: Iterable[Dict[str, Any]]) -> Iterator[TimelineWalk]:
+    """
+    Потоковый аналог process_google_location_history.
+    Сегменты Timeline идут в хронологическом порядке по startTime, поэтому startTime последнего
+    прочитанного сегмента служит «водяным знаком»: ни одна будущая точка не может оказаться раньше него.
+    Прогулки, закончившиеся до водяного знака, отдаются сразу (в порядке следования в файле),
+    а точки, которые уже не попадут ни в одну прогулку, выбрасываются из буфера.
+    Сегмент, начавшийся раньше водяного знака, нарушает это допущение: тогда бросается TimelineOrderError,
+    а не молча теряются его точки (уже отданные прогулки могли их не учесть).
+    """
+    pending: Deque[Tuple[datetime, datetime]] = deque()
+    points: List[Tuple[datetime, List[float]]] = []
+    prune_at = 1024
+    watermark: Optional[datetime] = None
+
+    for segment in segments:
+        try:
+            segment_start_dt = parse_time(segment.get('startTime'))
+        except (ValueError, TypeError, AttributeError):
+            segment_start_dt = None
+        if segment_start_dt is not None:
+            if watermark is not None and segment_start_dt < watermark:
+                raise TimelineOrderError(
+                    f"Timeline segment starting at {segment.get('startTime')} follows one starting at {watermark.isoformat()}"
+                )
+            watermark = segment_start_dt
+
+        if 'timelinePath' in segment:
+            points.extend(_parse_timeline_points(segment))
+
+        if _is_walking_segment(segment):
+            try:
+                pending.append((parse_time(segment.get('startTime')), parse_time(segment.get('endTime'))))
+            except (ValueError, TypeError, AttributeError) as e:
                 print(
                     f"Ошибка парсинга времени для сегмента активности: {e}. Пропускаем сегмент: {segment.get('startTime')} - {segment.get('endTime')}")
 
-    return walk_routes
+        if watermark is None:
+            continue
+
+        while pending and pending[0][1] < watermark:
+            start_dt, end_dt = pending.popleft()
+            walk = _build_timeline_walk(start_dt, end_dt, points)
+            if walk:
+                yield walk
+
+        if len(points) >= prune_at:
+            threshold = min([start_dt for start_dt, _ in pending] + [watermark])
+            points = [p for p in points if p[0] >= threshold]
+            prune_at = max(1024, 2 * len(points))
+
+    while pending:
+        start_dt, end_dt = pending.popleft()
+        walk = _build_timeline_walk(start_dt, end_dt, points)
+        if walk:
+            yield walk
+
+
+# Сколько прогулок копим перед одной пачечной вставкой: память ограничена, а транзакций в сотни раз меньше
+IMPORT_BATCH_SIZE = 500
+
+
+def timeline_walk_fingerprint(route: TimelineWalk) -> str:
+    """Естественный ключ импортированной прогулки: границы по времени плюс хеш пути."""
+    digest = hashlib.sha256(f"{route.start_time}:{route.end_time}:".encode())
+    for lon, lat in route.path_geojson:
+        digest.update(f"{lon!r},{lat!r};".encode())
+    return digest.hexdigest()
 
 
-def import_walks_from_json(file) -> int:
-    data = json.load(file)
-    segments = data.get('semanticSegments', [])
-    walk_routes: List[Route] = process_google_location_history(segments)
+def _segments_since(segments: Iterable[Dict[str, Any]], since_dt: datetime) -> Iterator[Dict[str, Any]]:
+    """Пропускает сегменты, закончившиеся раньше since_dt: их точки не попадут ни в одну новую прогулку."""
+    for segment in segments:
+        try:
+            if parse_time(segment.get('endTime')) < since_dt:
+                continue
+        except (ValueError, TypeError, AttributeError):
+            pass
+        yield segment
+
+
+def _timeline_walks_to_models(routes: List[TimelineWalk]) -> List[Walk]:
+    lengths = distance.polyline_lengths_km([route.path_geojson for route in routes])
+    return [
+        Walk(id=-1, name=f"Прогулка из Google Timeline ({unix_time_to_readable(route.start_time)})",
+             date=route.start_time,
+             description="Импортировано из Google Location History",
+             path_geojson={
+                 "type": "LineString",
+                 "coordinates": route.path_geojson
+             },
+             distance=walk_distance,
+             co2_saved=walk_distance * 0.15,
+             fingerprint=timeline_walk_fingerprint(route),
+             path_times=route.point_times)
+        for route, walk_distance in zip(routes, lengths)
+    ]
+
+
+def _insert_new_walks(db_interface, routes: List[TimelineWalk], seen: Set[str]) -> Dict[str, int]:
+    """Вставляет ещё не сохранённые прогулки и возвращает отпечатки вставленных с их id."""
+    walks = _timeline_walks_to_models(routes)
+    existing = db_interface.get_existing_fingerprints(walk.fingerprint for walk in walks)
+    new_walks = []
+    for walk in walks:
+        if walk.fingerprint in existing or walk.fingerprint in seen:
+            continue
+        seen.add(walk.fingerprint)
+        new_walks.append(walk)
+    # Между проверкой и вставкой тот же файл мог сохранить параллельный импорт: такие прогулки вернутся как None
+    return {
+        walk.fingerprint: walk_id
+        for walk, walk_id in zip(new_walks, db_interface.add_walks_bulk(new_walks))
+        if walk_id is not None
+    }
+
+
+def _count_segments(segments: Iterable[Dict[str, Any]], job: ImportJob) -> Iterator[Dict[str, Any]]:
+    for segment in segments:
+        job.parsed_segments += 1
+        yield segment
+
+
+def import_walks_from_json(file, incremental: bool = False, job: Optional[ImportJob] = None,
+                           on_progress: Optional[Callable[[ImportJob], None]] = None) -> int:
+    """
+    Импортирует прогулки из выгрузки Google Timeline и возвращает число добавленных.
+    Уже сохранённые прогулки (по отпечатку) пропускаются, поэтому повторная загрузка идемпотентна.
+    В режиме incremental обрабатываются только сегменты не старше последней импортированной прогулки.
+    Если передан job, в нём обновляются счётчики, а on_progress вызывается после каждой пачки.
+    Выгрузка разбирается потоково; если сегменты в ней не по порядку, файл перечитывается целиком
+    в память, а прогулки, вставленные потоковым проходом с неполными точками, удаляются.
+    """
+    db_interface = get_db_interface()
+    since = db_interface.get_latest_imported_walk_date() if incremental else None
+
+    def read_segments() -> Iterator[Dict[str, Any]]:
+        segments = iter_array_items(file, 'semanticSegments')
+        if job is not None:
+            segments = _count_segments(segments, job)
+        if since is not None:
+            segments = _segments_since(segments, datetime.fromtimestamp(since, timezone.utc))
+        return segments
 
-    for route_coords in walk_routes:
-        # Create a GeoJSON LineString object
-        geojson_path = {
-            "type": "LineString",
-            "coordinates": route_coords.path_geojson
-        }
+    imported: Dict[str, int] = {}
+    seen: Set[str] = set()
 
-        walk_distance = 0
-        for i in range(len(route_coords.path_geojson) - 1):
-            p1_lon, p1_lat = route_coords.path_geojson[i]
-            p2_lon, p2_lat = route_coords.path_geojson[i + 1]
-            walk_distance += distance.calculate_distance_km(p1_lat, p1_lon, p2_lat, p2_lon)
+    def flush(batch: List[TimelineWalk]) -> None:
+        inserted = _insert_new_walks(db_interface, batch, seen)
+        imported.update(inserted)
+        if job is not None:
+            job.walks_found += len(batch)
+            job.walks_inserted += len(inserted)
+            if on_progress:
+                on_progress(job)
 
-        co2_saved = walk_distance * 0.15
+    def insert_routes(routes: Iterable[TimelineWalk]) -> None:
+        batch: List[TimelineWalk] = []
+        for route in routes:
+            if since is not None and route.start_time < since:
+                continue
+            batch.append(route)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
 
-        db_interface = get_db_interface()
-        walk_id = db_interface.add_walk(Walk(id=-1, name=f"Прогулка из Google Timeline ({unix_time_to_readable(route_coords.start_time)})",
-                                   date=route_coords.start_time,
-                                   description="Импортировано из Google Location History",
-                                   path_geojson=geojson_path,
-                                   distance=walk_distance,
-                                   co2_saved=co2_saved))
+    try:
+        insert_routes(iter_google_location_history(read_segments()))
+    except TimelineOrderError as e:
+        if not file.seekable():
+            raise
+        logger.warning("%s; re-reading the export in memory", e)
+        file.seek(0)
+        if job is not None:
+            job.parsed_segments = 0
+            job.walks_found = 0
+        routes = process_google_location_history(list(read_segments()))
+        expected = {timeline_walk_fingerprint(route) for route in routes}
+        stale = {fingerprint: walk_id for fingerprint, walk_id in imported.items() if fingerprint not in expected}
+        insert_routes(routes)
+        for fingerprint, walk_id in stale.items():
+            db_interface.delete_walk(walk_id)
+            del imported[fingerprint]
+        if job is not None:
+            job.walks_inserted = len(imported)
 
-    return len(walk_routes)
+    return len(imported)
 
 
 if __name__ == '__main__':
     print(int(parse_time('2025-06-22T18:42:24.000+03:00').timestamp()))
-    print(parse_time('2025-06-22T18:42:24.000+03:00'))
\ No newline at end of file
+    print(parse_time('2025-06-22T18:42:24.000+03:00'))
@@ -0,0 +1,87 @@
+"""
+Бенчмарк сопоставления точек Timeline с интервалами прогулок: прежний полный проход по всем точкам
+для каждой прогулки (O(прогулки × точки)) против match_points_to_intervals (два бинарных поиска на прогулку)
+на синтетической выгрузке размера реальной — около 10k прогулок и 2M точек.
+
+Полный прежний проход на таком объёме занимает часы, поэтому он меряется на случайной выборке
+интервалов (--linear-sample) и пересчитывается на все; --linear-sample 0 прогоняет его целиком.
+Результаты выборки сверяются с match_points_to_intervals.
+
+Запуск из корня репозитория:
+    python -m benchmarks.interval_matching [--walks 10000 --points 2000000 --linear-sample 20]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from app.utils.walk_processing import match_points_to_intervals
+
+POINT_STEP = timedelta(seconds=30)
+
+
+def make_timeline(walks: int, points: int, seed: int = 2) -> Tuple[List[datetime], List[Tuple[datetime, datetime]]]:
+    """Отсортированные времена точек и интервалы прогулок, в том числе перекрывающиеся и касающиеся."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone(timedelta(hours=3)))
+    point_times = [start + i * POINT_STEP for i in range(points)]
+    intervals = []
+    for _ in range(walks):
+        # Границы попадают точно на время точки: проверяется включительность обоих концов
+        walk_start = start + rng.randrange(points) * POINT_STEP
+        intervals.append((walk_start, walk_start + rng.randint(10, 90) * timedelta(minutes=1)))
+        if rng.random() < 0.1:
+            # Следующая прогулка начинается в момент окончания предыдущей
+            intervals.append((intervals[-1][1], intervals[-1][1] + timedelta(minutes=rng.randint(5, 30))))
+    del intervals[walks:]
+    return point_times, intervals
+
+
+def linear_scan(point_times: List[datetime], intervals: List[Tuple[datetime, datetime]]) -> List[List[int]]:
+    """Прежняя реализация: проход по всем точкам для каждого интервала WALKING."""
+    matched = []
+    for activity_start_dt, activity_end_dt in intervals:
+        indices = []
+        for i, point_time_dt in enumerate(point_times):
+            if activity_start_dt <= point_time_dt <= activity_end_dt:
+                indices.append(i)
+        matched.append(indices)
+    return matched
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--walks", type=int, default=10000, help="интервалов WALKING")
+    parser.add_argument("--points", type=int, default=2000000, help="точек timelinePath")
+    parser.add_argument("--linear-sample", type=int, default=20,
+                        help="интервалов для прежнего прохода (0 — все)")
+    args = parser.parse_args()
+
+    point_times, intervals = make_timeline(args.walks, args.points)
+    print(f"{len(intervals)} walking intervals, {len(point_times)} points")
+
+    started = time.perf_counter()
+    slices = match_points_to_intervals(point_times, intervals)
+    bisect_seconds = time.perf_counter() - started
+    matched_points = sum(hi - lo for lo, hi in slices)
+
+    sample = list(range(len(intervals)))
+    if 0 < args.linear_sample < len(intervals):
+        sample = sorted(random.Random(3).sample(sample, args.linear_sample))
+    started = time.perf_counter()
+    linear = linear_scan(point_times, [intervals[i] for i in sample])
+    linear_seconds = (time.perf_counter() - started) * len(intervals) / len(sample)
+    for i, indices in zip(sample, linear):
+        lo, hi = slices[i]
+        if indices != list(range(lo, hi)):
+            raise SystemExit(f"interval {i}: bisect slice {lo}:{hi} differs from the linear scan")
+
+    estimate = "" if len(sample) == len(intervals) else f" (estimated from {len(sample)} intervals)"
+    print(f"linear scan  {linear_seconds:10.2f} s{estimate}")
+    print(f"bisect       {bisect_seconds:10.4f} s   {matched_points} matched points")
+    print(f"speedup      {linear_seconds / bisect_seconds:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Микробенчмарк разбора времени точек Timeline: быстрый путь parse_time против прежнего
+снисходительного парсера (_parse_time_lenient) на типичных форматах выгрузки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.parse_time [--number 200000]
+"""
+import argparse
+import timeit
+
+from app.utils.walk_processing import _parse_time_lenient, parse_time
+
+SAMPLES = [
+    "2025-06-22T18:42:24.000+03:00",
+    "2025-06-22T18:42:24+03:00",
+    "2025-06-22T15:42:24.000Z",
+    "2025-06-22T18:42:24.000+0300",
+    "2025-06-22T10:42:24.000-05:00",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="вызовов на каждый формат")
+    args = parser.parse_args()
+
+    print(f"{'format':<32}{'lenient, us':>14}{'fast path, us':>16}{'speedup':>10}")
+    for sample in SAMPLES:
+        timings = []
+        for func in (_parse_time_lenient, parse_time):
+            try:
+                func(sample)
+            except ValueError:
+                timings.append(None)
+                continue
+            seconds = min(timeit.repeat(lambda: func(sample), number=args.number, repeat=3))
+            timings.append(seconds / args.number * 1e6)
+        lenient, fast = timings
+        lenient_text = f"{lenient:14.2f}" if lenient is not None else f"{'error':>14}"
+        speedup = f"{lenient / fast:9.1f}x" if lenient is not None else f"{'-':>10}"
+        print(f"{sample:<32}{lenient_text}{fast:16.2f}{speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Бенчмарк импорта Timeline на большой синтетической выгрузке: прежняя схема (json.load всего файла
+и process_google_location_history по списку сегментов) против потокового разбора
+(iter_array_items и iter_google_location_history). Каждый замер идёт в отдельном процессе,
+чтобы пиковая память одного способа не влияла на другой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.streaming_import [--segments 50000 --raw-signals 50000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.utils.json_stream import iter_array_items
+from app.utils.walk_processing import iter_google_location_history, process_google_location_history
+
+
+def _time(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.000+03:00')
+
+
+def write_export(path: str, segments: int, raw_signals: int, seed: int = 1) -> None:
+    """Пишет выгрузку по одному сегменту, не держа её в памяти целиком."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone(timedelta(hours=3)))
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write('{"semanticSegments": [')
+        for i in range(segments):
+            points = [
+                {"point": f"{55 + rng.random():.7f}°, {37 + rng.random():.7f}°",
+                 "time": _time(start + timedelta(minutes=m))}
+                for m in range(0, 40, 2)
+            ]
+            items = [{"startTime": _time(start), "endTime": _time(start + timedelta(minutes=40)),
+                      "timelinePath": points}]
+            if rng.random() < 0.7:
+                items.insert(0, {"startTime": _time(start), "endTime": _time(start + timedelta(minutes=30)),
+                                 "activity": {"topCandidate": {"type": "WALKING", "probability": 0.9}}})
+            fp.write((',' if i else '') + ','.join(json.dumps(item, ensure_ascii=False) for item in items))
+            start += timedelta(minutes=rng.choice([20, 35, 90]))
+        # Сырые сигналы занимают большую часть реальной выгрузки, но импорту не нужны
+        fp.write('], "rawSignals": [')
+        for i in range(raw_signals):
+            signal = {"position": {"LatLng": f"{55 + rng.random():.7f}°, {37 + rng.random():.7f}°",
+                                   "accuracyMeters": rng.randint(3, 50), "timestamp": _time(start)}}
+            fp.write((',' if i else '') + json.dumps(signal, ensure_ascii=False))
+        fp.write('], "userLocationProfile": {"frequentPlaces": []}}')
+
+
+def load_whole(path: str) -> int:
+    with open(path, 'rb') as fp:
+        data = json.load(fp)
+    return len(process_google_location_history(data.get('semanticSegments', [])))
+
+
+def stream(path: str) -> int:
+    with open(path, 'rb') as fp:
+        return sum(1 for _ in iter_google_location_history(iter_array_items(fp, 'semanticSegments')))
+
+
+def _run(name: str, path: str, trace: bool):
+    func = {'json.load': load_whole, 'streaming': stream}[name]
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    walks = func(path)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace else None
+    return walks, seconds, peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(name: str, path: str, trace: bool):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_run, name, path, trace).result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=50000, help="путей timelinePath в выгрузке")
+    parser.add_argument("--raw-signals", type=int, default=50000, help="записей rawSignals в выгрузке")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'Timeline.json')
+        write_export(path, args.segments, args.raw_signals)
+        print(f"export {os.path.getsize(path) / 2 ** 20:.1f} MiB, {args.segments} paths, "
+              f"{args.raw_signals} raw signals")
+        print(f"{'method':<12}{'walks':>8}{'time, s':>10}{'traced peak, MiB':>19}{'max RSS, MiB':>15}")
+        results = {}
+        for name in ('json.load', 'streaming'):
+            # Время меряем без tracemalloc: он заметно замедляет аллокации
+            walks, seconds, _, rss = measure(name, path, trace=False)
+            _, _, peak, _ = measure(name, path, trace=True)
+            results[name] = walks
+            print(f"{name:<12}{walks:>8}{seconds:>10.2f}{peak / 2 ** 20:>19.1f}{rss / 1024:>15.1f}")
+        if len(set(results.values())) != 1:
+            raise SystemExit(f"walk counts differ: {results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк миниатюр: прежняя схема (каждый профиль заново открывает и декодирует снимок)
+против write_thumbnails (одно декодирование и каскад от большего профиля к меньшему),
+а также полный encode_photo_variants, который выполняет процесс PhotoPipeline.
+
+Запуск из корня репозитория:
+    python -m benchmarks.thumbnails [--width 4000 --height 3000 --repeat 5 --formats JPEG,WEBP]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.utils.image_utils import (
+    _normalize_for_web, _open_for_web, _save_thumbnail, _thumbnail_filename, encode_photo_variants,
+    write_thumbnails,
+)
+from config import Config
+
+
+def make_source(folder: str, width: int, height: int, fmt: str) -> str:
+    # Градиенты с шумом: сжимаются и декодируются похоже на фотографию, в отличие от чистого шума
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([(x / 16) % 256, (y / 12) % 256, ((x + y) / 28) % 256], axis=-1)
+    pixels += np.random.default_rng(0).random((height, width, 3)) * 30
+    path = os.path.join(folder, f"source.{fmt.lower()}")
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(path, fmt, quality=90)
+    return path
+
+
+def per_profile_thumbnails(source_path: str, folder: str, filename: str, profiles) -> None:
+    """Прежняя схема: на каждый профиль — своё открытие, декодирование и уменьшение с полного размера."""
+    for config_photo in profiles.values():
+        img = _normalize_for_web(Image.open(source_path))
+        img.thumbnail(config_photo["size"], Image.Resampling.LANCZOS, reducing_gap=None)
+        _save_thumbnail(img, os.path.join(folder, _thumbnail_filename(filename, config_photo)), config_photo)
+
+
+def single_decode_thumbnails(source_path: str, folder: str, filename: str, profiles) -> None:
+    write_thumbnails(_open_for_web(source_path), folder, filename, profiles)
+
+
+def full_variants(source_path: str, folder: str, filename: str, profiles) -> None:
+    encode_photo_variants(source_path, folder, filename, Config.PHOTO_QUALITY, profiles)
+
+
+def measure(func, repeat: int, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--formats", default="JPEG,WEBP", help="форматы исходника через запятую")
+    args = parser.parse_args()
+
+    profiles = Config.THUMBNAIL_PROFILES
+    print(f"{args.width}x{args.height}, profiles: {', '.join(profiles)}, median of {args.repeat}")
+    with tempfile.TemporaryDirectory() as folder:
+        for fmt in args.formats.split(","):
+            source_path = make_source(folder, args.width, args.height, fmt.strip().upper())
+            filename = "photo.webp"
+            before = measure(per_profile_thumbnails, args.repeat, source_path, folder, filename, profiles)
+            after = measure(single_decode_thumbnails, args.repeat, source_path, folder, filename, profiles)
+            variants = measure(full_variants, args.repeat, source_path, folder, filename, profiles)
+            print(f"{fmt:>5}  thumbnails per profile {before:7.3f} s   single decode {after:7.3f} s"
+                  f"   ({before / after:4.1f}x)   all variants incl. full WebP {variants:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
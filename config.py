@@ -5,6 +5,9 @@ BASE_DIR = Path(__file__).parent
 ENV_PATH = BASE_DIR / ".env"
 INSTANCE_DIR = BASE_DIR / "instance"
 UPLOAD_FOLDER = str(BASE_DIR / "app" / "static" / "uploads" / "photos")
+IMPORT_FOLDER = str(INSTANCE_DIR / "imports")
+ORS_CACHE_PATH = str(INSTANCE_DIR / "ors_cache.sqlite3")
+OFFLINE_ROUTING_GRAPH = str(INSTANCE_DIR / "pedestrian_graph.npz")
 
 
 def _env_bool(name: str, default: bool = False) -> bool:
@@ -30,6 +33,11 @@ class Config:
 
     UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", UPLOAD_FOLDER)
 
+    IMPORT_FOLDER = os.getenv("IMPORT_FOLDER", IMPORT_FOLDER)
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "1"))
+    # Через сколько секунд без изменений удаляются файлы статуса задач импорта и брошенные загрузки
+    IMPORT_JOB_TTL_SECONDS = float(os.getenv("IMPORT_JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+
     ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 
@@ -39,6 +47,15 @@ class Config:
 
     PHOTO_FORMAT = "WEBP"
     PHOTO_QUALITY = 82
+    PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+    # Снова ставить в очередь фото, оставшиеся в processing после перезапуска (при первом запросе к приложению)
+    PHOTO_RESUME_PENDING = _env_bool("PHOTO_RESUME_PENDING", True)
+    PHOTO_BATCH_MAX_SIZE = int(os.getenv("PHOTO_BATCH_MAX_SIZE", "100"))
+    PHOTO_BATCH_CONCURRENCY = int(os.getenv("PHOTO_BATCH_CONCURRENCY", "4"))
+    # Часовой пояс времени съёмки в EXIF, если камера не записала смещение
+    PHOTO_TIMEZONE = os.getenv("PHOTO_TIMEZONE", "Europe/Moscow")
+    # Насколько раньше начала или позже конца прогулки снимок ещё привязывается к её пути
+    PHOTO_TIME_TOLERANCE_SECONDS = int(os.getenv("PHOTO_TIME_TOLERANCE_SECONDS", "600"))
 
     THUMBNAIL_PROFILES = {
         "micro": {
@@ -72,3 +89,29 @@ class Config:
     }
     DEFAULT_THUMBNAIL_PROFILE = "small"
     ORS_API_KEY = os.getenv("ORS_API_KEY")
+    ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+    ORS_CONNECT_TIMEOUT = float(os.getenv("ORS_CONNECT_TIMEOUT", "3.05"))
+    ORS_READ_TIMEOUT = float(os.getenv("ORS_READ_TIMEOUT", "15"))
+    ORS_MAX_RETRIES = int(os.getenv("ORS_MAX_RETRIES", "3"))
+    ORS_POOL_SIZE = int(os.getenv("ORS_POOL_SIZE", "10"))
+    ORS_CIRCUIT_FAILURES = int(os.getenv("ORS_CIRCUIT_FAILURES", "5"))
+    ORS_CIRCUIT_RESET_SECONDS = float(os.getenv("ORS_CIRCUIT_RESET_SECONDS", "30"))
+    # Пустой ORS_CACHE_PATH отключает кэш ответов ORS
+    ORS_CACHE_PATH = os.getenv("ORS_CACHE_PATH", ORS_CACHE_PATH)
+    ORS_CACHE_TTL_SECONDS = float(os.getenv("ORS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    ORS_CACHE_MAX_BYTES = int(os.getenv("ORS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ORS_CACHE_PRECISION = int(os.getenv("ORS_CACHE_PRECISION", "4"))
+    # Локальный пешеходный граф (flask build-routing-graph <выгрузка OSM>); без файла офлайн-маршрутизация выключена
+    OFFLINE_ROUTING_GRAPH = os.getenv("OFFLINE_ROUTING_GRAPH", OFFLINE_ROUTING_GRAPH)
+    # Порядок бэкендов маршрутизации: следующий используется, если предыдущий не построил маршрут
+    ROUTING_BACKENDS = [name.strip() for name in os.getenv("ROUTING_BACKENDS", "ors,offline").split(",") if name.strip()]
+    # Сколько кандидатов рекомендованного маршрута запрашивать у ORS одновременно (1 — по очереди)
+    ROUTE_CANDIDATE_CONCURRENCY = int(os.getenv("ROUTE_CANDIDATE_CONCURRENCY", "4"))
+    # Сколько построенных кандидатов сравнивать по новизне, возвращая самый новый (1 — брать первый построенный,
+    # без оценки). Каждый кандидат — отдельный запрос к ORS на каждый /api/generate_route и на каждый маршрут
+    # пакета, так что по умолчанию маршрут стоит 3 запроса вместо 1; при небольшой дневной квоте ключа ORS уменьшите
+    ROUTE_NOVELTY_CANDIDATES = int(os.getenv("ROUTE_NOVELTY_CANDIDATES", "3"))
+    # Пакетная генерация (/api/generate_routes): размер пакета и число маршрутов, строящихся одновременно.
+    # Кандидаты маршрута в пакете строятся по очереди, так что ROUTE_BATCH_CONCURRENCY ограничивает и запросы к ORS
+    ROUTE_BATCH_MAX_SIZE = int(os.getenv("ROUTE_BATCH_MAX_SIZE", "20"))
+    ROUTE_BATCH_CONCURRENCY = int(os.getenv("ROUTE_BATCH_CONCURRENCY", "4"))
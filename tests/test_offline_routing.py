@@ -0,0 +1,166 @@
+import gzip
+import heapq
+import math
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.utils.distance import haversine_km
+from app.utils.offline_routing import (
+    MAX_SNAP_DISTANCE_M, WALKING_SPEED_MPS, OfflineRouter, PedestrianGraph, build_graph_from_osm,
+)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "pedestrian.osm")
+
+# Координаты узлов выгрузки по их OSM id
+NODES = {
+    1: (37.6000, 55.7500),
+    2: (37.6010, 55.7500),
+    3: (37.6020, 55.7500),
+    4: (37.6000, 55.7510),
+    5: (37.6010, 55.7520),
+    6: (37.6020, 55.7510),
+}
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return build_graph_from_osm(FIXTURE)
+
+
+def node(graph, osm_id):
+    lon, lat = NODES[osm_id]
+    (index,) = np.flatnonzero((graph.lon == lon) & (graph.lat == lat))
+    return int(index)
+
+
+def meters(*osm_ids):
+    return sum(
+        haversine_km(*NODES[a], *NODES[b]) * 1000
+        for a, b in zip(osm_ids, osm_ids[1:])
+    )
+
+
+def neighbours(graph, index):
+    return set(graph.indices[graph.indptr[index]:graph.indptr[index + 1]].tolist())
+
+
+def dijkstra(graph, source, target):
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, current = heapq.heappop(heap)
+        if current == target:
+            return cost
+        if cost > best[current]:
+            continue
+        for k in range(graph.indptr[current], graph.indptr[current + 1]):
+            neighbour, candidate = int(graph.indices[k]), cost + float(graph.lengths[k])
+            if candidate < best.get(neighbour, math.inf):
+                best[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+    return None
+
+
+def test_build_keeps_only_walkable_connected_ways(graph):
+    assert graph.node_count == len(NODES)
+    assert sorted(zip(graph.lon.tolist(), graph.lat.tolist())) == sorted(NODES.values())
+    # motorway и footway с foot=no не дают рёбер, ребро к узлу за границей выгрузки отброшено
+    assert neighbours(graph, node(graph, 2)) == {node(graph, 1), node(graph, 3)}
+    assert neighbours(graph, node(graph, 6)) == {node(graph, 5), node(graph, 3)}
+    # CSR хранит каждое из 6 рёбер в обе стороны
+    assert len(graph.indices) == 12
+
+
+def test_build_reads_gzip(graph, tmp_path):
+    path = tmp_path / "pedestrian.osm.gz"
+    with open(FIXTURE, "rb") as src, gzip.open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    assert build_graph_from_osm(str(path)).node_count == graph.node_count
+
+
+def test_build_rejects_extract_without_walkable_ways(tmp_path):
+    path = tmp_path / "empty.osm"
+    path.write_text('<osm><node id="1" lat="55.75" lon="37.6"/></osm>')
+    with pytest.raises(ValueError):
+        build_graph_from_osm(str(path))
+
+
+def test_shortest_path(graph):
+    path, length = graph.shortest_path(node(graph, 4), node(graph, 3))
+    assert path == [node(graph, osm_id) for osm_id in (4, 1, 2, 3)]
+    assert length == pytest.approx(meters(4, 1, 2, 3), rel=1e-4)
+
+
+def test_shortest_path_to_itself(graph):
+    assert graph.shortest_path(node(graph, 5), node(graph, 5)) == ([node(graph, 5)], 0.0)
+
+
+def test_astar_matches_dijkstra_on_random_grid():
+    rng = np.random.default_rng(7)
+    size = 15
+    ix, iy = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+    lon = 37.6 + ix.ravel() * 0.001 + rng.uniform(-0.0003, 0.0003, size * size)
+    lat = 55.75 + iy.ravel() * 0.0007 + rng.uniform(-0.0002, 0.0002, size * size)
+    ids = np.arange(size * size).reshape(size, size)
+    u = np.concatenate([ids[:-1, :].ravel(), ids[:, :-1].ravel()])
+    v = np.concatenate([ids[1:, :].ravel(), ids[:, 1:].ravel()])
+    # Часть рёбер выбрасываем, чтобы кратчайшие пути петляли
+    keep = rng.random(len(u)) > 0.25
+    grid = PedestrianGraph.from_edges(lon, lat, u[keep], v[keep])
+
+    for source, target in rng.integers(0, size * size, size=(40, 2)).tolist():
+        expected = dijkstra(grid, source, target)
+        result = grid.shortest_path(source, target)
+        if expected is None:
+            assert result is None
+        else:
+            assert result[1] == pytest.approx(expected, rel=1e-9)
+
+
+def test_no_path_between_components():
+    lon = np.array([37.600, 37.601, 37.610, 37.611])
+    lat = np.array([55.750, 55.750, 55.750, 55.750])
+    split = PedestrianGraph.from_edges(lon, lat, np.array([0, 2]), np.array([1, 3]))
+    assert split.shortest_path(0, 1) is not None
+    assert split.shortest_path(0, 3) is None
+
+
+def test_nearest_node(graph):
+    lon, lat = NODES[2]
+    assert graph.nearest_node(lon + 0.0001, lat - 0.0001) == node(graph, 2)
+    assert graph.nearest_node(*NODES[5]) == node(graph, 5)
+
+
+def test_nearest_node_rejects_far_points(graph):
+    # Изолированная дорожка не попала в граф, а до остальных узлов дальше MAX_SNAP_DISTANCE_M
+    assert graph.nearest_node(37.6100, 55.7600) is None
+    lon, lat = NODES[3]
+    beyond = MAX_SNAP_DISTANCE_M / 1000 / 111.2 * 1.1
+    assert graph.nearest_node(lon, lat - beyond) is None
+    assert graph.nearest_node(lon, lat - beyond / 2) == node(graph, 3)
+
+
+def test_graph_save_and_load(graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    graph.save(path)
+    loaded = PedestrianGraph.load(path)
+    assert np.array_equal(loaded.indptr, graph.indptr)
+    assert np.array_equal(loaded.indices, graph.indices)
+    assert loaded.shortest_path(node(graph, 4), node(graph, 3)) == graph.shortest_path(node(graph, 4), node(graph, 3))
+
+
+def test_offline_router(graph, tmp_path):
+    path = str(tmp_path / "graph.npz")
+    graph.save(path)
+    router = OfflineRouter(path)
+
+    route = router.zigzag_route([list(NODES[4]), list(NODES[3]), list(NODES[5])])
+    assert route.path_geojson[0] == list(NODES[4])
+    assert route.path_geojson[-1] == list(NODES[5])
+    assert route.distance == pytest.approx(meters(4, 1, 2, 3) + meters(3, 6, 5), rel=1e-4)
+    assert route.duration == pytest.approx(route.distance / WALKING_SPEED_MPS)
+
+    assert router.zigzag_route([list(NODES[4]), [37.6100, 55.7600]]) is None
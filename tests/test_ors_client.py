@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.utils.ors_cache import ORSCache
+from app.utils.ors_requests import CircuitBreaker, ORSClient
+
+START = [37.6173, 55.7558]
+END = [37.6205, 55.7539]
+
+ROUTE_RESPONSE = {
+    "features": [{
+        "geometry": {"coordinates": [START, END]},
+        "properties": {"segments": [{"duration": 300.0, "distance": 400.0}]},
+    }]
+}
+
+
+class StubORS:
+    """
+    Заглушка ORS на локальном порту: отвечает по очереди из сценария (код ответа или "hang" —
+    зависнуть дольше таймаута чтения клиента), а когда сценарий кончился — успешным маршрутом.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.requests = []
+        self.hang_seconds = 1.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                stub.requests.append((self.command, self.path))
+                action = stub.script.pop(0) if stub.script else 200
+                if action == "hang":
+                    time.sleep(stub.hang_seconds)
+                    action = 200
+                body = json.dumps(ROUTE_RESPONSE if action == 200 else {"error": action}).encode()
+                try:
+                    self.send_response(action)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # клиент уже ушёл по таймауту
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._respond()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def ors():
+    stub = StubORS()
+    yield stub
+    stub.close()
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("max_retries", 3)
+    kwargs.setdefault("read_timeout", 0.3)
+    return ORSClient("test-key", base_url=stub.url, connect_timeout=1.0, sleep=lambda delay: None, **kwargs)
+
+
+def test_route_parses_response(ors):
+    route = make_client(ors).route(START, END)
+    assert route.duration == 300.0
+    assert route.distance == 400.0
+    assert route.path_geojson == [START, END]
+    assert ors.requests == [("GET", "/v2/directions/foot-walking?start=37.6173%2C55.7558&end=37.6205%2C55.7539")]
+
+
+def test_retries_5xx_until_success(ors):
+    ors.script = [503, 502]
+    client = make_client(ors)
+    assert client.route(START, END) is not None
+    assert len(ors.requests) == 3
+    assert client.breaker.allow()
+
+
+def test_retries_timeout(ors):
+    ors.script = ["hang"]
+    route = make_client(ors, read_timeout=0.2).zigzag_route([START, END])
+    assert route is not None
+    assert len(ors.requests) == 2
+
+
+def test_gives_up_after_max_retries(ors):
+    ors.script = [500] * 10
+    assert make_client(ors, max_retries=2).route(START, END) is None
+    assert len(ors.requests) == 3
+
+
+def test_does_not_retry_client_errors(ors):
+    ors.script = [400]
+    client = make_client(ors, breaker=CircuitBreaker(failure_threshold=1))
+    assert client.route(START, END) is None
+    assert len(ors.requests) == 1
+    # ORS ответил, значит он доступен: 4xx не размыкает цепь
+    assert client.breaker.allow()
+
+
+def test_circuit_opens_and_recovers_after_half_open_trial(ors):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    client = make_client(ors, max_retries=0, breaker=breaker)
+    ors.script = [503, 503]
+
+    assert client.route(START, END) is None
+    assert client.route(START, END) is None
+    assert len(ors.requests) == 2
+
+    # Цепь разомкнута: запросы в ORS не уходят
+    assert client.route(START, END) is None
+    assert len(ors.requests) == 2
+
+    # После reset_timeout пропускается один пробный запрос; его успех замыкает цепь
+    clock.now += 31
+    assert client.route(START, END) is not None
+    assert len(ors.requests) == 3
+    assert client.route(START, END) is not None
+    assert len(ors.requests) == 4
+
+
+def test_failed_half_open_trial_reopens_circuit(ors):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    client = make_client(ors, max_retries=0, breaker=breaker)
+    ors.script = [503, 503]
+
+    assert client.route(START, END) is None
+    clock.now += 31
+    assert client.route(START, END) is None
+    assert len(ors.requests) == 2
+
+    clock.now += 10
+    assert client.route(START, END) is None
+    assert len(ors.requests) == 2
+    clock.now += 21
+    assert client.route(START, END) is not None
+    assert len(ors.requests) == 3
+
+
+def test_half_open_allows_single_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 31
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_cache_serves_repeated_and_nearby_requests(ors, tmp_path):
+    cache = ORSCache(str(tmp_path / "ors.sqlite3"), precision=4)
+    client = make_client(ors, cache=cache)
+
+    first = client.route(START, END)
+    # Смещение меньше точности ключа (4 знака ≈ 10 м) попадает в ту же запись
+    second = client.route([START[0] + 0.00001, START[1]], END)
+    assert (first.distance, first.path_geojson) == (second.distance, second.path_geojson)
+    assert len(ors.requests) == 1
+
+    client.route([START[0] + 0.001, START[1]], END)
+    assert len(ors.requests) == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+def test_cache_does_not_store_failures(ors, tmp_path):
+    cache = ORSCache(str(tmp_path / "ors.sqlite3"))
+    client = make_client(ors, max_retries=0, cache=cache)
+    ors.script = [503]
+
+    assert client.route(START, END) is None
+    assert client.route(START, END) is not None
+    assert client.route(START, END) is not None
+    assert len(ors.requests) == 2
+
+
+def test_cache_expires_entries(tmp_path):
+    cache = ORSCache(str(tmp_path / "ors.sqlite3"), ttl_seconds=0.05)
+    key = cache.key("GET /route", [START, END])
+    cache.put(key, ROUTE_RESPONSE)
+    assert cache.get(key) == ROUTE_RESPONSE
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    entry_size = len(zlib.compress(json.dumps(ROUTE_RESPONSE, separators=(",", ":")).encode("utf-8")))
+    cache = ORSCache(str(tmp_path / "ors.sqlite3"), max_bytes=2 * entry_size)
+    keys = [cache.key("GET /route", [[START[0] + i, START[1]], END]) for i in range(3)]
+    cache.put(keys[0], ROUTE_RESPONSE)
+    time.sleep(0.01)
+    cache.put(keys[1], ROUTE_RESPONSE)
+    time.sleep(0.01)
+    # Обращение освежает первую запись, поэтому вытесняется вторая
+    assert cache.get(keys[0]) == ROUTE_RESPONSE
+    time.sleep(0.01)
+    cache.put(keys[2], ROUTE_RESPONSE)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == ROUTE_RESPONSE
+    assert cache.get(keys[2]) == ROUTE_RESPONSE
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,86 @@
+import pytest
+
+from app.models.route import Route
+from app.utils.heatmap import HEATMAP_MAX_ZOOM, encode_tile, tile_count_deltas
+from app.utils.novelty import NoveltyScorer
+from app.utils.recommended_route import get_recommended_route
+
+START = [37.6000, 55.7500]
+# Улица, по которой уже гуляли, и параллельная ей в ~550 м севернее
+WALKED = [[37.6000 + i * 0.001, 55.7500] for i in range(11)]
+NEW = [[37.6000 + i * 0.001, 55.7550] for i in range(11)]
+HALF = WALKED[:6] + [[37.6050, 55.7500 + i * 0.0005] for i in range(1, 11)]
+
+
+def route(path):
+    return Route(duration=600.0, distance=700.0, path_geojson=path, link="")
+
+
+class FakeRouter:
+    """Отдаёт заранее заданные маршруты по кругу и считает запросы."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.calls = 0
+
+    def zigzag_route(self, points):
+        path = self.paths[self.calls % len(self.paths)]
+        self.calls += 1
+        return route(path)
+
+
+def no_grid():
+    raise AssertionError("visit grid must not be loaded when a route from start_point is built")
+
+
+@pytest.fixture
+def scorer():
+    tiles = {
+        (x, y): encode_tile(counts)
+        for (z, x, y), counts in tile_count_deltas(added=[{"type": "LineString", "coordinates": WALKED}]).items()
+        if z == HEATMAP_MAX_ZOOM
+    }
+    return NoveltyScorer(lambda keys: {key: tiles[key] for key in keys if key in tiles})
+
+
+def test_novelty_scorer_measures_overlap_with_history(scorer):
+    assert scorer(route(WALKED)) == pytest.approx(0.0)
+    assert scorer(route(NEW)) == pytest.approx(1.0)
+    assert 0.3 < scorer(route(HALF)) < 0.7
+
+
+def test_most_novel_of_several_candidates(scorer):
+    router = FakeRouter([WALKED, HALF, NEW])
+    result = get_recommended_route(router, 30, no_grid, start_point=START, max_concurrency=1,
+                                   novelty_scorer=scorer, novelty_candidates=3)
+    assert router.calls == 3
+    assert result.path_geojson == NEW
+    assert result.novelty == pytest.approx(1.0)
+
+
+def test_concurrent_candidates_are_scored(scorer):
+    router = FakeRouter([WALKED, NEW])
+    result = get_recommended_route(router, 30, no_grid, start_point=START, max_concurrency=4,
+                                   novelty_scorer=scorer, novelty_candidates=2)
+    assert result.path_geojson == NEW
+
+
+def test_without_scorer_first_route_is_returned():
+    router = FakeRouter([WALKED, NEW])
+    result = get_recommended_route(router, 30, no_grid, start_point=START, max_concurrency=1)
+    assert router.calls == 1
+    assert result.path_geojson == WALKED
+    assert result.novelty is None
+
+
+def test_scorer_caches_tiles():
+    loads = []
+
+    def load_tiles(keys):
+        loads.append(list(keys))
+        return {}
+
+    novelty_scorer = NoveltyScorer(load_tiles)
+    assert novelty_scorer(route(WALKED)) == 1.0
+    novelty_scorer(route(WALKED))
+    assert len(loads) == 1 and loads[0]
@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils.walk_processing import (
+    TimelineOrderError, _parse_time_lenient, iter_google_location_history, match_points_to_intervals, parse_time,
+    process_google_location_history,
+)
+
+
+def _time(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.000+03:00')
+
+
+def make_segments(count: int, seed: int = 1):
+    """Синтетическая выгрузка: прогулки и пути с точками, которые перекрываются с соседними сегментами."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=3)))
+    segments = []
+    for _ in range(count):
+        points = [
+            {"point": f"{55 + rng.random():.6f}°, {37 + rng.random():.6f}°", "time": _time(start + timedelta(minutes=m))}
+            for m in range(0, 40, 3)
+        ]
+        if rng.random() < 0.7:
+            segments.append({"startTime": _time(start), "endTime": _time(start + timedelta(minutes=30)),
+                             "activity": {"topCandidate": {"type": "WALKING"}}})
+        segments.append({"startTime": _time(start), "endTime": _time(start + timedelta(minutes=40)),
+                         "timelinePath": points})
+        start += timedelta(minutes=rng.choice([20, 35, 90]))
+    return segments
+
+
+def test_streaming_matches_in_memory():
+    segments = make_segments(3000)
+    streamed = sorted(iter_google_location_history(iter(segments)), key=lambda walk: walk.start_time)
+    assert streamed == process_google_location_history(segments)
+
+
+def test_streaming_rejects_out_of_order_segments():
+    segments = make_segments(50)
+    segments.insert(80, segments.pop(10))
+    with pytest.raises(TimelineOrderError):
+        list(iter_google_location_history(iter(segments)))
+
+
+def _random_time_string(rng: random.Random) -> str:
+    """Время в одном из форматов Timeline, иногда с недопустимыми полями."""
+    date = (f"{rng.randint(1970, 2100):04d}-{rng.randint(1, 13):02d}-{rng.randint(1, 31):02d}"
+            f"T{rng.randint(0, 24):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}")
+    fraction = rng.choice(["", ".0", ".000", ".123456"])
+    hours, minutes = rng.randint(0, 14), rng.choice([0, 30, 45])
+    offset = rng.choice([
+        "", "Z", f"+{hours:02d}:{minutes:02d}", f"-{hours:02d}:{minutes:02d}", f"+{hours:02d}{minutes:02d}",
+        f"-{hours:02d}{minutes:02d}",
+    ])
+    return date + fraction + offset
+
+
+def _outcome(parser, value):
+    try:
+        result = parser(value)
+    except ValueError:
+        return "error"
+    return result, result.utcoffset()
+
+
+def test_parse_time_fast_path_matches_lenient_parser():
+    rng = random.Random(3)
+    for _ in range(20000):
+        value = _random_time_string(rng)
+        expected = _outcome(_parse_time_lenient, value)
+        # Единственное намеренное расширение: доли секунды перед Z прежний парсер не принимал
+        if expected == "error" and "." in value and value.endswith("Z"):
+            continue
+        assert _outcome(parse_time, value) == expected, value
+
+
+def test_parse_time_keeps_lenient_fallback():
+    assert parse_time("2025-06-22T18:42:24") == datetime(2025, 6, 22, 18, 42, 24)
+    with pytest.raises(ValueError):
+        parse_time("22.06.2025 18:42")
+
+
+def test_bisect_matching_equals_linear_scan():
+    rng = random.Random(5)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for _ in range(300):
+        point_times = sorted(base + timedelta(minutes=rng.randint(0, 500)) for _ in range(rng.randint(0, 60)))
+        intervals = []
+        for _ in range(rng.randint(0, 20)):
+            start = base + timedelta(minutes=rng.randint(-20, 520))
+            # Пустые, вырожденные, перекрывающиеся и касающиеся интервалы
+            intervals.append((start, start + timedelta(minutes=rng.randint(-5, 120))))
+
+        for (start, end), (lo, hi) in zip(intervals, match_points_to_intervals(point_times, intervals)):
+            linear = [i for i, point_time in enumerate(point_times) if start <= point_time <= end]
+            assert list(range(lo, hi)) == linear